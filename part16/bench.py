@@ -0,0 +1,1287 @@
+###############################################################################
+#  Benchmarks for the Simple Pascal Interpreter, Part 16.                     #
+#                                                                             #
+#  Every benchmark runs on a generated program, e.g.                          #
+#                                                                             #
+#    $ python bench.py memory --procedures 5000                               #
+#                                                                             #
+###############################################################################
+import argparse
+import gc
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from calc16 import (
+    AST,
+    ActivationRecord,
+    AlgebraicSimplifier,
+    ArrayTypeSymbol,
+    BatchInterpreter,
+    BuiltinTypeSymbol,
+    ClosureInterpreter,
+    CompactInterpreter,
+    INTEGER_TYPE,
+    Index,
+    Interpreter,
+    Lexer,
+    OutputBuffer,
+    Parser,
+    ProcedureInliner,
+    PyCodeInterpreter,
+    RegisterInterpreter,
+    SemanticAnalyzer,
+    StreamingParser,
+    TokenType,
+    VMInterpreter,
+    optimize,
+)
+
+
+def generate_procedures_program(procedures):
+    """Return the text of a program with many small sibling procedures."""
+    lines = [
+        'PROGRAM Generated;',
+        'VAR',
+        '   number, a, b : INTEGER;',
+        '   y            : REAL;',
+        '',
+    ]
+    for i in range(procedures):
+        lines.extend([
+            f'PROCEDURE P{i}(c : INTEGER; d : REAL);',
+            'VAR',
+            '   x, z : INTEGER;',
+            '   w    : REAL;',
+            'BEGIN',
+            f'   x := c * {i % 7 + 2} + number;',
+            '   z := x DIV 3 - (c + 1) * 2;',
+            '   w := d / 2 + z * 1.5 - y',
+            'END;',
+            '',
+        ])
+    lines.extend([
+        'BEGIN',
+        '   number := 2;',
+        '   a := number;',
+        '   b := 10 * a + 10 * number DIV 4;',
+        '   y := 20 / 7 + 3.14;',
+    ])
+    for i in range(0, procedures, max(procedures // 10, 1)):
+        lines.append(f'   P{i}(a + {i}, y);')
+    lines.append('   a := a + b')
+    lines.append('END.')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_calls_program(statements):
+    """Return the text of a program whose main block is made of
+    procedure calls, half of them to a procedure that calls a nested
+    procedure twice, which calls a procedure of the program block.
+
+    The program makes statements // 2 * 6 + statements % 2 calls.
+    """
+    lines = [
+        'PROGRAM Calls;',
+        'VAR',
+        '   total, count : INTEGER;',
+        '',
+        'PROCEDURE Leaf(a : INTEGER; b : INTEGER);',
+        'VAR',
+        '   t : INTEGER;',
+        'BEGIN',
+        '   t := a * b + total;',
+        '   total := t DIV 7',
+        'END;',
+        '',
+        'PROCEDURE Outer(n : INTEGER);',
+        'VAR',
+        '   k : INTEGER;',
+        '',
+        '   PROCEDURE Inner(m : INTEGER);',
+        '   BEGIN',
+        '      k := k + m * n;',
+        '      Leaf(k, m)',
+        '   END;',
+        '',
+        'BEGIN',
+        '   k := n;',
+        '   Inner(1);',
+        '   Inner(2);',
+        '   count := count + k DIV 3',
+        'END;',
+        '',
+        'BEGIN',
+        '   total := 1;',
+        '   count := 0;',
+    ]
+    for i in range(statements):
+        if i % 2:
+            lines.append(f'   Outer({i});')
+        else:
+            lines.append(f'   Leaf({i}, {i % 10});')
+    lines.append('   count := count + 1')
+    lines.append('END.')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_declarations_program(declarations):
+    """Return the text of a program with many variable declarations."""
+    lines = ['PROGRAM Generated;', 'VAR']
+    for i in range(declarations):
+        lines.append(f'   v{i} : {"INTEGER" if i % 2 else "REAL"};')
+    lines.extend(['BEGIN', '   v1 := 1', 'END.'])
+    return '\n'.join(lines) + '\n'
+
+
+def generate_arithmetic_program(statements, seed=0, identities=False,
+                                inputs=()):
+    """Return the text of a program made of arithmetic assignments.
+
+    Every INTEGER expression is divided by a constant large enough to
+    keep the values from growing without bound, every REAL expression
+    likewise. With identities, the expressions also have terms like
+    v * 1, v + 0 or - -v that AlgebraicSimplifier rewrites. The
+    variables named in inputs (i0 to i7, r0 to r3) are not initialised,
+    their values are given when the program runs.
+    """
+    rng = random.Random(seed)
+    int_vars = [f'i{n}' for n in range(8)]
+    real_vars = [f'r{n}' for n in range(4)]
+
+    def int_term():
+        v, w = rng.choice(int_vars), rng.choice(int_vars)
+        k = rng.randint(2, 9)
+        terms = (
+            v, f'{v} * {k}', f'({v} + {k})', f'-{v}', f'({v} - {w})',
+            f'{v} DIV {k}', f'{v} * {w} DIV ({k} * 97)',
+        )
+        if identities:
+            terms += (
+                f'{v} * 1', f'({v} + 0)', f'- -{v}', f'{w} * 0',
+                f'{v} * {2 ** (k - 1)}', f'{v} DIV {2 ** k}', f'+{v} DIV 1',
+            )
+        return rng.choice(terms)
+
+    def real_term():
+        v, r = rng.choice(int_vars), rng.choice(real_vars)
+        terms = (
+            r, f'{r} * 0.5', f'{v} / {rng.randint(2, 9)}',
+            f'({r} - {v})', f'-{r}', f'{r} * {r} / 100.0',
+        )
+        if identities:
+            terms += (f'{r} * 1', f'({r} - 0)', f'- -{r}', f'({r} + 0)')
+        return rng.choice(terms)
+
+    def expr(term, divisor):
+        terms = [term() for _ in range(rng.randint(2, 4))]
+        text = terms[0]
+        for t in terms[1:]:
+            text += rng.choice((' + ', ' - ')) + t
+        return f'({text}) {divisor}'
+
+    lines = [
+        'PROGRAM Arithmetic;',
+        'VAR',
+        '   {} : INTEGER;'.format(', '.join(int_vars)),
+        '   {} : REAL;'.format(', '.join(real_vars)),
+        'BEGIN',
+    ]
+    body = [
+        f'   {v} := {n * 7 + 3}' for n, v in enumerate(int_vars)
+        if v not in inputs
+    ]
+    body += [
+        f'   {r} := {n}.5' for n, r in enumerate(real_vars)
+        if r not in inputs
+    ]
+    for _ in range(statements):
+        if rng.random() < 0.75:
+            body.append('   {} := {}'.format(
+                rng.choice(int_vars), expr(int_term, 'DIV 37')
+            ))
+        else:
+            body.append('   {} := {}'.format(
+                rng.choice(real_vars), expr(real_term, '/ 3.5')
+            ))
+    lines.append(';\n'.join(body))
+    lines.append('END.')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_operator_program(statements, op):
+    """Return the text of a program of REAL assignments whose
+    expressions apply op five times, e.g. 'x := a / b / c / d / a / b'.
+    The operands are never assigned, so the values stay bounded."""
+    operands = ['a', 'b', 'c', 'd']
+    lines = [
+        'PROGRAM Operators;',
+        'VAR',
+        '   a, b, c, d, x : REAL;',
+        'BEGIN',
+    ]
+    body = [f'   {v} := {n}.5' for n, v in enumerate(operands, 1)]
+    for n in range(statements):
+        terms = [operands[(n + k) % 4] for k in range(6)]
+        body.append('   x := {}'.format(f' {op} '.join(terms)))
+    lines.append(';\n'.join(body))
+    lines.append('END.')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_loop_program(iterations, unrolled=False):
+    """Return the text of a program whose main block runs a FOR loop of
+    three assignments, or, unrolled, the equivalent straight-line
+    program: every iteration an assignment of the control variable
+    followed by a copy of the body."""
+    body = [
+        '      a := (a * 3 + i) DIV 7 + b',
+        '      b := (b + i * 5) DIV 3 - a DIV 11',
+        '      x := x * 0.5 + i / 4',
+    ]
+    lines = [
+        'PROGRAM Loop;',
+        'VAR',
+        '   i, a, b : INTEGER;',
+        '   x       : REAL;',
+        'BEGIN',
+        '   a := 1;',
+        '   b := 2;',
+        '   x := 0.5;',
+    ]
+    if unrolled:
+        statements = []
+        for i in range(1, iterations + 1):
+            statements.append(f'   i := {i}')
+            statements.extend(body)
+        lines.append(';\n'.join(statements))
+    else:
+        lines.append(f'   FOR i := 1 TO {iterations} DO')
+        lines.append('   BEGIN')
+        lines.append(';\n'.join(body))
+        lines.append('   END')
+    lines.append('END.')
+    return '\n'.join(lines) + '\n'
+
+
+def generate_branch_program(limit):
+    """Return the text of a program counting the primes below limit by
+    trial division: nested WHILE loops, the inner one with an AND in its
+    condition and an IF in its body."""
+    return f"""\
+PROGRAM Primes;
+VAR
+   n, d, primes, composite : INTEGER;
+BEGIN
+   primes := 0;
+   n := 2;
+   WHILE n < {limit} DO
+   BEGIN
+      composite := 0;
+      d := 2;
+      WHILE (composite = 0) AND (d * d <= n) DO
+      BEGIN
+         IF n - n DIV d * d = 0 THEN composite := 1;
+         d := d + 1
+      END;
+      IF composite = 0 THEN primes := primes + 1;
+      n := n + 1
+   END
+END.
+"""
+
+
+def generate_sieve_program(limit):
+    """Return the text of a program counting the primes up to limit with
+    the sieve of Eratosthenes over an ARRAY[2..limit]: the FOR loops
+    index it with their control variable, the WHILE loop with a
+    variable of its own."""
+    return f"""\
+PROGRAM Sieve;
+VAR
+   flags            : ARRAY[2..{limit}] OF INTEGER;
+   n, m, primes     : INTEGER;
+BEGIN
+   FOR n := 2 TO {limit} DO flags[n] := 1;
+   FOR n := 2 TO {limit} DO
+      IF (flags[n] = 1) AND (n * n <= {limit}) THEN
+      BEGIN
+         m := n * n;
+         WHILE m <= {limit} DO
+         BEGIN
+            flags[m] := 0;
+            m := m + n
+         END
+      END;
+   primes := 0;
+   FOR n := 2 TO {limit} DO primes := primes + flags[n]
+END.
+"""
+
+
+# the statement of each builtin and of the loop doing the same
+_INTRINSICS = {
+    'SUM': ('s := SUM(a)', 't := t + b[i]'),
+    'DOT': ('s := DOT(a, c)', 't := t + b[i] * c[i]'),
+    'FILL': ('FILL(a, 7)', 'b[i] := 7'),
+    'COPY': ('COPY(a, c)', 'b[i] := c[i]'),
+    'SCALE': ('SCALE(a, -1)', 'b[i] := b[i] * -1'),
+}
+
+
+def generate_intrinsic_program(builtin, size, part='both', repeat=1):
+    """Return the text of a program running a builtin over the array a
+    and, with part 'both', the equivalent FOR loop over the array b, of
+    size INTEGERs each. Part 'builtin' or 'loop' runs only one of them
+    and part 'none' only fills the arrays. Each runs repeat times. The
+    builtin's result goes to s and the loop's to t."""
+    call, loop = _INTRINSICS[builtin]
+    statements = []
+    if part in ('both', 'builtin'):
+        statements.append(call)
+    if part in ('both', 'loop'):
+        statements.append(f'FOR i := 1 TO {size} DO {loop}')
+    if repeat > 1:
+        statements = [
+            f'FOR r := 1 TO {repeat} DO {statement}'
+            for statement in statements
+        ]
+    statements = ''.join(';\n   ' + statement for statement in statements)
+    return f"""\
+PROGRAM Intrinsic;
+VAR
+   a, b, c : ARRAY[1..{size}] OF INTEGER;
+   i, r, s, t : INTEGER;
+BEGIN
+   FOR i := 1 TO {size} DO
+   BEGIN
+      a[i] := i;
+      b[i] := i;
+      c[i] := {size} - i
+   END;
+   s := 0;
+   t := 0{statements}
+END.
+"""
+
+
+def generate_output_program(lines):
+    """Return the text of a program writing lines lines of an INTEGER,
+    a product and a REAL quotient."""
+    return f"""\
+PROGRAM Output;
+VAR
+   i : INTEGER;
+BEGIN
+   FOR i := 1 TO {lines} DO WRITELN(i, i * 3, i / 4)
+END.
+"""
+
+
+class DiscardingSink(object):
+    """A sink that drops what it is given, to time the formatting."""
+    def write(self, text):
+        pass
+
+
+def measure_peak(function, *args):
+    """Return (result, peak traced memory in bytes) of function(*args)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def run_two_pass(text):
+    tree = Parser(Lexer(text)).parse()
+    SemanticAnalyzer().visit(tree)
+    interpreter = Interpreter(tree)
+    interpreter.interpret()
+    return interpreter.GLOBAL_MEMORY
+
+
+def run_streaming(text):
+    program = StreamingParser(Lexer(text)).parse()
+    interpreter = CompactInterpreter(program)
+    interpreter.interpret()
+    return interpreter.GLOBAL_MEMORY
+
+
+def bench_memory(args):
+    print(f'{"procedures":>10} {"two-pass":>12} '
+          f'{"streaming":>12} {"ratio":>7}')
+    for procedures in args.procedures:
+        text = generate_procedures_program(procedures)
+        two_pass_memory, two_pass_peak = measure_peak(run_two_pass, text)
+        streaming_memory, streaming_peak = measure_peak(run_streaming, text)
+        assert two_pass_memory == streaming_memory
+        print('{:>10} {:>10.1f}MB {:>10.1f}MB {:>6.1f}x'.format(
+            procedures,
+            two_pass_peak / 2 ** 20,
+            streaming_peak / 2 ** 20,
+            two_pass_peak / streaming_peak,
+        ))
+
+
+def bench_parallel(args):
+    text = generate_procedures_program(args.procedures)
+    print(f'{args.procedures} procedures')
+    trees = [Parser(Lexer(text)).parse() for _ in args.workers + [0]]
+
+    start = time.perf_counter()
+    SemanticAnalyzer().visit(trees.pop())
+    sequential = time.perf_counter() - start
+    print(f'{"sequential":>12} {sequential:8.3f}s')
+
+    for workers in args.workers:
+        with ProcessPoolExecutor(workers) as executor:
+            # start the workers before the clock does
+            list(executor.map(abs, range(workers)))
+            start = time.perf_counter()
+            SemanticAnalyzer(executor).visit(trees.pop())
+            parallel = time.perf_counter() - start
+        print('{:>10} w {:8.3f}s {:6.2f}x'.format(
+            workers, parallel, sequential / parallel
+        ))
+
+
+def bench_symbols(args):
+    text = generate_declarations_program(args.declarations)
+    tree = Parser(Lexer(text)).parse()
+
+    scopes = []
+    for run in range(1, args.runs + 1):
+        # keep every global scope alive to measure all of it
+        semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.leave_scope = lambda: None
+        gc.collect()
+        tracemalloc.start()
+        semantic_analyzer.visit(tree)
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        scopes.append(semantic_analyzer.current_scope)
+
+        builtin_types = sum(
+            isinstance(obj, BuiltinTypeSymbol) for obj in gc.get_objects()
+        )
+        print(
+            'run {}: {} declarations, symbol table {:.1f}MB '
+            '({:.0f} bytes/declaration), {} builtin type symbols alive'.format(
+                run,
+                args.declarations,
+                retained / 2 ** 20,
+                retained / args.declarations,
+                builtin_types,
+            )
+        )
+
+
+def analyze(text):
+    tree = Parser(Lexer(text)).parse()
+    SemanticAnalyzer().visit(tree)
+    return tree
+
+
+# name -> function(tree) returning an object with interpret() and
+# GLOBAL_MEMORY, the first one is the baseline
+ENGINES = {
+    'tree': Interpreter,
+    'closure': ClosureInterpreter,
+    'pycode': PyCodeInterpreter,
+    'vm': VMInterpreter,
+    'regvm': RegisterInterpreter,
+}
+
+
+def bench_engines(args):
+    text = generate_arithmetic_program(args.statements)
+    tree = analyze(text)
+    if args.optimize:
+        optimize(tree)
+    print(f'{args.statements} statements, {args.runs} runs')
+
+    baseline = None
+    for name in args.engines:
+        start = time.perf_counter()
+        interpreter = ENGINES[name](tree)
+        compile_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            interpreter.interpret()
+        run_time = (time.perf_counter() - start) / args.runs
+
+        memory = dict(interpreter.GLOBAL_MEMORY)
+        if baseline is None:
+            baseline = memory, run_time
+        assert memory == baseline[0], f'{name} computed different results'
+        print('{:>10}: compile {:8.4f}s  run {:8.4f}s  {:6.2f}x'.format(
+            name, compile_time, run_time, baseline[1] / run_time
+        ))
+
+
+def count_nodes(node):
+    """Return the number of AST nodes in a tree."""
+    count = 1
+    for value in vars(node).values():
+        if isinstance(value, AST):
+            count += count_nodes(value)
+        elif isinstance(value, list):
+            count += sum(
+                count_nodes(item) for item in value if isinstance(item, AST)
+            )
+    return count
+
+
+def find_nodes(node, node_class):
+    """Return the nodes of a tree that are node_class instances."""
+    found = [node] if isinstance(node, node_class) else []
+    for value in vars(node).values():
+        if isinstance(value, AST):
+            found.extend(find_nodes(value, node_class))
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, AST):
+                    found.extend(find_nodes(item, node_class))
+    return found
+
+
+def bench_simplify(args):
+    text = generate_arithmetic_program(args.statements, identities=True)
+    tree = analyze(text)
+    simplified_tree = analyze(text)
+    simplifier = AlgebraicSimplifier()
+    simplifier.visit(simplified_tree)
+    print('{} statements, {} runs, {} identities applied'.format(
+        args.statements, args.runs, simplifier.simplified
+    ))
+    print('nodes: {} -> {}'.format(
+        count_nodes(tree), count_nodes(simplified_tree)
+    ))
+
+    for name in args.engines:
+        run_times = []
+        memories = []
+        for t in (tree, simplified_tree):
+            interpreter = ENGINES[name](t)
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                interpreter.interpret()
+            run_times.append((time.perf_counter() - start) / args.runs)
+            memories.append(dict(interpreter.GLOBAL_MEMORY))
+        assert memories[0] == memories[1], f'{name} computed different results'
+        print('{:>10}: run {:8.4f}s -> {:8.4f}s  {:6.2f}x'.format(
+            name, run_times[0], run_times[1], run_times[0] / run_times[1]
+        ))
+
+
+class CountingInterpreter(Interpreter):
+    """Interpreter that counts the nodes it visits."""
+    def interpret(self):
+        self.instructions_executed = 0
+        return super().interpret()
+
+    def visit(self, node):
+        self.instructions_executed += 1
+        return super().visit(node)
+
+
+class FreshFrameInterpreter(Interpreter):
+    """Interpreter that allocates a new ActivationRecord for every call
+    instead of reusing one from a FramePool."""
+    def visit_ProcedureCall(self, node):
+        proc_decl = node.callee
+        args = [self.visit(param_node) for param_node in node.actual_params]
+        enclosing = None
+        if node.static_hops is not None:
+            enclosing = self.call_stack.peek()
+            for _ in range(node.static_hops):
+                enclosing = enclosing.enclosing
+        args.extend([None] * (proc_decl.frame_size - len(args)))
+        self.call_stack.push(
+            ActivationRecord(proc_decl.proc_name, proc_decl, args, enclosing)
+        )
+        self.visit(proc_decl.block_node)
+        self.call_stack.pop()
+
+
+class IfChainInterpreter(Interpreter):
+    """The Interpreter as it was before the operator functions were
+    resolved on the nodes: every BinOp and UnaryOp tests node.op.type
+    against the operators one by one."""
+    def visit_BinOp(self, node):
+        if node.op.type == TokenType.PLUS:
+            return self.visit(node.left) + self.visit(node.right)
+        elif node.op.type == TokenType.MINUS:
+            return self.visit(node.left) - self.visit(node.right)
+        elif node.op.type == TokenType.MUL:
+            return self.visit(node.left) * self.visit(node.right)
+        elif node.op.type == TokenType.INTEGER_DIV:
+            return self.visit(node.left) // self.visit(node.right)
+        elif node.op.type == TokenType.FLOAT_DIV:
+            return self.visit(node.left) / self.visit(node.right)
+        elif node.op.type == TokenType.SHL:
+            return self.visit(node.left) << self.visit(node.right)
+        elif node.op.type == TokenType.SHR:
+            return self.visit(node.left) >> self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        op = node.op.type
+        if op == TokenType.PLUS:
+            return +self.visit(node.expr)
+        elif op == TokenType.MINUS:
+            return -self.visit(node.expr)
+
+
+class DictGlobalsInterpreter(Interpreter):
+    """The Interpreter as it was before the global variables got slots:
+    they are kept in a dict by name."""
+    def __init__(self, tree):
+        super().__init__(tree)
+        self.GLOBAL_MEMORY = {}
+
+    def visit_Assign(self, node):
+        if node.left.address is None:
+            self.GLOBAL_MEMORY[node.left.value] = self.visit(node.right)
+        else:
+            super().visit_Assign(node)
+
+    def visit_Var(self, node):
+        if node.address is None:
+            return self.GLOBAL_MEMORY.get(node.value)
+        return super().visit_Var(node)
+
+
+def bench_globals(args):
+    text = generate_arithmetic_program(args.statements)
+    tree = analyze(text)
+    print(f'{args.statements} statements, {args.runs} runs')
+
+    baseline = None
+    for name, engine in (
+        ('dict', DictGlobalsInterpreter), ('slots', Interpreter)
+    ):
+        interpreter = engine(tree)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            interpreter.interpret()
+        run_time = (time.perf_counter() - start) / args.runs
+
+        memory = dict(interpreter.GLOBAL_MEMORY)
+        if baseline is None:
+            baseline = memory, run_time
+        assert memory == baseline[0], f'{name} computed different results'
+        print('{:>10}: run {:8.4f}s  {:6.2f}x'.format(
+            name, run_time, baseline[1] / run_time
+        ))
+
+
+def bench_operators(args):
+    print(f'{args.statements} statements, {args.runs} runs')
+    for op in ('+', '/'):
+        tree = analyze(generate_operator_program(args.statements, op))
+        run_times = []
+        memories = []
+        for engine in (IfChainInterpreter, Interpreter):
+            interpreter = engine(tree)
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                interpreter.interpret()
+            run_times.append((time.perf_counter() - start) / args.runs)
+            memories.append(dict(interpreter.GLOBAL_MEMORY))
+        assert memories[0] == memories[1], f"'{op}' computed different results"
+        print("{:>10}: if-chain {:8.4f}s  table {:8.4f}s  {:6.2f}x".format(
+            f"'{op}'", run_times[0], run_times[1], run_times[0] / run_times[1]
+        ))
+
+
+def bench_batch(args):
+    inputs = ('i0', 'i1', 'r0')
+    text = generate_arithmetic_program(args.statements, inputs=inputs)
+    tree = analyze(text)
+    rng = random.Random(0)
+    values = {
+        name: [
+            rng.randint(-1000, 1000) if name.startswith('i')
+            else rng.uniform(-100.0, 100.0)
+            for _ in range(args.size)
+        ]
+        for name in inputs
+    }
+    print(f'{args.statements} statements, {args.size} input sets')
+
+    start = time.perf_counter()
+    memories = []
+    for n in range(args.size):
+        interpreter = Interpreter(tree)
+        for name in inputs:
+            interpreter.set_global(name, values[name][n])
+        interpreter.interpret()
+        memories.append(dict(interpreter.GLOBAL_MEMORY))
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = BatchInterpreter(tree, values)
+    batch.interpret()
+    batch_time = time.perf_counter() - start
+
+    for n, memory in enumerate(memories):
+        assert memory == {
+            name: array[n] for name, array in batch.GLOBAL_MEMORY.items()
+        }, f'input set {n} computed different results'
+    print('    scalar: {:8.4f}s  batch {:8.4f}s  {:8.2f}x'.format(
+        scalar_time, batch_time, scalar_time / batch_time
+    ))
+
+
+def bench_calls(args):
+    text = generate_calls_program(args.statements)
+    calls = args.statements // 2 * 6 + args.statements % 2
+    tree = analyze(text)
+    print(f'{args.statements} statements, {calls} calls, {args.runs} runs')
+
+    engines = [
+        ('fresh', FreshFrameInterpreter),
+        ('tree', Interpreter),
+        ('closure', ClosureInterpreter),
+        ('pycode', PyCodeInterpreter),
+        ('vm', VMInterpreter),
+        ('regvm', RegisterInterpreter),
+    ]
+    baseline = None
+    for name, engine in engines:
+        interpreter = engine(tree)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            interpreter.interpret()
+        run_time = (time.perf_counter() - start) / args.runs
+
+        memory = dict(interpreter.GLOBAL_MEMORY)
+        if baseline is None:
+            baseline = memory, run_time
+        assert memory == baseline[0], f'{name} computed different results'
+        print('{:>10}: run {:8.4f}s  {:7.3f}us/call  {:6.2f}x'.format(
+            name, run_time, run_time / calls * 1e6, baseline[1] / run_time
+        ))
+
+
+def bench_inline(args):
+    text = generate_calls_program(args.statements)
+    tree = analyze(text)
+    inlined_tree = analyze(text)
+    inliner = ProcedureInliner(max_size=args.max_size)
+    inliner.visit(inlined_tree)
+    print('{} statements, {} runs, {} calls inlined'.format(
+        args.statements, args.runs, inliner.inlined
+    ))
+    for line in inliner.report:
+        print(f'  {line}')
+    print('nodes: {} -> {}'.format(
+        count_nodes(tree), count_nodes(inlined_tree)
+    ))
+
+    for name in ('tree', 'closure', 'pycode'):
+        run_times = []
+        memories = []
+        for t in (tree, inlined_tree):
+            interpreter = ENGINES[name](t)
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                interpreter.interpret()
+            run_times.append((time.perf_counter() - start) / args.runs)
+            memories.append(dict(interpreter.GLOBAL_MEMORY))
+        assert memories[0] == memories[1], f'{name} computed different results'
+        print('{:>10}: run {:8.4f}s -> {:8.4f}s  {:6.2f}x'.format(
+            name, run_times[0], run_times[1], run_times[0] / run_times[1]
+        ))
+
+
+def bench_instructions(args):
+    text = generate_arithmetic_program(args.statements)
+    tree = analyze(text)
+    print(f'{args.statements} statements, {args.runs} runs')
+    print('{:>10} {:>14} {:>10} {:>8}'.format(
+        'engine', 'instructions', 'run', 'speedup'
+    ))
+
+    engines = [
+        ('tree', CountingInterpreter),
+        ('vm', VMInterpreter),
+        ('regvm', RegisterInterpreter),
+    ]
+    baseline = None
+    for name, engine in engines:
+        interpreter = engine(tree)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            interpreter.interpret()
+        run_time = (time.perf_counter() - start) / args.runs
+
+        memory = dict(interpreter.GLOBAL_MEMORY)
+        if baseline is None:
+            baseline = memory, run_time
+        assert memory == baseline[0], f'{name} computed different results'
+        print('{:>10} {:>14} {:>9.4f}s {:>7.2f}x'.format(
+            name,
+            interpreter.instructions_executed,
+            run_time,
+            baseline[1] / run_time,
+        ))
+
+
+def bench_loops(args):
+    print(f'{args.iterations} iterations, {args.runs} runs')
+    trees = []
+    for unrolled in (True, False):
+        text = generate_loop_program(args.iterations, unrolled)
+        start = time.perf_counter()
+        trees.append(analyze(text))
+        front_end_time = time.perf_counter() - start
+        print('{:>10}: {:9} characters  front end {:8.4f}s'.format(
+            'unrolled' if unrolled else 'loop', len(text), front_end_time
+        ))
+
+    for name in args.engines:
+        run_times = []
+        memories = []
+        for tree in trees:
+            interpreter = ENGINES[name](tree)
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                interpreter.interpret()
+            run_times.append((time.perf_counter() - start) / args.runs)
+            memories.append(dict(interpreter.GLOBAL_MEMORY))
+        assert memories[0] == memories[1], f'{name} computed different results'
+        print('{:>10}: unrolled {:8.4f}s  loop {:8.4f}s  {:6.2f}x'.format(
+            name, run_times[0], run_times[1], run_times[0] / run_times[1]
+        ))
+
+
+def bench_branches(args):
+    text = generate_branch_program(args.limit)
+    print(f'primes below {args.limit}, {args.runs} runs')
+    baseline = None
+    for name in args.engines:
+        for optimized in (False, True):
+            tree = analyze(text)
+            if optimized:
+                optimize(tree)
+            interpreter = ENGINES[name](tree)
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                interpreter.interpret()
+            run_time = (time.perf_counter() - start) / args.runs
+            memory = dict(interpreter.GLOBAL_MEMORY)
+            if baseline is None:
+                baseline = memory
+            assert memory == baseline, f'{name} computed different results'
+            print('{:>20}: {:8.4f}s'.format(
+                name + (' optimized' if optimized else ''), run_time
+            ))
+    print(f'{baseline["primes"]} primes')
+
+
+def bench_arrays(args):
+    print('allocation of an array of zeros and a list of zeros')
+    for size in args.sizes:
+        array_type = ArrayTypeSymbol(INTEGER_TYPE, 1, size)
+        start = time.perf_counter()
+        elements = array_type.allocate()
+        array_time = time.perf_counter() - start
+        start = time.perf_counter()
+        boxed = [0] * size
+        list_time = time.perf_counter() - start
+        print('{:>10} elements: array {:8.5f}s {:>10} bytes, '
+              'list {:8.5f}s {:>10} bytes'.format(
+                  size, array_time, sys.getsizeof(elements),
+                  list_time, sys.getsizeof(boxed)))
+        del elements, boxed
+
+    text = generate_sieve_program(args.limit)
+    indices = find_nodes(analyze(text), Index)
+    elided = sum(not node.checked for node in indices)
+    print(f'sieve up to {args.limit}, {args.runs} runs, '
+          f'{elided} of {len(indices)} bounds checks elided')
+    baseline = None
+    for name in args.engines:
+        for optimized in (False, True):
+            tree = analyze(text)
+            if optimized:
+                optimize(tree)
+            interpreter = ENGINES[name](tree)
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                interpreter.interpret()
+            run_time = (time.perf_counter() - start) / args.runs
+            primes = interpreter.GLOBAL_MEMORY['primes']
+            if baseline is None:
+                baseline = primes
+            assert primes == baseline, f'{name} computed different results'
+            print('{:>20}: {:8.4f}s'.format(
+                name + (' optimized' if optimized else ''), run_time
+            ))
+    print(f'{baseline} primes')
+
+
+def bench_intrinsics(args):
+    print(f'builtins and FOR loops over {args.size} INTEGERs, '
+          f'{args.repeat} times, best of {args.runs} runs, setup subtracted')
+    for name in args.engines:
+        print(name)
+        setup = None
+        for builtin in _INTRINSICS:
+            times = {}
+            for part in ('none', 'builtin', 'loop'):
+                if part == 'none' and setup is not None:
+                    continue
+                text = generate_intrinsic_program(
+                    builtin, args.size, part, args.repeat
+                )
+                interpreter = ENGINES[name](analyze(text))
+                run_times = []
+                for _ in range(args.runs):
+                    start = time.perf_counter()
+                    interpreter.interpret()
+                    run_times.append(time.perf_counter() - start)
+                times[part] = min(run_times)
+                if part == 'none':
+                    setup = times[part]
+            builtin_time = max(times['builtin'] - setup, 0.0)
+            loop_time = max(times['loop'] - setup, 0.0)
+            print('{:>10}: builtin {:8.5f}s, loop {:8.5f}s, {:8.1f}x'.format(
+                builtin, builtin_time, loop_time,
+                loop_time / builtin_time if builtin_time else float('inf')
+            ))
+
+
+def bench_output(args):
+    text = generate_output_program(args.lines)
+    print(f'{args.lines} lines, best of {args.runs} runs')
+    sinks = [
+        # a write per line to a line-buffered file, as print() to a
+        # terminal does
+        ('unbuffered', lambda: tempfile.TemporaryFile('w', buffering=1), 0),
+        ('buffered', lambda: tempfile.TemporaryFile('w'),
+         OutputBuffer.CAPACITY),
+        ('discarded', DiscardingSink, OutputBuffer.CAPACITY),
+    ]
+    for name in args.engines:
+        for sink_name, make_sink, capacity in sinks:
+            run_times = []
+            for _ in range(args.runs):
+                sink = make_sink()
+                output = OutputBuffer(sink, capacity=capacity)
+                interpreter = ENGINES[name](analyze(text), output=output)
+                start = time.perf_counter()
+                interpreter.interpret()
+                run_times.append(time.perf_counter() - start)
+                if hasattr(sink, 'close'):
+                    sink.close()
+            print('{:>20}: {:12,.0f} lines/s'.format(
+                f'{name} {sink_name}', args.lines / min(run_times)
+            ))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks for the Simple Pascal Interpreter'
+    )
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    memory_parser = subparsers.add_parser(
+        'memory',
+        help='Peak front-end memory (tracemalloc) of the two-pass '
+             'and the streaming pipelines',
+    )
+    memory_parser.add_argument(
+        '--procedures', type=int, nargs='+', default=[100, 1000, 5000],
+        help='Number of procedures in the generated programs',
+    )
+    memory_parser.set_defaults(function=bench_memory)
+
+    parallel_parser = subparsers.add_parser(
+        'parallel',
+        help='Semantic analysis with procedure bodies analyzed by '
+             'a pool of worker processes',
+    )
+    parallel_parser.add_argument(
+        '--procedures', type=int, default=5000,
+        help='Number of procedures in the generated program',
+    )
+    parallel_parser.add_argument(
+        '--workers', type=int, nargs='+', default=[1, 2, 4],
+        help='Sizes of the process pools',
+    )
+    parallel_parser.set_defaults(function=bench_parallel)
+
+    symbols_parser = subparsers.add_parser(
+        'symbols',
+        help='Memory used by the symbol tables of a program',
+    )
+    symbols_parser.add_argument(
+        '--declarations', type=int, default=100000,
+        help='Number of variable declarations in the generated program',
+    )
+    symbols_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of times the program is analyzed',
+    )
+    symbols_parser.set_defaults(function=bench_symbols)
+
+    engines_parser = subparsers.add_parser(
+        'engines',
+        help='Execution time of the execution engines on a generated '
+             'arithmetic-heavy program',
+    )
+    engines_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of assignments in the generated program',
+    )
+    engines_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each engine runs the program',
+    )
+    engines_parser.add_argument(
+        '--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+        help='Engines to compare, the first one is the baseline',
+    )
+    engines_parser.add_argument(
+        '--optimize', action='store_true',
+        help='Run the optimization passes over the program first',
+    )
+    engines_parser.set_defaults(function=bench_engines)
+
+    instructions_parser = subparsers.add_parser(
+        'instructions',
+        help='Instructions executed (nodes visited by Interpreter) and '
+             'execution time of the stack and the register virtual '
+             'machines on a generated arithmetic-heavy program',
+    )
+    instructions_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of assignments in the generated program',
+    )
+    instructions_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each engine runs the program',
+    )
+    instructions_parser.set_defaults(function=bench_instructions)
+
+    simplify_parser = subparsers.add_parser(
+        'simplify',
+        help='Node count and execution time of a generated program full '
+             'of algebraic identities before and after AlgebraicSimplifier',
+    )
+    simplify_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of assignments in the generated program',
+    )
+    simplify_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each engine runs the program',
+    )
+    simplify_parser.add_argument(
+        '--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+        help='Engines to run the program',
+    )
+    simplify_parser.set_defaults(function=bench_simplify)
+
+    operators_parser = subparsers.add_parser(
+        'operators',
+        help='Tree interpreter time of PLUS-heavy and FLOAT_DIV-heavy '
+             'programs, testing the operator types or calling the '
+             'functions resolved on the nodes',
+    )
+    operators_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of assignments in the generated programs',
+    )
+    operators_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each interpreter runs the programs',
+    )
+    operators_parser.set_defaults(function=bench_operators)
+
+    globals_parser = subparsers.add_parser(
+        'globals',
+        help='Tree interpreter time of a generated variable-heavy '
+             'program, with the global variables in a dict or in slots',
+    )
+    globals_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of assignments in the generated program',
+    )
+    globals_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each interpreter runs the program',
+    )
+    globals_parser.set_defaults(function=bench_globals)
+
+    batch_parser = subparsers.add_parser(
+        'batch',
+        help='Time of one BatchInterpreter run over a number of input '
+             'sets and of one Interpreter run per input set',
+    )
+    batch_parser.add_argument(
+        '--statements', type=int, default=200,
+        help='Number of assignments in the generated program',
+    )
+    batch_parser.add_argument(
+        '--size', type=int, default=10000,
+        help='Number of input sets',
+    )
+    batch_parser.set_defaults(function=bench_batch)
+
+    calls_parser = subparsers.add_parser(
+        'calls',
+        help='Procedure call overhead of the engines that run procedures, '
+             'with pooled and with freshly allocated activation records',
+    )
+    calls_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of call statements in the generated program',
+    )
+    calls_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each engine runs the program',
+    )
+    calls_parser.set_defaults(function=bench_calls)
+
+    inline_parser = subparsers.add_parser(
+        'inline',
+        help='Execution time of a generated call-heavy program before '
+             'and after ProcedureInliner',
+    )
+    inline_parser.add_argument(
+        '--statements', type=int, default=20000,
+        help='Number of call statements in the generated program',
+    )
+    inline_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each engine runs the program',
+    )
+    inline_parser.add_argument(
+        '--max-size', type=int, default=ProcedureInliner.MAX_SIZE,
+        help='Inline the procedures whose bodies have at most this many nodes',
+    )
+    inline_parser.set_defaults(function=bench_inline)
+
+    loops_parser = subparsers.add_parser(
+        'loops',
+        help='Front-end and execution time of a FOR loop and of the '
+             'equivalent unrolled straight-line program',
+    )
+    loops_parser.add_argument(
+        '--iterations', type=int, default=20000,
+        help='Number of iterations of the loop',
+    )
+    loops_parser.add_argument(
+        '--runs', type=int, default=5,
+        help='Number of times each engine runs the programs',
+    )
+    loops_parser.add_argument(
+        '--engines', nargs='+', choices=['tree', 'closure', 'pycode'],
+        default=['tree', 'closure', 'pycode'],
+        help='Engines to run the programs',
+    )
+    loops_parser.set_defaults(function=bench_loops)
+
+    branches_parser = subparsers.add_parser(
+        'branches',
+        help='Execution time of a program of WHILE loops and IF statements',
+    )
+    branches_parser.add_argument(
+        '--limit', type=int, default=20000,
+        help='Count the primes below this number',
+    )
+    branches_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of times each engine runs the program',
+    )
+    branches_parser.add_argument(
+        '--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+        help='Engines to run the program',
+    )
+    branches_parser.set_defaults(function=bench_branches)
+
+    arrays_parser = subparsers.add_parser(
+        'arrays',
+        help='Allocation of arrays and execution time of a sieve over an '
+             'ARRAY',
+    )
+    arrays_parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10 ** 4, 10 ** 6, 10 ** 7],
+        help='Numbers of elements of the arrays allocated',
+    )
+    arrays_parser.add_argument(
+        '--limit', type=int, default=100000,
+        help='Count the primes up to this number',
+    )
+    arrays_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of times each engine runs the program',
+    )
+    arrays_parser.add_argument(
+        '--engines', nargs='+', choices=['tree', 'closure'],
+        default=['tree', 'closure'],
+        help='Engines to run the program',
+    )
+    arrays_parser.set_defaults(function=bench_arrays)
+
+    intrinsics_parser = subparsers.add_parser(
+        'intrinsics',
+        help='Execution time of the array builtins and of the equivalent '
+             'FOR loops',
+    )
+    intrinsics_parser.add_argument(
+        '--size', type=int, default=100000,
+        help='Number of elements of the arrays',
+    )
+    intrinsics_parser.add_argument(
+        '--repeat', type=int, default=20,
+        help='Number of times the programs run each builtin and loop',
+    )
+    intrinsics_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of times each engine runs the program',
+    )
+    intrinsics_parser.add_argument(
+        '--engines', nargs='+', choices=['tree', 'closure'],
+        default=['tree', 'closure'],
+        help='Engines to run the programs',
+    )
+    intrinsics_parser.set_defaults(function=bench_intrinsics)
+
+    output_parser = subparsers.add_parser(
+        'output',
+        help='Lines per second written by WRITELN to a file, unbuffered '
+             'and buffered, and formatted only',
+    )
+    output_parser.add_argument(
+        '--lines', type=int, default=200000,
+        help='Number of lines the program writes',
+    )
+    output_parser.add_argument(
+        '--runs', type=int, default=3,
+        help='Number of times each engine runs the program',
+    )
+    output_parser.add_argument(
+        '--engines', nargs='+', choices=['tree', 'closure'],
+        default=['tree', 'closure'],
+        help='Engines to run the program',
+    )
+    output_parser.set_defaults(function=bench_output)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == '__main__':
+    main()
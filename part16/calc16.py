@@ -1,8 +1,26 @@
 """SPI - Simple Pascal Interpreter. Part 16."""
 
 import argparse
+import ast as pyast
+import contextlib
+import gc
+import io
+import marshal
+import operator
+import os
+import pickle
+import struct
 import sys
-from enum import Enum
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum, IntEnum
+
+try:
+    import numpy as np
+except ImportError:  # BatchInterpreter needs NumPy, the builtins don't
+    np = None
 
 _SHOULD_LOG_SCOPE = False  # see '--scope' command line option
 
@@ -11,6 +29,13 @@ class ErrorCode(Enum):
     UNEXPECTED_TOKEN = 'Unexpected token'
     ID_NOT_FOUND     = 'Identifier not found'
     DUPLICATE_ID     = 'Duplicate id found'
+    WRONG_PARAMS_NUM = 'Wrong number of arguments'
+    TYPE_MISMATCH    = 'Incompatible types'
+    DIVISION_BY_ZERO = 'Division by zero'
+    FOR_VAR_ASSIGNED = 'Assignment to a FOR control variable'
+    INDEX_OUT_OF_RANGE = 'Array index out of range'
+    EMPTY_ARRAY      = 'Array upper bound below its lower bound'
+    UNSUPPORTED      = 'Not supported by this backend'
 
 
 class Error(Exception):
@@ -33,6 +58,10 @@ class SemanticError(Error):
     pass
 
 
+class CompilerError(Error):
+    pass
+
+
 ###############################################################################
 #                                                                             #
 #  LEXER                                                                      #
@@ -52,13 +81,32 @@ class TokenType(Enum):
     DOT           = '.'
     COLON         = ':'
     COMMA         = ','
+    EQUAL         = '='
+    LESS          = '<'
+    GREATER       = '>'
+    LBRACKET      = '['
+    RBRACKET      = ']'
     # block of reserved words
     PROGRAM       = 'PROGRAM'  # marks the beginning of the block
     INTEGER       = 'INTEGER'
     REAL          = 'REAL'
+    ARRAY         = 'ARRAY'
+    OF            = 'OF'
     INTEGER_DIV   = 'DIV'
     VAR           = 'VAR'
     PROCEDURE     = 'PROCEDURE'
+    FUNCTION      = 'FUNCTION'
+    FOR           = 'FOR'
+    TO            = 'TO'
+    DOWNTO        = 'DOWNTO'
+    DO            = 'DO'
+    IF            = 'IF'
+    THEN          = 'THEN'
+    ELSE          = 'ELSE'
+    WHILE         = 'WHILE'
+    AND           = 'AND'
+    OR            = 'OR'
+    NOT           = 'NOT'
     BEGIN         = 'BEGIN'
     END           = 'END'      # marks the end of the block
     # misc
@@ -66,7 +114,14 @@ class TokenType(Enum):
     INTEGER_CONST = 'INTEGER_CONST'
     REAL_CONST    = 'REAL_CONST'
     ASSIGN        = ':='
+    NOT_EQUAL     = '<>'
+    LESS_EQUAL    = '<='
+    GREATER_EQUAL = '>='
+    RANGE         = '..'
     EOF           = 'EOF'
+    # INTEGER shifts made by AlgebraicSimplifier, not Pascal operators
+    SHL           = 'SHL'
+    SHR           = 'SHR'
 
 
 class Token(object):
@@ -106,9 +161,23 @@ def _build_reserved_keywords():
         {'PROGRAM': <TokenType.PROGRAM: 'PROGRAM'>,
          'INTEGER': <TokenType.INTEGER: 'INTEGER'>,
          'REAL': <TokenType.REAL: 'REAL'>,
+         'ARRAY': <TokenType.ARRAY: 'ARRAY'>,
+         'OF': <TokenType.OF: 'OF'>,
          'DIV': <TokenType.INTEGER_DIV: 'DIV'>,
          'VAR': <TokenType.VAR: 'VAR'>,
          'PROCEDURE': <TokenType.PROCEDURE: 'PROCEDURE'>,
+         'FUNCTION': <TokenType.FUNCTION: 'FUNCTION'>,
+         'FOR': <TokenType.FOR: 'FOR'>,
+         'TO': <TokenType.TO: 'TO'>,
+         'DOWNTO': <TokenType.DOWNTO: 'DOWNTO'>,
+         'DO': <TokenType.DO: 'DO'>,
+         'IF': <TokenType.IF: 'IF'>,
+         'THEN': <TokenType.THEN: 'THEN'>,
+         'ELSE': <TokenType.ELSE: 'ELSE'>,
+         'WHILE': <TokenType.WHILE: 'WHILE'>,
+         'AND': <TokenType.AND: 'AND'>,
+         'OR': <TokenType.OR: 'OR'>,
+         'NOT': <TokenType.NOT: 'NOT'>,
          'BEGIN': <TokenType.BEGIN: 'BEGIN'>,
          'END': <TokenType.END: 'END'>}
     """
@@ -125,17 +194,28 @@ def _build_reserved_keywords():
 
 RESERVED_KEYWORDS = _build_reserved_keywords()
 
+_TWO_CHAR_TOKENS = {
+    token_type.value for token_type in (
+        TokenType.ASSIGN,
+        TokenType.NOT_EQUAL,
+        TokenType.LESS_EQUAL,
+        TokenType.GREATER_EQUAL,
+        TokenType.RANGE,
+    )
+}
+
 
 class Lexer(object):
-    def __init__(self, text):
+    def __init__(self, text, lineno=1, column=1):
         # client string input, e.g. "4 + 2 * 3 - 6 / 2"
         self.text = text
         # self.pos is an index into self.text
         self.pos = 0
         self.current_char = self.text[self.pos]
-        # token line number and column number
-        self.lineno = 1
-        self.column = 1
+        # token line number and column number, those of the first
+        # character when the text is a part of a larger source
+        self.lineno = lineno
+        self.column = column
 
     def error(self):
         s = "Lexer error on '{lexeme}' line: {lineno} column: {column}".format(
@@ -185,7 +265,8 @@ class Lexer(object):
             result += self.current_char
             self.advance()
 
-        if self.current_char == '.':
+        # the dot of 1..10 starts a RANGE, not a fraction
+        if self.current_char == '.' and self.peek() != '.':
             result += self.current_char
             self.advance()
 
@@ -245,10 +326,11 @@ class Lexer(object):
             if self.current_char.isdigit():
                 return self.number()
 
-            if self.current_char == ':' and self.peek() == '=':
+            if self.current_char + (self.peek() or '') in _TWO_CHAR_TOKENS:
+                token_type = TokenType(self.current_char + self.peek())
                 token = Token(
-                    type=TokenType.ASSIGN,
-                    value=TokenType.ASSIGN.value,  # ':='
+                    type=token_type,
+                    value=token_type.value,  # e.g. ':=', '<=', '..'
                     lineno=self.lineno,
                     column=self.column,
                 )
@@ -289,11 +371,64 @@ class AST(object):
     pass
 
 
+# The functions that evaluate the operators. Every BinOp and UnaryOp
+# looks its function up once, when it is built, and the evaluators call
+# node.function instead of testing node.op.type. DIV floors like
+# Python's // and '/' yields a REAL for INTEGER operands too.
+_BINARY_OP_FUNCTIONS = {
+    TokenType.PLUS: operator.add,
+    TokenType.MINUS: operator.sub,
+    TokenType.MUL: operator.mul,
+    TokenType.INTEGER_DIV: operator.floordiv,
+    TokenType.FLOAT_DIV: operator.truediv,
+    TokenType.SHL: operator.lshift,
+    TokenType.SHR: operator.rshift,
+    TokenType.EQUAL: operator.eq,
+    TokenType.NOT_EQUAL: operator.ne,
+    TokenType.LESS: operator.lt,
+    TokenType.LESS_EQUAL: operator.le,
+    TokenType.GREATER: operator.gt,
+    TokenType.GREATER_EQUAL: operator.ge,
+}
+
+_UNARY_OP_FUNCTIONS = {
+    TokenType.PLUS: operator.pos,
+    TokenType.MINUS: operator.neg,
+    TokenType.NOT: operator.not_,
+}
+
+# the operators of the BinOps that compare numbers and yield a BOOLEAN
+RELATIONAL_OPERATORS = frozenset((
+    TokenType.EQUAL,
+    TokenType.NOT_EQUAL,
+    TokenType.LESS,
+    TokenType.LESS_EQUAL,
+    TokenType.GREATER,
+    TokenType.GREATER_EQUAL,
+))
+
+
 class BinOp(AST):
     def __init__(self, left, op, right):
         self.left = left
         self.token = self.op = op
         self.right = right
+        self.function = _BINARY_OP_FUNCTIONS[op.type]
+
+
+class BoolOp(AST):
+    """left AND right, or left OR right.
+
+    The right operand is evaluated only when the left one doesn't decide
+    the value: 'short_circuit' is the value of the left operand that
+    does, and then the value of the BoolOp too, False for AND and True
+    for OR.
+    """
+    def __init__(self, left, op, right):
+        self.left = left
+        self.token = self.op = op
+        self.right = right
+        self.short_circuit = op.type == TokenType.OR
 
 
 class Num(AST):
@@ -306,6 +441,7 @@ class UnaryOp(AST):
     def __init__(self, op, expr):
         self.token = self.op = op
         self.expr = expr
+        self.function = _UNARY_OP_FUNCTIONS[op.type]
 
 
 class Compound(AST):
@@ -328,14 +464,65 @@ class Var(AST):
         self.value = token.value
 
 
+class Index(AST):
+    """An element of an array: var_node[index].
+
+    The semantic analysis sets 'low' and 'high', the bounds of the
+    array, and clears 'checked' when it proves the index between them:
+    the engines then skip the bounds check.
+    """
+    def __init__(self, var_node, index, token):
+        self.var_node = var_node
+        self.index = index
+        self.token = token  # the array's ID token
+        self.low = self.high = None
+        self.checked = True
+
+
+class For(AST):
+    """A counting loop: FOR var_node := start TO stop DO body, or DOWNTO
+    when 'downto' is true.
+
+    The bounds are evaluated once, before the first iteration. After
+    the loop the control variable holds its last value, or the value it
+    had before the loop if the body never ran.
+    """
+    def __init__(self, var_node, start, stop, downto, body, token):
+        self.var_node = var_node
+        self.start = start
+        self.stop = stop
+        self.downto = downto
+        self.body = body
+        self.token = token  # the FOR token
+
+
+class If(AST):
+    """IF condition THEN then_branch, ELSE else_branch unless it is
+    None."""
+    def __init__(self, condition, then_branch, else_branch, token):
+        self.condition = condition
+        self.then_branch = then_branch
+        self.else_branch = else_branch
+        self.token = token  # the IF token
+
+
+class While(AST):
+    """WHILE condition DO body."""
+    def __init__(self, condition, body, token):
+        self.condition = condition
+        self.body = body
+        self.token = token  # the WHILE token
+
+
 class NoOp(AST):
     pass
 
 
 class Program(AST):
-    def __init__(self, name, block):
+    def __init__(self, name, block, source=None):
         self.name = name
         self.block = block
+        self.source = source  # the text the program was parsed from
 
 
 class Block(AST):
@@ -356,6 +543,16 @@ class Type(AST):
         self.value = token.value
 
 
+class ArrayType(Type):
+    """ARRAY[low..high] OF element_type_node, low and high being INTEGER
+    constants."""
+    def __init__(self, token, low, high, element_type_node):
+        super().__init__(token)
+        self.low = low
+        self.high = high
+        self.element_type_node = element_type_node
+
+
 class Param(AST):
     def __init__(self, var_node, type_node):
         self.var_node = var_node
@@ -363,10 +560,23 @@ class Param(AST):
 
 
 class ProcedureDecl(AST):
-    def __init__(self, proc_name, params, block_node):
+    def __init__(self, proc_name, params, block_node, token=None):
         self.proc_name = proc_name
         self.params = params  # a list of Param nodes
         self.block_node = block_node
+        self.token = token  # the ID token of the procedure name
+        # (start, end, lineno, column): the offsets of the declaration
+        # in Program.source and the position of its first token
+        self.span = None
+
+
+class FunctionDecl(ProcedureDecl):
+    """A FUNCTION: a procedure whose calls are expressions. The value of
+    a call is the last value its body assigns to the function's name."""
+    def __init__(self, proc_name, params, return_type, block_node,
+                 token=None):
+        super().__init__(proc_name, params, block_node, token)
+        self.return_type = return_type  # a Type node
 
 
 class ProcedureCall(AST):
@@ -376,9 +586,17 @@ class ProcedureCall(AST):
         self.token = token
 
 
+class FunctionCall(ProcedureCall):
+    """A call of a FUNCTION in an expression."""
+
+
 class Parser(object):
-    def __init__(self, lexer):
+    def __init__(self, lexer, analyzer=None):
         self.lexer = lexer
+        # optional SemanticAnalyzer: when given, the parser declares and
+        # resolves symbols as it goes and returns an annotated tree in a
+        # single pass, without a separate semantic analysis traversal
+        self.analyzer = analyzer
         # set current token to the first token taken from the input
         self.current_token = self.get_next_token()
 
@@ -392,6 +610,11 @@ class Parser(object):
             message=f'{error_code.value} -> {token}',
         )
 
+    def token_start(self):
+        """Return the offset of the current token, a keyword or an ID,
+        in the text of the lexer, which stops right after it."""
+        return self.lexer.pos - len(self.current_token.value)
+
     def eat(self, token_type):
         # compare the current token type with the passed token
         # type and if they match then "eat" the current token
@@ -411,8 +634,12 @@ class Parser(object):
         var_node = self.variable()
         prog_name = var_node.value
         self.eat(TokenType.SEMI)
+        if self.analyzer is not None:
+            self.analyzer.enter_program()
         block_node = self.block()
-        program_node = Program(prog_name, block_node)
+        if self.analyzer is not None:
+            self.analyzer.leave_scope()
+        program_node = Program(prog_name, block_node, self.lexer.text)
         self.eat(TokenType.DOT)
         return program_node
 
@@ -425,7 +652,8 @@ class Parser(object):
 
     def declarations(self):
         """
-        declarations : (VAR (variable_declaration SEMI)+)? procedure_declaration*
+        declarations : (VAR (variable_declaration SEMI)+)?
+                       (procedure_declaration | function_declaration)*
         """
         declarations = []
 
@@ -436,9 +664,13 @@ class Parser(object):
                 declarations.extend(var_decl)
                 self.eat(TokenType.SEMI)
 
-        while self.current_token.type == TokenType.PROCEDURE:
-            proc_decl = self.procedure_declaration()
-            declarations.append(proc_decl)
+        while self.current_token.type in (
+                TokenType.PROCEDURE, TokenType.FUNCTION
+        ):
+            if self.current_token.type == TokenType.PROCEDURE:
+                declarations.append(self.procedure_declaration())
+            else:
+                declarations.append(self.function_declaration())
 
         return declarations
 
@@ -479,7 +711,9 @@ class Parser(object):
         return param_nodes
 
     def variable_declaration(self):
-        """variable_declaration : ID (COMMA ID)* COLON type_spec"""
+        """
+        variable_declaration : ID (COMMA ID)* COLON (type_spec | array_type)
+        """
         var_nodes = [Var(self.current_token)]  # first ID
         self.eat(TokenType.ID)
 
@@ -490,33 +724,97 @@ class Parser(object):
 
         self.eat(TokenType.COLON)
 
-        type_node = self.type_spec()
+        if self.current_token.type == TokenType.ARRAY:
+            type_node = self.array_type()
+        else:
+            type_node = self.type_spec()
         var_declarations = [
             VarDecl(var_node, type_node)
             for var_node in var_nodes
         ]
+        if self.analyzer is not None:
+            for var_decl in var_declarations:
+                self.analyzer.declare_var(var_decl)
         return var_declarations
 
     def procedure_declaration(self):
         """procedure_declaration :
              PROCEDURE ID (LPAREN formal_parameter_list RPAREN)? SEMI block SEMI
         """
+        keyword = self.current_token
+        start = self.token_start()
         self.eat(TokenType.PROCEDURE)
+        token = self.current_token
         proc_name = self.current_token.value
         self.eat(TokenType.ID)
         params = []
+        if self.analyzer is not None:
+            proc_symbol = self.analyzer.enter_procedure(proc_name)
 
         if self.current_token.type == TokenType.LPAREN:
             self.eat(TokenType.LPAREN)
             params = self.formal_parameter_list()
             self.eat(TokenType.RPAREN)
 
+        if self.analyzer is not None:
+            self.analyzer.declare_params(proc_symbol, params)
+
         self.eat(TokenType.SEMI)
         block_node = self.block()
-        proc_decl = ProcedureDecl(proc_name, params, block_node)
+        if self.analyzer is not None:
+            self.analyzer.leave_scope()
+        proc_decl = ProcedureDecl(proc_name, params, block_node, token)
+        if self.analyzer is not None:
+            proc_decl.proc_symbol = proc_symbol
+        proc_decl.span = (
+            start, self.lexer.pos, keyword.lineno, keyword.column
+        )
         self.eat(TokenType.SEMI)
         return proc_decl
 
+    def function_declaration(self):
+        """function_declaration :
+             FUNCTION ID (LPAREN formal_parameter_list RPAREN)?
+             COLON type_spec SEMI block SEMI
+        """
+        keyword = self.current_token
+        start = self.token_start()
+        self.eat(TokenType.FUNCTION)
+        token = self.current_token
+        func_name = self.current_token.value
+        self.eat(TokenType.ID)
+        params = []
+        if self.analyzer is not None:
+            func_symbol = self.analyzer.enter_procedure(
+                func_name, FunctionSymbol
+            )
+
+        if self.current_token.type == TokenType.LPAREN:
+            self.eat(TokenType.LPAREN)
+            params = self.formal_parameter_list()
+            self.eat(TokenType.RPAREN)
+
+        self.eat(TokenType.COLON)
+        return_type = self.type_spec()
+        if self.analyzer is not None:
+            self.analyzer.declare_params(func_symbol, params)
+            self.analyzer.declare_result(func_symbol, return_type, token)
+
+        self.eat(TokenType.SEMI)
+        block_node = self.block()
+        if self.analyzer is not None:
+            self.analyzer.leave_scope()
+        func_decl = FunctionDecl(
+            func_name, params, return_type, block_node, token
+        )
+        if self.analyzer is not None:
+            func_decl.proc_symbol = func_symbol
+        func_decl.span = (
+            start, self.lexer.pos, keyword.lineno, keyword.column
+        )
+        self.eat(TokenType.SEMI)
+        return func_decl
+
     def type_spec(self):
         """type_spec : INTEGER
                      | REAL
@@ -529,6 +827,30 @@ class Parser(object):
         node = Type(token)
         return node
 
+    def array_type(self):
+        """array_type : ARRAY LBRACKET bound RANGE bound RBRACKET
+                        OF type_spec
+        """
+        token = self.current_token
+        self.eat(TokenType.ARRAY)
+        self.eat(TokenType.LBRACKET)
+        low = self.bound()
+        self.eat(TokenType.RANGE)
+        high = self.bound()
+        self.eat(TokenType.RBRACKET)
+        self.eat(TokenType.OF)
+        return ArrayType(token, low, high, self.type_spec())
+
+    def bound(self):
+        """bound : MINUS? INTEGER_CONST"""
+        sign = 1
+        if self.current_token.type == TokenType.MINUS:
+            self.eat(TokenType.MINUS)
+            sign = -1
+        value = self.current_token.value
+        self.eat(TokenType.INTEGER_CONST)
+        return sign * value
+
     def compound_statement(self):
         """
         compound_statement: BEGIN statement_list END
@@ -563,10 +885,19 @@ class Parser(object):
         statement : compound_statement
                   | proccall_statement
                   | assignment_statement
+                  | for_statement
+                  | if_statement
+                  | while_statement
                   | empty
         """
         if self.current_token.type == TokenType.BEGIN:
             node = self.compound_statement()
+        elif self.current_token.type == TokenType.FOR:
+            node = self.for_statement()
+        elif self.current_token.type == TokenType.IF:
+            node = self.if_statement()
+        elif self.current_token.type == TokenType.WHILE:
+            node = self.while_statement()
         elif (self.current_token.type == TokenType.ID and
               self.lexer.current_char == '('
         ):
@@ -579,6 +910,20 @@ class Parser(object):
 
     def proccall_statement(self):
         """proccall_statement : ID LPAREN (expr (COMMA expr)*)? RPAREN"""
+        node = self.call(ProcedureCall)
+        if self.analyzer is not None:
+            self.analyzer.check_proc_call(node)
+        return node
+
+    def function_call(self):
+        """function_call : ID LPAREN (expr (COMMA expr)*)? RPAREN"""
+        node = self.call(FunctionCall)
+        if self.analyzer is not None:
+            self.analyzer.check_function_call(node)
+        return node
+
+    def call(self, call_class):
+        """Return a call_class node of the call at the current token."""
         token = self.current_token
 
         proc_name = self.current_token.value
@@ -596,24 +941,81 @@ class Parser(object):
 
         self.eat(TokenType.RPAREN)
 
-        node = ProcedureCall(
+        return call_class(
             proc_name=proc_name,
             actual_params=actual_params,
             token=token,
         )
-        return node
 
     def assignment_statement(self):
         """
-        assignment_statement : variable ASSIGN expr
+        assignment_statement : (variable | indexed_variable) ASSIGN expr
         """
         left = self.variable()
+        if self.current_token.type == TokenType.LBRACKET:
+            left = self.indexed_variable(left)
         token = self.current_token
         self.eat(TokenType.ASSIGN)
         right = self.expr()
         node = Assign(left, token, right)
+        if self.analyzer is not None:
+            # resolves the left-hand side after the right-hand side,
+            # the same order SemanticAnalyzer.visit_Assign uses
+            self.analyzer.check_assign(node)
+        return node
+
+    def for_statement(self):
+        """
+        for_statement : FOR variable ASSIGN expr (TO | DOWNTO) expr
+                        DO statement
+        """
+        token = self.current_token
+        self.eat(TokenType.FOR)
+        var_node = self.variable()
+        self.eat(TokenType.ASSIGN)
+        start = self.expr()
+        downto = self.current_token.type == TokenType.DOWNTO
+        self.eat(TokenType.DOWNTO if downto else TokenType.TO)
+        stop = self.expr()
+        self.eat(TokenType.DO)
+        node = For(var_node, start, stop, downto, None, token)
+        if self.analyzer is not None:
+            self.analyzer.enter_for(node)
+        node.body = self.statement()
+        if self.analyzer is not None:
+            self.analyzer.leave_for()
         return node
 
+    def if_statement(self):
+        """
+        if_statement : IF expr THEN statement (ELSE statement)?
+        """
+        token = self.current_token
+        self.eat(TokenType.IF)
+        condition = self.expr()
+        if self.analyzer is not None:
+            self.analyzer.check_condition(condition)
+        self.eat(TokenType.THEN)
+        then_branch = self.statement()
+        else_branch = None
+        # an ELSE belongs to the innermost IF
+        if self.current_token.type == TokenType.ELSE:
+            self.eat(TokenType.ELSE)
+            else_branch = self.statement()
+        return If(condition, then_branch, else_branch, token)
+
+    def while_statement(self):
+        """
+        while_statement : WHILE expr DO statement
+        """
+        token = self.current_token
+        self.eat(TokenType.WHILE)
+        condition = self.expr()
+        if self.analyzer is not None:
+            self.analyzer.check_condition(condition)
+        self.eat(TokenType.DO)
+        return While(condition, self.statement(), token)
+
     def variable(self):
         """
         variable : ID
@@ -622,35 +1024,78 @@ class Parser(object):
         self.eat(TokenType.ID)
         return node
 
+    def indexed_variable(self, var_node):
+        """
+        indexed_variable : variable LBRACKET expr RBRACKET
+        """
+        self.eat(TokenType.LBRACKET)
+        index = self.expr()
+        self.eat(TokenType.RBRACKET)
+        node = Index(var_node, index, var_node.token)
+        if self.analyzer is not None:
+            self.analyzer.check_index(node)
+        return node
+
     def empty(self):
         """An empty production"""
         return NoOp()
 
     def expr(self):
         """
-        expr : term ((PLUS | MINUS) term)*
+        expr : simple_expression (relational_operator simple_expression)?
+
+        relational_operator : EQUAL | NOT_EQUAL | LESS | LESS_EQUAL
+                            | GREATER | GREATER_EQUAL
+        """
+        node = self.simple_expression()
+
+        if self.current_token.type in RELATIONAL_OPERATORS:
+            token = self.current_token
+            self.eat(token.type)
+            node = BinOp(left=node, op=token, right=self.simple_expression())
+            if self.analyzer is not None:
+                self.analyzer.check_bin_op(node)
+
+        return node
+
+    def simple_expression(self):
+        """
+        simple_expression : term ((PLUS | MINUS | OR) term)*
         """
         node = self.term()
 
-        while self.current_token.type in (TokenType.PLUS, TokenType.MINUS):
+        while self.current_token.type in (
+                TokenType.PLUS,
+                TokenType.MINUS,
+                TokenType.OR,
+        ):
             token = self.current_token
             if token.type == TokenType.PLUS:
                 self.eat(TokenType.PLUS)
             elif token.type == TokenType.MINUS:
                 self.eat(TokenType.MINUS)
+            elif token.type == TokenType.OR:
+                self.eat(TokenType.OR)
+                node = BoolOp(left=node, op=token, right=self.term())
+                if self.analyzer is not None:
+                    self.analyzer.check_bool_op(node)
+                continue
 
             node = BinOp(left=node, op=token, right=self.term())
+            if self.analyzer is not None:
+                self.analyzer.check_bin_op(node)
 
         return node
 
     def term(self):
-        """term : factor ((MUL | INTEGER_DIV | FLOAT_DIV) factor)*"""
+        """term : factor ((MUL | INTEGER_DIV | FLOAT_DIV | AND) factor)*"""
         node = self.factor()
 
         while self.current_token.type in (
                 TokenType.MUL,
                 TokenType.INTEGER_DIV,
                 TokenType.FLOAT_DIV,
+                TokenType.AND,
         ):
             token = self.current_token
             if token.type == TokenType.MUL:
@@ -659,41 +1104,57 @@ class Parser(object):
                 self.eat(TokenType.INTEGER_DIV)
             elif token.type == TokenType.FLOAT_DIV:
                 self.eat(TokenType.FLOAT_DIV)
+            elif token.type == TokenType.AND:
+                self.eat(TokenType.AND)
+                node = BoolOp(left=node, op=token, right=self.factor())
+                if self.analyzer is not None:
+                    self.analyzer.check_bool_op(node)
+                continue
 
             node = BinOp(left=node, op=token, right=self.factor())
+            if self.analyzer is not None:
+                self.analyzer.check_bin_op(node)
 
         return node
 
     def factor(self):
         """factor : PLUS factor
                   | MINUS factor
+                  | NOT factor
                   | INTEGER_CONST
                   | REAL_CONST
                   | LPAREN expr RPAREN
+                  | function_call
+                  | indexed_variable
                   | variable
         """
         token = self.current_token
-        if token.type == TokenType.PLUS:
-            self.eat(TokenType.PLUS)
+        if token.type in (TokenType.PLUS, TokenType.MINUS, TokenType.NOT):
+            self.eat(token.type)
             node = UnaryOp(token, self.factor())
+            if self.analyzer is not None:
+                self.analyzer.check_unary_op(node)
             return node
-        elif token.type == TokenType.MINUS:
-            self.eat(TokenType.MINUS)
-            node = UnaryOp(token, self.factor())
+        elif token.type in (TokenType.INTEGER_CONST, TokenType.REAL_CONST):
+            self.eat(token.type)
+            node = Num(token)
+            if self.analyzer is not None:
+                self.analyzer.resolve_num(node)
             return node
-        elif token.type == TokenType.INTEGER_CONST:
-            self.eat(TokenType.INTEGER_CONST)
-            return Num(token)
-        elif token.type == TokenType.REAL_CONST:
-            self.eat(TokenType.REAL_CONST)
-            return Num(token)
         elif token.type == TokenType.LPAREN:
             self.eat(TokenType.LPAREN)
             node = self.expr()
             self.eat(TokenType.RPAREN)
             return node
+        elif (token.type == TokenType.ID and
+              self.lexer.current_char == '('):
+            return self.function_call()
         else:
             node = self.variable()
+            if self.current_token.type == TokenType.LBRACKET:
+                return self.indexed_variable(node)
+            if self.analyzer is not None:
+                self.analyzer.resolve_var(node)
             return node
 
     def parse(self):
@@ -702,13 +1163,18 @@ class Parser(object):
 
         block : declarations compound_statement
 
-        declarations : (VAR (variable_declaration SEMI)+)? procedure_declaration*
+        declarations : (VAR (variable_declaration SEMI)+)?
+                       (procedure_declaration | function_declaration)*
 
-        variable_declaration : ID (COMMA ID)* COLON type_spec
+        variable_declaration : ID (COMMA ID)* COLON (type_spec | array_type)
 
         procedure_declaration :
              PROCEDURE ID (LPAREN formal_parameter_list RPAREN)? SEMI block SEMI
 
+        function_declaration :
+             FUNCTION ID (LPAREN formal_parameter_list RPAREN)?
+             COLON type_spec SEMI block SEMI
+
         formal_params_list : formal_parameters
                            | formal_parameters SEMI formal_parameter_list
 
@@ -716,6 +1182,10 @@ class Parser(object):
 
         type_spec : INTEGER | REAL
 
+        array_type : ARRAY LBRACKET bound RANGE bound RBRACKET OF type_spec
+
+        bound : MINUS? INTEGER_CONST
+
         compound_statement : BEGIN statement_list END
 
         statement_list : statement
@@ -724,25 +1194,47 @@ class Parser(object):
         statement : compound_statement
                   | proccall_statement
                   | assignment_statement
+                  | for_statement
+                  | if_statement
+                  | while_statement
                   | empty
 
         proccall_statement : ID LPAREN (expr (COMMA expr)*)? RPAREN
 
-        assignment_statement : variable ASSIGN expr
+        assignment_statement : (variable | indexed_variable) ASSIGN expr
+
+        for_statement : FOR variable ASSIGN expr (TO | DOWNTO) expr
+                        DO statement
+
+        if_statement : IF expr THEN statement (ELSE statement)?
+
+        while_statement : WHILE expr DO statement
 
         empty :
 
-        expr : term ((PLUS | MINUS) term)*
+        expr : simple_expression (relational_operator simple_expression)?
+
+        relational_operator : EQUAL | NOT_EQUAL | LESS | LESS_EQUAL
+                            | GREATER | GREATER_EQUAL
 
-        term : factor ((MUL | INTEGER_DIV | FLOAT_DIV) factor)*
+        simple_expression : term ((PLUS | MINUS | OR) term)*
+
+        term : factor ((MUL | INTEGER_DIV | FLOAT_DIV | AND) factor)*
 
         factor : PLUS factor
                | MINUS factor
+               | NOT factor
                | INTEGER_CONST
                | REAL_CONST
                | LPAREN expr RPAREN
+               | function_call
+               | indexed_variable
                | variable
 
+        function_call : ID LPAREN (expr (COMMA expr)*)? RPAREN
+
+        indexed_variable : variable LBRACKET expr RBRACKET
+
         variable: ID
         """
         node = self.program()
@@ -768,6 +1260,11 @@ class NodeVisitor(object):
         return visitor(node)
 
     def generic_visit(self, node):
+        # a node of a subclass, e.g. TempDecl, is visited like its base
+        for base in type(node).__mro__[1:]:
+            visitor = getattr(self, 'visit_' + base.__name__, None)
+            if visitor is not None:
+                return visitor(node)
         raise Exception('No visit_{} method'.format(type(node).__name__))
 
 
@@ -778,12 +1275,19 @@ class NodeVisitor(object):
 ###############################################################################
 
 class Symbol(object):
+    # Symbols are slotted and their names interned: a program with many
+    # declarations keeps a symbol per declaration alive, so their size
+    # matters, and a name's string is shared with every other use of it.
+    __slots__ = ('name', 'type')
+
     def __init__(self, name, type=None):
-        self.name = name
+        self.name = sys.intern(name)
         self.type = type
 
 
 class VarSymbol(Symbol):
+    __slots__ = ()
+
     def __init__(self, name, type):
         super().__init__(name, type)
 
@@ -797,7 +1301,16 @@ class VarSymbol(Symbol):
     __repr__ = __str__
 
 
+class ResultSymbol(VarSymbol):
+    """The variable of a function's scope that holds the function's
+    result. It has the function's name, so in the function's body the
+    name denotes the result, except in calls."""
+    __slots__ = ()
+
+
 class BuiltinTypeSymbol(Symbol):
+    __slots__ = ()
+
     def __init__(self, name):
         super().__init__(name)
 
@@ -810,11 +1323,73 @@ class BuiltinTypeSymbol(Symbol):
             name=self.name,
         )
 
+    def __reduce__(self):
+        # unpickle the builtin types as the process-wide singletons
+        return _builtin_type, (self.name,)
+
+
+# Builtin types are immutable, so every scope of every analysis run in
+# the process shares these symbols, and code can test a type with 'is'
+# instead of comparing names. BOOLEAN is the type of conditions only:
+# there are no BOOLEAN variables or constants.
+INTEGER_TYPE = BuiltinTypeSymbol('INTEGER')
+REAL_TYPE = BuiltinTypeSymbol('REAL')
+BOOLEAN_TYPE = BuiltinTypeSymbol('BOOLEAN')
+
+BUILTIN_TYPES = {
+    INTEGER_TYPE.name: INTEGER_TYPE,
+    REAL_TYPE.name: REAL_TYPE,
+    BOOLEAN_TYPE.name: BOOLEAN_TYPE,
+}
+
+
+def _builtin_type(name):
+    return BUILTIN_TYPES[name]
+
+
+class ArrayTypeSymbol(Symbol):
+    """The type of the variables declared ARRAY[low..high] OF
+    element_type.
+
+    The elements of such a variable live in an array.array of 64-bit
+    integers or doubles, one contiguous buffer instead of a list of
+    boxed numbers, so unlike INTEGER variables INTEGER elements are
+    limited to 64 bits: storing a larger value raises OverflowError.
+    """
+    __slots__ = ('element_type', 'low', 'high')
+
+    def __init__(self, element_type, low, high):
+        super().__init__(f'ARRAY[{low}..{high}] OF {element_type}')
+        self.element_type = element_type
+        self.low = low
+        self.high = high
+
+    @property
+    def typecode(self):
+        return 'q' if self.element_type is INTEGER_TYPE else 'd'
+
+    def allocate(self):
+        """Return a new array of the elements of a variable, zeros."""
+        # repeating a one-element array fills the buffer with memset
+        return array(self.typecode, (0,)) * (self.high - self.low + 1)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "<{class_name}(name='{name}')>".format(
+            class_name=self.__class__.__name__,
+            name=self.name,
+        )
+
 
 class ProcedureSymbol(Symbol):
+    __slots__ = ('params',)
+
     def __init__(self, name, params=None):
         super().__init__(name)
-        # a list of formal parameters
+        # a list of formal parameters while the procedure is being
+        # declared, a tuple once its declaration is complete
         self.params = params if params is not None else []
 
     def __str__(self):
@@ -827,6 +1402,182 @@ class ProcedureSymbol(Symbol):
     __repr__ = __str__
 
 
+class FunctionSymbol(ProcedureSymbol):
+    """A procedure symbol whose 'type' is the type of its result."""
+    __slots__ = ()
+
+    def __str__(self):
+        return (
+            '<{class_name}(name={name}, parameters={params}, type={type})>'
+        ).format(
+            class_name=self.__class__.__name__,
+            name=self.name,
+            params=self.params,
+            type=self.type,
+        )
+
+    __repr__ = __str__
+
+
+class BuiltinProcedureSymbol(ProcedureSymbol):
+    """A procedure every program can call without declaring it, run by
+    a Python function instead of a block.
+
+    'signature' has a letter per parameter: 'A' for an array the
+    procedure reads, 'D' for an array it assigns and 'V' for a number
+    stored into the elements of the first array. The arrays of a call
+    must have as many elements as the first one, and the elements of a
+    'D' array must be able to hold those of the other arrays.
+    """
+    __slots__ = ('signature', 'function')
+
+    def __init__(self, name, signature, function):
+        super().__init__(name, params=())
+        self.signature = signature
+        self.function = function
+
+    def __reduce__(self):
+        # unpickle the builtins as the process-wide singletons
+        return _builtin_procedure, (self.name,)
+
+
+class BuiltinFunctionSymbol(BuiltinProcedureSymbol, FunctionSymbol):
+    """A builtin whose result is INTEGER when the elements of all its
+    arrays are INTEGERs, else REAL."""
+    __slots__ = ()
+
+
+class OutputProcedureSymbol(BuiltinProcedureSymbol):
+    """A builtin writing to the OutputBuffer of the engine running the
+    program, whose function takes the OutputBuffer and the list of the
+    values of the arguments. Its signature is '*' for any number of
+    INTEGER, REAL and BOOLEAN arguments, or '' for none."""
+    __slots__ = ()
+
+
+# the pseudo-variable the output builtins assign in mod sets, so that a
+# function that writes isn't pure; no variable can have this name
+OUTPUT_CHANNEL = '(output)'
+
+
+# The array builtins each make a single pass over the buffers of the
+# arrays, in NumPy when it is installed. INTEGER results are exact: NumPy
+# computes them in 64 bits only when the magnitudes of the elements
+# prove that nothing overflows, and the elements of an array are 64-bit
+# anyway. REAL sums are NumPy's pairwise sums, which may differ from
+# the sums of a loop in the last bits.
+
+_INT64_LIMIT = 2 ** 63
+
+
+def _numpy_view(elements):
+    """Return a NumPy array sharing the buffer of an array.array."""
+    return np.frombuffer(
+        elements, dtype=np.int64 if elements.typecode == 'q' else np.float64
+    )
+
+
+def _magnitude(view):
+    """Return the largest absolute value of an INTEGER NumPy array."""
+    return max(-int(view.min()), int(view.max()))
+
+
+def _sum(elements):
+    if np is not None:
+        view = _numpy_view(elements)
+        if elements.typecode == 'd':
+            return float(view.sum())
+        if _magnitude(view) * len(view) < _INT64_LIMIT:
+            return int(view.sum())
+    return sum(elements)
+
+
+def _dot(left, right):
+    if np is not None:
+        left_view, right_view = _numpy_view(left), _numpy_view(right)
+        if left.typecode == right.typecode == 'q':
+            if (_magnitude(left_view) * _magnitude(right_view) *
+                    len(left_view) < _INT64_LIMIT):
+                return int(np.dot(left_view, right_view))
+        else:
+            return float(np.dot(left_view, right_view))
+    return sum(map(operator.mul, left, right))
+
+
+def _fill(elements, value):
+    if np is not None:
+        _numpy_view(elements).fill(value)
+    else:
+        elements[:] = array(elements.typecode, (value,)) * len(elements)
+
+
+def _copy(target, source):
+    if np is not None:
+        _numpy_view(target)[:] = _numpy_view(source)
+    elif target.typecode == source.typecode:
+        target[:] = source
+    else:
+        target[:] = array(target.typecode, source)
+
+
+def _scale(elements, factor):
+    if np is not None:
+        view = _numpy_view(elements)
+        if (elements.typecode == 'd' or
+                _magnitude(view) * abs(factor) < _INT64_LIMIT):
+            view *= factor
+            return
+    # raises OverflowError for an INTEGER element past 64 bits
+    elements[:] = array(
+        elements.typecode, [element * factor for element in elements]
+    )
+
+
+def _write(output, values):
+    output.write(values)
+
+
+def _writeln(output, values):
+    output.writeln(values)
+
+
+def _flush(output, values):
+    output.flush()
+
+
+BUILTIN_PROCEDURES = {
+    symbol.name: symbol for symbol in (
+        BuiltinFunctionSymbol('SUM', 'A', _sum),
+        BuiltinFunctionSymbol('DOT', 'AA', _dot),
+        BuiltinProcedureSymbol('FILL', 'DV', _fill),
+        BuiltinProcedureSymbol('COPY', 'DA', _copy),
+        BuiltinProcedureSymbol('SCALE', 'DV', _scale),
+        OutputProcedureSymbol('WRITE', '*', _write),
+        OutputProcedureSymbol('WRITELN', '*', _writeln),
+        OutputProcedureSymbol('FLUSH', '', _flush),
+    )
+}
+
+
+def _builtin_procedure(name):
+    return BUILTIN_PROCEDURES[name]
+
+
+class LoopBounds(object):
+    """The constant bounds of a FOR loop SemanticAnalyzer is in, and the
+    Index nodes of its body whose indices are in the bounds of their
+    arrays as long as the loop's control variable stays in the loop's
+    bounds, which it does unless the body calls a procedure or a
+    function."""
+    __slots__ = ('low', 'high', 'calls', 'indices')
+
+    def __init__(self, low, high, calls):
+        self.low = low
+        self.high = high
+        self.calls = calls  # SemanticAnalyzer.calls before the body
+        self.indices = []
+
+
 class ScopedSymbolTable(object):
     def __init__(self, scope_name, scope_level, enclosing_scope=None):
         self._symbols = {}
@@ -835,8 +1586,25 @@ class ScopedSymbolTable(object):
         self.enclosing_scope = enclosing_scope
 
     def _init_builtins(self):
-        self.insert(BuiltinTypeSymbol('INTEGER'))
-        self.insert(BuiltinTypeSymbol('REAL'))
+        for type_symbol in BUILTIN_TYPES.values():
+            self.insert(type_symbol)
+
+    def snapshot(self):
+        """Return a copy of the scope chain as it is now.
+
+        Symbols inserted into the original tables later on don't show up
+        in the copy, which makes it safe to ship to another process.
+        """
+        enclosing_scope = None
+        if self.enclosing_scope is not None:
+            enclosing_scope = self.enclosing_scope.snapshot()
+        scope = ScopedSymbolTable(
+            scope_name=self.scope_name,
+            scope_level=self.scope_level,
+            enclosing_scope=enclosing_scope,
+        )
+        scope._symbols = dict(self._symbols)
+        return scope
 
     def __str__(self):
         h1 = 'SCOPE (SCOPED SYMBOL TABLE)'
@@ -886,8 +1654,39 @@ class ScopedSymbolTable(object):
 
 
 class SemanticAnalyzer(NodeVisitor):
-    def __init__(self):
+    """Walks the AST, builds the scoped symbol tables and annotates the
+    tree: Var nodes get their 'symbol', expression nodes their static
+    'type', ProcedureDecl and ProcedureCall nodes, FunctionDecl and
+    FunctionCall nodes included, their 'proc_symbol', ArrayType nodes
+    the 'symbol' of the type. Index nodes get the 'low' and 'high'
+    bounds of their arrays and lose their bounds check, 'checked', when
+    the index is a constant or the control variable of a FOR loop with
+    constant bounds, plus or minus a constant, and it can't leave the
+    bounds of the array. A constant index out of the bounds is an
+    error.
+
+    The work done for each kind of node is split into small steps
+    (enter_*/leave_scope/declare_*/resolve_*/check_*) that expect the
+    children of the node to be analyzed already. The visit_* methods
+    below drive them over a complete tree; Parser drives the very same
+    steps while it builds the tree when it's given an analyzer (see the
+    '--single-pass' command line option).
+
+    With a concurrent.futures executor, the procedures declared in the
+    program block of a parsed program are analyzed in batches by the
+    executor's workers, see visit_procedures_in_parallel.
+    """
+    def __init__(self, executor=None, batch_size=None):
         self.current_scope = None
+        self.executor = executor
+        # number of sibling procedures shipped to a worker in one task
+        self.batch_size = batch_size
+        self.source = None  # Program.source of the tree being analyzed
+        # the symbols of the control variables of the enclosing FORs
+        self.loop_variables = []
+        # LoopBounds of the enclosing FORs, None if not constant
+        self.loop_bounds = []
+        self.calls = 0  # the number of calls analyzed
 
     def log(self, msg):
         if _SHOULD_LOG_SCOPE:
@@ -900,43 +1699,31 @@ class SemanticAnalyzer(NodeVisitor):
             message=f'{error_code.value} -> {token}',
         )
 
-    def visit_Block(self, node):
-        for declaration in node.declarations:
-            self.visit(declaration)
-        self.visit(node.compound_statement)
+    # Steps shared by the tree walker and the single-pass parser
 
-    def visit_Program(self, node):
+    def enter_program(self):
+        # the builtin procedures are in a scope of their own, enclosing
+        # the program's, so the program may declare their names
+        builtins_scope = ScopedSymbolTable(
+            scope_name='builtins',
+            scope_level=0,
+        )
+        for proc_symbol in BUILTIN_PROCEDURES.values():
+            builtins_scope.insert(proc_symbol)
         self.log('ENTER scope: global')
         global_scope = ScopedSymbolTable(
             scope_name='global',
             scope_level=1,
-            enclosing_scope=self.current_scope,  # None
+            enclosing_scope=builtins_scope,
         )
         global_scope._init_builtins()
         self.current_scope = global_scope
 
-        # visit subtree
-        self.visit(node.block)
-
-        self.log(global_scope)
-
-        self.current_scope = self.current_scope.enclosing_scope
-        self.log('LEAVE scope: global')
-
-    def visit_Compound(self, node):
-        for child in node.children:
-            self.visit(child)
-
-    def visit_NoOp(self, node):
-        pass
-
-    def visit_BinOp(self, node):
-        self.visit(node.left)
-        self.visit(node.right)
-
-    def visit_ProcedureDecl(self, node):
-        proc_name = node.proc_name
-        proc_symbol = ProcedureSymbol(proc_name)
+    def enter_procedure(self, proc_name, symbol_class=ProcedureSymbol):
+        """Insert a procedure symbol, or a symbol_class symbol, into the
+        current scope and open the scope for its parameters and local
+        variables."""
+        proc_symbol = symbol_class(proc_name)
         self.current_scope.insert(proc_symbol)
 
         self.log(f'ENTER scope: {proc_name}')
@@ -947,25 +1734,70 @@ class SemanticAnalyzer(NodeVisitor):
             enclosing_scope=self.current_scope
         )
         self.current_scope = procedure_scope
+        return proc_symbol
+
+    def leave_scope(self):
+        scope = self.current_scope
+        self.log(scope)
 
+        self.current_scope = scope.enclosing_scope
+        self.log(f'LEAVE scope: {scope.scope_name}')
+
+    def declare_params(self, proc_symbol, params):
         # Insert parameters into the procedure scope
-        for param in node.params:
+        for param in params:
             param_type = self.current_scope.lookup(param.type_node.value)
             param_name = param.var_node.value
             var_symbol = VarSymbol(param_name, param_type)
             self.current_scope.insert(var_symbol)
             proc_symbol.params.append(var_symbol)
+        # the parameter list is complete
+        proc_symbol.params = tuple(proc_symbol.params)
+
+    def declare_result(self, func_symbol, type_node, token):
+        """Give a function symbol its result type and declare the result
+        variable in the function's scope, after the parameters."""
+        func_symbol.type = self.current_scope.lookup(type_node.value)
+        if self.current_scope.lookup(
+                func_symbol.name, current_scope_only=True):
+            self.error(error_code=ErrorCode.DUPLICATE_ID, token=token)
+        self.current_scope.insert(
+            ResultSymbol(func_symbol.name, func_symbol.type)
+        )
 
-        self.visit(node.block_node)
-
-        self.log(procedure_scope)
-
-        self.current_scope = self.current_scope.enclosing_scope
-        self.log(f'LEAVE scope: {proc_name}')
+    def enter_declaration(self, node):
+        """Declare the procedure or function of a ProcedureDecl or
+        FunctionDecl and its parameters, and open its scope."""
+        if isinstance(node, FunctionDecl):
+            proc_symbol = self.enter_procedure(node.proc_name, FunctionSymbol)
+            self.declare_params(proc_symbol, node.params)
+            self.declare_result(proc_symbol, node.return_type, node.token)
+        else:
+            proc_symbol = self.enter_procedure(node.proc_name)
+            self.declare_params(proc_symbol, node.params)
+        return proc_symbol
+
+    def declare_array_type(self, node):
+        """Return the symbol of an ArrayType node, shared by the
+        variables declared with it."""
+        symbol = getattr(node, 'symbol', None)
+        if symbol is None:
+            if node.low > node.high:
+                self.error(error_code=ErrorCode.EMPTY_ARRAY, token=node.token)
+            element_type = self.current_scope.lookup(
+                node.element_type_node.value
+            )
+            symbol = node.symbol = ArrayTypeSymbol(
+                element_type, node.low, node.high
+            )
+        return symbol
 
-    def visit_VarDecl(self, node):
-        type_name = node.type_node.value
-        type_symbol = self.current_scope.lookup(type_name)
+    def declare_var(self, node):
+        if isinstance(node.type_node, ArrayType):
+            type_symbol = self.declare_array_type(node.type_node)
+        else:
+            type_name = node.type_node.value
+            type_symbol = self.current_scope.lookup(type_name)
 
         # We have all the information we need to create a variable symbol.
         # Create the symbol and insert it into the symbol table.
@@ -982,106 +1814,5516 @@ class SemanticAnalyzer(NodeVisitor):
 
         self.current_scope.insert(var_symbol)
 
-    def visit_Assign(self, node):
-        # right-hand side
-        self.visit(node.right)
-        # left-hand side
-        self.visit(node.left)
-
-    def visit_Var(self, node):
+    def resolve_var(self, node):
         var_name = node.value
         var_symbol = self.current_scope.lookup(var_name)
         if var_symbol is None:
             self.error(error_code=ErrorCode.ID_NOT_FOUND, token=node.token)
+        if not isinstance(var_symbol, VarSymbol):
+            # e.g. a procedure name used as a value
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=node.token)
+
+        node.symbol = var_symbol
+        node.type = var_symbol.type
+        return node.type
+
+    def check_index(self, node):
+        array_type = self.resolve_var(node.var_node)
+        if not isinstance(array_type, ArrayTypeSymbol):
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=node.token)
+        if node.index.type is not INTEGER_TYPE:
+            self.error(
+                error_code=ErrorCode.TYPE_MISMATCH, token=node.index.token
+            )
+        node.low = array_type.low
+        node.high = array_type.high
+        node.type = array_type.element_type
+
+        bounds = self.index_bounds(node.index)
+        if bounds is not None:
+            low, high, loop = bounds
+            if loop is None and not node.low <= low <= node.high:
+                self.error(
+                    error_code=ErrorCode.INDEX_OUT_OF_RANGE,
+                    token=node.index.token,
+                )
+            if node.low <= low and high <= node.high:
+                if loop is None:
+                    node.checked = False
+                else:
+                    loop.indices.append(node)
+        return node.type
+
+    @staticmethod
+    def constant_index(node):
+        """Return the value of an INTEGER constant, signed or not, else
+        None."""
+        if isinstance(node, UnaryOp) and node.op.type in (
+                TokenType.PLUS, TokenType.MINUS):
+            value = SemanticAnalyzer.constant_index(node.expr)
+            if value is None or node.op.type == TokenType.PLUS:
+                return value
+            return -value
+        if isinstance(node, Num) and node.type is INTEGER_TYPE:
+            return node.value
+        return None
+
+    def index_bounds(self, node):
+        """Return (low, high, LoopBounds or None) for an index that
+        stays between low and high while the loop of the LoopBounds
+        runs, or always when it is None; None for any other index.
+
+        A control variable keeps to its loop's bounds because nothing in
+        the body assigns it, a nested FOR on it included (see enter_for),
+        but a call, which leave_for accounts for."""
+        value = self.constant_index(node)
+        if value is not None:
+            return value, value, None
+        if isinstance(node, Var):
+            for symbol, loop in zip(self.loop_variables, self.loop_bounds):
+                if symbol is node.symbol and loop is not None:
+                    return loop.low, loop.high, loop
+            return None
+        if (isinstance(node, BinOp) and
+                node.op.type in (TokenType.PLUS, TokenType.MINUS) and
+                isinstance(node.right, Num)):
+            bounds = self.index_bounds(node.left)
+            if bounds is None or bounds[2] is None:
+                # constant indices are folded later on
+                return None
+            low, high, loop = bounds
+            offset = node.right.value
+            if node.op.type == TokenType.MINUS:
+                offset = -offset
+            return low + offset, high + offset, loop
+        return None
+
+    def resolve_num(self, node):
+        if node.token.type == TokenType.INTEGER_CONST:
+            node.type = INTEGER_TYPE
+        else:
+            node.type = REAL_TYPE
+        return node.type
 
-    def visit_Num(self, node):
+    def check_numeric(self, node):
+        # neither a condition nor a whole array
+        if node.type is not INTEGER_TYPE and node.type is not REAL_TYPE:
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=node.token)
+
+    def check_boolean(self, node):
+        if node.type is not BOOLEAN_TYPE:
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=node.token)
+
+    def check_unary_op(self, node):
+        if node.op.type == TokenType.NOT:
+            self.check_boolean(node.expr)
+        else:
+            self.check_numeric(node.expr)
+        node.type = node.expr.type
+        return node.type
+
+    def check_bool_op(self, node):
+        self.check_boolean(node.left)
+        self.check_boolean(node.right)
+        node.type = BOOLEAN_TYPE
+        return node.type
+
+    def check_condition(self, node):
+        """The condition of an IF or a WHILE must be a BOOLEAN."""
+        self.check_boolean(node)
+
+    def check_bin_op(self, node):
+        left_type = node.left.type
+        right_type = node.right.type
+        op = node.op.type
+
+        # comparisons and arithmetic are defined for numbers only
+        self.check_numeric(node.left)
+        self.check_numeric(node.right)
+
+        if op in RELATIONAL_OPERATORS:
+            node.type = BOOLEAN_TYPE
+        elif op == TokenType.INTEGER_DIV:
+            # DIV is defined for INTEGER operands only
+            for operand_type in (left_type, right_type):
+                if operand_type is not INTEGER_TYPE:
+                    self.error(
+                        error_code=ErrorCode.TYPE_MISMATCH,
+                        token=node.token,
+                    )
+            node.type = INTEGER_TYPE
+        elif op == TokenType.FLOAT_DIV:
+            # '/' always produces a REAL, even for INTEGER operands
+            node.type = REAL_TYPE
+        elif left_type is INTEGER_TYPE and right_type is INTEGER_TYPE:
+            node.type = INTEGER_TYPE
+        else:
+            node.type = REAL_TYPE
+
+        return node.type
+
+    def check_assignable(self, var_type, expr_type, token):
+        """Signal an error if a value of expr_type can't be stored in
+        a variable of var_type. INTEGER values widen to REAL, but a REAL
+        value never narrows to INTEGER implicitly, and there are no
+        BOOLEAN variables. Arrays are neither stored nor assigned as a
+        whole.
+        """
+        if (expr_type is not INTEGER_TYPE and expr_type is not REAL_TYPE or
+                var_type is not REAL_TYPE and expr_type is not var_type):
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=token)
+
+    def check_assign(self, node):
+        if isinstance(node.left, Index):
+            # an element, analyzed before the right-hand side
+            self.check_assignable(
+                node.left.type, node.right.type, node.token
+            )
+            return
+        # the right-hand side has been analyzed, resolve the left-hand side
+        var_type = self.resolve_var(node.left)
+        self.check_assignable(var_type, node.right.type, node.token)
+        if node.left.symbol in self.loop_variables:
+            self.error(
+                error_code=ErrorCode.FOR_VAR_ASSIGNED,
+                token=node.left.token,
+            )
+
+    def enter_for(self, node):
+        """Check the control variable and the bounds of a For node, whose
+        bounds have been analyzed, before its body is analyzed: they
+        must all be INTEGERs, and the body mustn't assign the variable,
+        which a FOR on the variable in the body of another one does.
+        """
+        if self.resolve_var(node.var_node) is not INTEGER_TYPE:
+            self.error(
+                error_code=ErrorCode.TYPE_MISMATCH,
+                token=node.var_node.token,
+            )
+        if node.var_node.symbol in self.loop_variables:
+            self.error(
+                error_code=ErrorCode.FOR_VAR_ASSIGNED,
+                token=node.var_node.token,
+            )
+        for bound in (node.start, node.stop):
+            if bound.type is not INTEGER_TYPE:
+                self.error(
+                    error_code=ErrorCode.TYPE_MISMATCH, token=bound.token
+                )
+        self.loop_variables.append(node.var_node.symbol)
+        bounds = None
+        low = self.constant_index(node.start)
+        high = self.constant_index(node.stop)
+        if low is not None and high is not None:
+            if node.downto:
+                low, high = high, low
+            bounds = LoopBounds(low, high, self.calls)
+        self.loop_bounds.append(bounds)
+
+    def leave_for(self):
+        self.loop_variables.pop()
+        bounds = self.loop_bounds.pop()
+        # a call may assign the control variable
+        if bounds is not None and bounds.calls == self.calls:
+            for index_node in bounds.indices:
+                index_node.checked = False
+
+    def lookup_procedure(self, name):
+        """Return the symbol a name denotes in a call: the result
+        variable of a function doesn't hide the function itself."""
+        scope = self.current_scope
+        while scope is not None:
+            symbol = scope.lookup(name, current_scope_only=True)
+            if symbol is not None and not isinstance(symbol, ResultSymbol):
+                return symbol
+            scope = scope.enclosing_scope
+        return None
+
+    def check_proc_call(self, node):
+        self.check_call(node, is_function=False)
+
+    def check_function_call(self, node):
+        node.type = self.check_call(node, is_function=True)
+        return node.type
+
+    def check_call(self, node, is_function):
+        """Check a call and return the type of the function's result."""
+        proc_symbol = self.lookup_procedure(node.proc_name)
+        if not isinstance(proc_symbol, ProcedureSymbol):
+            self.error(error_code=ErrorCode.ID_NOT_FOUND, token=node.token)
+        if isinstance(proc_symbol, FunctionSymbol) != is_function:
+            # a procedure has no value, and a function's value is used
+            self.error(error_code=ErrorCode.TYPE_MISMATCH, token=node.token)
+        node.proc_symbol = proc_symbol
+        if isinstance(proc_symbol, OutputProcedureSymbol):
+            return self.check_output_call(node)
+        if isinstance(proc_symbol, BuiltinProcedureSymbol):
+            # a builtin assigns no variable but its 'D' arrays
+            return self.check_builtin_call(node)
+        self.calls += 1
+
+        formal_params = proc_symbol.params
+        actual_params = node.actual_params
+
+        if len(actual_params) != len(formal_params):
+            self.error(
+                error_code=ErrorCode.WRONG_PARAMS_NUM,
+                token=node.token,
+            )
+
+        for param_symbol, param_node in zip(formal_params, actual_params):
+            self.check_assignable(
+                param_symbol.type, param_node.type, param_node.token
+            )
+        return proc_symbol.type
+
+    def check_builtin_call(self, node):
+        signature = node.proc_symbol.signature
+        actual_params = node.actual_params
+        if len(actual_params) != len(signature):
+            self.error(
+                error_code=ErrorCode.WRONG_PARAMS_NUM,
+                token=node.token,
+            )
+
+        first = actual_params[0].type
+        result_type = INTEGER_TYPE
+        for kind, param_node in zip(signature, actual_params):
+            if kind == 'V':
+                self.check_assignable(
+                    first.element_type, param_node.type, param_node.token
+                )
+                continue
+            # an array is passed by the name of its variable
+            array_type = param_node.type
+            if not (isinstance(param_node, Var) and
+                    isinstance(array_type, ArrayTypeSymbol) and
+                    array_type.high - array_type.low ==
+                    first.high - first.low):
+                self.error(
+                    error_code=ErrorCode.TYPE_MISMATCH,
+                    token=param_node.token,
+                )
+            if signature[0] == 'D':
+                self.check_assignable(
+                    first.element_type, array_type.element_type,
+                    param_node.token,
+                )
+            if array_type.element_type is not INTEGER_TYPE:
+                result_type = REAL_TYPE
+        return result_type
+
+    def check_output_call(self, node):
+        if node.proc_symbol.signature == '' and node.actual_params:
+            self.error(
+                error_code=ErrorCode.WRONG_PARAMS_NUM,
+                token=node.token,
+            )
+        for param_node in node.actual_params:
+            if (param_node.type is not INTEGER_TYPE and
+                    param_node.type is not REAL_TYPE and
+                    param_node.type is not BOOLEAN_TYPE):
+                self.error(
+                    error_code=ErrorCode.TYPE_MISMATCH,
+                    token=param_node.token,
+                )
+        return None
+
+    # Tree walker
+
+    def visit_Block(self, node):
+        # a tree built by hand has no source to ship to the workers
+        if (self.executor is not None and self.source is not None and
+                self.current_scope.scope_level == 1):
+            self.visit_procedures_in_parallel(node.declarations)
+        else:
+            for declaration in node.declarations:
+                self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_procedures_in_parallel(self, declarations):
+        """Analyze sibling declarations, shipping procedures to the
+        executor.
+
+        The body of a procedure only reads from its enclosing scopes, and
+        those never change after the declarations before it have been
+        processed. Each batch of consecutive procedures therefore goes to
+        a worker with a snapshot of the scope taken just before the first
+        procedure of the batch. The worker inserts the procedure symbols
+        of the batch as it goes, exactly like the sequential analyzer.
+        Meanwhile this process only declares the procedure symbols and
+        their parameters, which is all the rest of the block needs.
+
+        A batch goes out as the source text of its declarations, which
+        the worker parses again: that's a fraction of the size of their
+        pickled nodes, and of the time it takes to pickle them here.
+        Workers send back the annotated ProcedureDecl nodes, which replace
+        the original ones in 'declarations', with the symbols of the
+        scopes they were given pickled as references to the symbols of
+        this process. Errors are merged in source order, so the
+        SemanticError raised is the one the sequential analyzer would
+        raise first.
+        """
+        procedure_count = sum(
+            isinstance(declaration, ProcedureDecl)
+            for declaration in declarations
+        )
+        batch_size = self.batch_size or max(
+            1, procedure_count // (4 * (os.cpu_count() or 1))
+        )
+
+        tasks = []  # (index of the first declaration, future)
+        batch = []  # (text, lineno, column) of each declaration
+        batch_start = None
+        scope = None
+        error = None
+        for index, declaration in enumerate(declarations):
+            if not isinstance(declaration, ProcedureDecl):
+                try:
+                    self.visit(declaration)
+                except SemanticError as e:
+                    error = e
+                    break
+                continue
+
+            if not batch:
+                batch_start = index
+                scope = self.current_scope.snapshot()
+            start, end, lineno, column = declaration.span
+            batch.append((self.source[start:end], lineno, column))
+            if len(batch) == batch_size:
+                tasks.append((batch_start, self.executor.submit(
+                    _analyze_procedures, scope, batch
+                )))
+                batch = []
+
+            try:
+                proc_symbol = self.enter_declaration(declaration)
+            except SemanticError as e:
+                # the declaration's batch reports any earlier error
+                error = e
+                break
+            self.leave_scope()
+            declaration.proc_symbol = proc_symbol
+
+        if batch:
+            tasks.append((batch_start, self.executor.submit(
+                _analyze_procedures, scope, batch
+            )))
+
+        # collect the results in source order; every batch before a
+        # failed declaration needs to be checked for an earlier error
+        for batch_start, future in tasks:
+            data = future.result()
+            with _gc_paused():
+                decl_nodes, batch_error = _ScopeUnpickler(
+                    io.BytesIO(data), self.current_scope
+                ).load()
+            if batch_error is not None:
+                error_code, token, message = batch_error
+                raise SemanticError(
+                    error_code=error_code,
+                    token=token,
+                    message=message,
+                )
+            if error is None:
+                for offset, decl_node in enumerate(decl_nodes):
+                    # the worker parsed a slice of the source
+                    decl_node.span = declarations[batch_start + offset].span
+                declarations[batch_start:batch_start + len(decl_nodes)] = (
+                    decl_nodes
+                )
+
+        if error is not None:
+            raise error
+
+    def visit_Program(self, node):
+        self.source = node.source
+        self.enter_program()
+        # visit subtree
+        self.visit(node.block)
+        self.leave_scope()
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        return self.check_bin_op(node)
+
+    def visit_ProcedureDecl(self, node):
+        node.proc_symbol = self.enter_declaration(node)
+
+        self.visit(node.block_node)
+
+        self.leave_scope()
+
+    def visit_VarDecl(self, node):
+        self.declare_var(node)
+
+    def visit_Assign(self, node):
+        if isinstance(node.left, Index):
+            # the element, in the order the parser analyzes it
+            self.visit(node.left)
+        # right-hand side
+        self.visit(node.right)
+        # left-hand side
+        self.check_assign(node)
+
+    def visit_Index(self, node):
+        self.visit(node.index)
+        return self.check_index(node)
+
+    def visit_For(self, node):
+        self.visit(node.start)
+        self.visit(node.stop)
+        self.enter_for(node)
+        self.visit(node.body)
+        self.leave_for()
+
+    def visit_If(self, node):
+        self.visit(node.condition)
+        self.check_condition(node.condition)
+        self.visit(node.then_branch)
+        if node.else_branch is not None:
+            self.visit(node.else_branch)
+
+    def visit_While(self, node):
+        self.visit(node.condition)
+        self.check_condition(node.condition)
+        self.visit(node.body)
+
+    def visit_BoolOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        return self.check_bool_op(node)
+
+    def visit_Var(self, node):
+        return self.resolve_var(node)
+
+    def visit_Num(self, node):
+        return self.resolve_num(node)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+        return self.check_unary_op(node)
+
+    def visit_ProcedureCall(self, node):
+        for param_node in node.actual_params:
+            self.visit(param_node)
+        self.check_proc_call(node)
+
+    def visit_FunctionCall(self, node):
+        for param_node in node.actual_params:
+            self.visit(param_node)
+        return self.check_function_call(node)
+
+
+def _analyze_procedures(scope, sources):
+    """Parse and analyze a batch of sibling procedures in a worker process.
+
+    'sources' holds the text of each declaration with the line and the
+    column it starts at. Return the annotated nodes and None, or the
+    nodes analyzed before the first error and the error's (error_code,
+    token, message), pickled by a _ScopePickler.
+    """
+    semantic_analyzer = SemanticAnalyzer()
+    semantic_analyzer.current_scope = scope
+    decl_nodes = []
+    error = None
+    with _gc_paused():
+        for text, lineno, column in sources:
+            parser = Parser(Lexer(text, lineno, column))
+            if parser.current_token.type == TokenType.PROCEDURE:
+                decl_node = parser.procedure_declaration()
+            else:
+                decl_node = parser.function_declaration()
+            try:
+                semantic_analyzer.visit(decl_node)
+            except SemanticError as e:
+                error = (e.error_code, e.token, e.message)
+                break
+            decl_nodes.append(decl_node)
+        file = io.BytesIO()
+        _ScopePickler(file, scope).dump((decl_nodes, error))
+    return file.getvalue()
+
+
+def _scope_symbol(scope_level, name):
+    # stands for a symbol in a pickle; only a _ScopeUnpickler loads it
+    raise pickle.UnpicklingError(
+        f'reference to symbol {name!r} of scope level {scope_level}'
+    )
+
+
+def _symbol_classes(cls=Symbol):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _symbol_classes(subclass)
+
+
+class _ScopePickler(pickle.Pickler):
+    """Pickles the symbols of a scope chain as references by scope level
+    and name, which a _ScopeUnpickler loads as the symbols of its own
+    scope chain.
+
+    A worker gets copies of the symbols of the enclosing scopes. Pickled
+    by value, the calls and the variables of the bodies it sends back
+    would refer to those copies instead of the declarations of the
+    process that receives them.
+    """
+    def __init__(self, file, scope):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.references = {}  # id(symbol) -> (scope_level, name)
+        while scope is not None:
+            for name, symbol in scope._symbols.items():
+                self.references[id(symbol)] = (scope.scope_level, name)
+            scope = scope.enclosing_scope
+        # only symbols go through reduce_symbol, unlike persistent_id,
+        # which costs a Python call for every object pickled
+        self.dispatch_table = dict.fromkeys(
+            _symbol_classes(), self.reduce_symbol
+        )
+
+    def reduce_symbol(self, symbol):
+        reference = self.references.get(id(symbol))
+        if reference is None:
+            return symbol.__reduce_ex__(pickle.HIGHEST_PROTOCOL)
+        return _scope_symbol, reference
+
+
+class _ScopeUnpickler(pickle.Unpickler):
+    def __init__(self, file, scope):
+        super().__init__(file)
+        self.scope = scope
+
+    def find_class(self, module, name):
+        if name == '_scope_symbol':
+            return self.scope_symbol
+        return super().find_class(module, name)
+
+    def scope_symbol(self, scope_level, name):
+        scope = self.scope
+        while scope.scope_level != scope_level:
+            scope = scope.enclosing_scope
+        # None for a procedure this process didn't declare because of an
+        # earlier error, which discards the nodes anyway
+        return scope._symbols.get(name)
+
+
+###############################################################################
+#                                                                             #
+#  OPTIMIZER                                                                  #
+#                                                                             #
+###############################################################################
+
+class NodeTransformer(NodeVisitor):
+    """Walks an analyzed tree and replaces nodes.
+
+    Every visit method returns the node to put in place of the visited
+    one, by default the node itself after its children are transformed.
+    Subclasses override the methods of the nodes they rewrite.
+    """
+    def visit_Program(self, node):
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_Block(self, node):
+        node.declarations = [self.visit(decl) for decl in node.declarations]
+        node.compound_statement = self.visit(node.compound_statement)
+        return node
+
+    def visit_VarDecl(self, node):
+        return node
+
+    def visit_ProcedureDecl(self, node):
+        node.block_node = self.visit(node.block_node)
+        return node
+
+    def visit_Compound(self, node):
+        node.children = [self.visit(child) for child in node.children]
+        return node
+
+    def visit_Assign(self, node):
+        if isinstance(node.left, Index):
+            node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_For(self, node):
+        node.start = self.visit(node.start)
+        node.stop = self.visit(node.stop)
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_If(self, node):
+        node.condition = self.visit(node.condition)
+        node.then_branch = self.visit(node.then_branch)
+        if node.else_branch is not None:
+            node.else_branch = self.visit(node.else_branch)
+        return node
+
+    def visit_While(self, node):
+        node.condition = self.visit(node.condition)
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_ProcedureCall(self, node):
+        node.actual_params = [
+            self.visit(param_node) for param_node in node.actual_params
+        ]
+        return node
+
+    def visit_NoOp(self, node):
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_BoolOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_Num(self, node):
+        return node
+
+    def visit_Var(self, node):
+        return node
+
+    def visit_Index(self, node):
+        # the array itself is no value to transform
+        node.index = self.visit(node.index)
+        return node
+
+    def visit_TempStore(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_TempLoad(self, node):
+        return node
+
+
+def make_num(value, type, token):
+    """Return an analyzed Num node for a value computed at compile time,
+    placed at the position of token."""
+    token_type = (
+        TokenType.INTEGER_CONST if type is INTEGER_TYPE
+        else TokenType.REAL_CONST
+    )
+    node = Num(Token(token_type, value, token.lineno, token.column))
+    node.type = type
+    return node
+
+
+class ConstantFolder(NodeTransformer):
+    """Replaces the BinOp and UnaryOp subtrees whose operands are all
+    constants with Num nodes.
+
+    The values are computed by the same operator functions the engines
+    use, so DIV floors like the interpreter's // and '/' yields a REAL
+    for INTEGER operands too. Division by a constant zero is reported as
+    a SemanticError instead of failing when the program runs, unless it
+    is in a branch of an IF, the body of a WHILE, the body of a FOR whose
+    bounds aren't constants it runs between or the right operand of AND
+    or OR, which may never run: it is left for the run time there.
+    So is an array index folded into a constant out of the array's
+    bounds; in the bounds, the index loses its bounds check.
+
+    There are no BOOLEAN constants, so comparisons aren't folded into Num
+    nodes. Instead an IF whose condition compares constants is replaced
+    by the branch it takes, and a WHILE whose condition is false by a
+    NoOp.
+    """
+    def __init__(self):
+        self.folded = 0  # the number of nodes replaced
+        self.conditional = 0  # > 0 in code that may not run
+
+    def visit_conditional(self, node):
+        self.conditional += 1
+        node = self.visit(node)
+        self.conditional -= 1
+        return node
+
+    def condition_value(self, node):
+        """Return the value of a condition of constants, None if it
+        depends on a variable or a call."""
+        if isinstance(node, BinOp):
+            if isinstance(node.left, Num) and isinstance(node.right, Num):
+                return node.function(node.left.value, node.right.value)
+        elif isinstance(node, UnaryOp):
+            value = self.condition_value(node.expr)
+            if value is not None:
+                return not value
+        elif isinstance(node, BoolOp):
+            value = self.condition_value(node.left)
+            if value == node.short_circuit:
+                return value
+            if value is not None:
+                return self.condition_value(node.right)
+        return None
+
+    def taken_branch(self, node):
+        """Return the statement an If with a visited condition always
+        runs, a NoOp if none, or None if the condition isn't constant."""
+        value = self.condition_value(node.condition)
+        if value is None:
+            return None
+        self.folded += 1
+        branch = node.then_branch if value else node.else_branch
+        return NoOp() if branch is None else branch
+
+    def visit_If(self, node):
+        node.condition = self.visit(node.condition)
+        branch = self.taken_branch(node)
+        if branch is not None:
+            return self.visit(branch)
+        node.then_branch = self.visit_conditional(node.then_branch)
+        if node.else_branch is not None:
+            node.else_branch = self.visit_conditional(node.else_branch)
+        return node
+
+    def visit_While(self, node):
+        node.condition = self.visit(node.condition)
+        if self.condition_value(node.condition) is False:
+            self.folded += 1
+            return NoOp()
+        node.body = self.visit_conditional(node.body)
+        return node
+
+    def visit_For(self, node):
+        node.start = self.visit(node.start)
+        node.stop = self.visit(node.stop)
+        node.body = self.visit_for_body(node)
+        return node
+
+    def visit_for_body(self, node):
+        """Visit the body of a For with visited bounds, as code that may
+        not run unless the bounds are constants the loop runs between."""
+        start, stop = node.start, node.stop
+        if isinstance(start, Num) and isinstance(stop, Num):
+            if node.downto:
+                runs = start.value >= stop.value
+            else:
+                runs = start.value <= stop.value
+            if runs:
+                return self.visit(node.body)
+        return self.visit_conditional(node.body)
+
+    def visit_BoolOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit_conditional(node.right)
+        return node
+
+    def error(self, error_code, token):
+        raise SemanticError(
+            error_code=error_code,
+            token=token,
+            message=f'{error_code.value} -> {token}',
+        )
+
+    def visit_BinOp(self, node):
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        op = node.op.type
+        if (op in (TokenType.INTEGER_DIV, TokenType.FLOAT_DIV) and
+                isinstance(node.right, Num) and node.right.value == 0):
+            if self.conditional:
+                return node
+            self.error(error_code=ErrorCode.DIVISION_BY_ZERO, token=node.token)
+        if not (isinstance(node.left, Num) and isinstance(node.right, Num)):
+            return node
+        if node.type is BOOLEAN_TYPE:
+            return node
+
+        value = node.function(node.left.value, node.right.value)
+        self.folded += 1
+        return make_num(value, node.type, node.token)
+
+    def visit_UnaryOp(self, node):
+        node.expr = self.visit(node.expr)
+        if not isinstance(node.expr, Num):
+            return node
+
+        value = node.function(node.expr.value)
+        self.folded += 1
+        return make_num(value, node.type, node.token)
+
+    def visit_Index(self, node):
+        node.index = self.visit(node.index)
+        if node.checked and isinstance(node.index, Num):
+            if node.low <= node.index.value <= node.high:
+                node.checked = False
+            elif not self.conditional:
+                self.error(
+                    error_code=ErrorCode.INDEX_OUT_OF_RANGE,
+                    token=node.index.token,
+                )
+        return node
+
+
+def expression_names(node):
+    """Return the set of the names of the variables an expression reads,
+    not counting the reads of the functions it calls."""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Var):
+            names.add(node.value)
+        elif isinstance(node, (BinOp, BoolOp)):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, (UnaryOp, TempStore)):
+            stack.append(node.expr)
+        elif isinstance(node, Index):
+            names.add(node.var_node.value)
+            stack.append(node.index)
+        elif isinstance(node, FunctionCall):
+            stack.extend(node.actual_params)
+    return names
+
+
+def expression_calls(node):
+    """Return the list of the FunctionCall nodes of an expression."""
+    calls = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (BinOp, BoolOp)):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, (UnaryOp, TempStore)):
+            stack.append(node.expr)
+        elif isinstance(node, Index):
+            stack.append(node.index)
+        elif isinstance(node, FunctionCall):
+            calls.append(node)
+            stack.extend(node.actual_params)
+    return calls
+
+
+class ProcedureEffectsCollector(NodeVisitor):
+    """Collects, for every procedure, the names of its parameters and
+    local variables, a function's result variable included, the names
+    its body assigns and reads and the symbols of the procedures and
+    functions it calls, and which enclosing procedure declares each of
+    the names that aren't its own."""
+    def __init__(self):
+        # proc_symbol -> ProcedureEffects
+        self.procedures = {}
+        self.declarations = []  # the ProcedureDecls, in visiting order
+        self.current = None
+        self.names = set()  # every variable name in the tree
+
+    def visit_Program(self, node):
+        self.visit(node.block)
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        self.names.add(node.var_node.value)
+        if self.current is not None:
+            self.current.local.add(node.var_node.value)
+
+    def visit_ProcedureDecl(self, node):
+        enclosing = self.current
+        effects = self.current = ProcedureEffects(
+            {param.var_node.value for param in node.params}
+        )
+        if isinstance(node, FunctionDecl):
+            effects.local.add(node.proc_name)
+        self.procedures[node.proc_symbol] = effects
+        self.declarations.append(node)
+        self.names |= effects.local
+        self.visit(node.block_node)
+        # the enclosing procedures declare no more variables the body
+        # can see than they have so far
+        for name in (effects.assigned | effects.read) - effects.local:
+            owner = enclosing
+            while owner is not None and name not in owner.local:
+                owner = owner.enclosing
+            effects.owners[name] = owner
+        effects.enclosing = enclosing
+        self.current = enclosing
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_Assign(self, node):
+        if self.current is not None:
+            if isinstance(node.left, Index):
+                self.current.assigned.add(node.left.var_node.value)
+                self.read(node.left.index)
+            else:
+                self.current.assigned.add(node.left.value)
+            self.read(node.right)
+
+    def visit_For(self, node):
+        if self.current is not None:
+            self.current.assigned.add(node.var_node.value)
+            self.read(node.start)
+            self.read(node.stop)
+        self.visit(node.body)
+
+    def visit_If(self, node):
+        if self.current is not None:
+            self.read(node.condition)
+        self.visit(node.then_branch)
+        if node.else_branch is not None:
+            self.visit(node.else_branch)
+
+    def visit_While(self, node):
+        if self.current is not None:
+            self.read(node.condition)
+        self.visit(node.body)
+
+    def visit_ProcedureCall(self, node):
+        if self.current is not None:
+            proc_symbol = node.proc_symbol
+            if isinstance(proc_symbol, OutputProcedureSymbol):
+                self.current.assigned.add(OUTPUT_CHANNEL)
+            elif isinstance(proc_symbol, BuiltinProcedureSymbol):
+                # a builtin's effects are on its arguments only
+                for kind, param_node in zip(
+                        proc_symbol.signature, node.actual_params):
+                    if kind == 'D':
+                        self.current.assigned.add(param_node.value)
+            else:
+                self.current.callees.append(proc_symbol)
+            for param_node in node.actual_params:
+                self.read(param_node)
+
+    def read(self, node):
+        self.current.read |= expression_names(node)
+        for call in expression_calls(node):
+            if not isinstance(call.proc_symbol, BuiltinProcedureSymbol):
+                self.current.callees.append(call.proc_symbol)
+
+    def visit_NoOp(self, node):
+        pass
+
+
+class ProcedureEffects(object):
+    __slots__ = ('local', 'assigned', 'read', 'callees', 'owners',
+                 'enclosing')
+
+    def __init__(self, local):
+        self.local = local
+        self.assigned = set()
+        self.read = set()
+        self.callees = []
+        # name -> the ProcedureEffects of the enclosing procedure that
+        # declares the variable, None for a global variable
+        self.owners = {}
+        self.enclosing = None
+
+
+def _transitive_effects(procedures, direct):
+    """Return {proc_symbol: names} for direct(effects) closed over the
+    procedures each procedure calls, without the names of the caller's
+    own variables; names are None if a callee isn't in procedures.
+
+    A name is tracked together with the procedure declaring the variable
+    it names in the procedure that assigns or reads it, so a variable
+    of the caller only hides the same variable, and not a global or an
+    enclosing procedure's variable a callee assigns or reads."""
+    variables = {
+        proc_symbol: {
+            (effects.owners[name], name)
+            for name in direct(effects) - effects.local
+        }
+        for proc_symbol, effects in procedures.items()
+    }
+    changed = True
+    while changed:
+        changed = False
+        for proc_symbol, effects in procedures.items():
+            own = variables[proc_symbol]
+            if own is None:
+                continue
+            for callee in effects.callees:
+                callee_variables = variables.get(callee)
+                if callee_variables is None:
+                    variables[proc_symbol] = None
+                    changed = True
+                    break
+                new_variables = {
+                    (owner, name) for owner, name in callee_variables
+                    if owner is not effects
+                } - own
+                if new_variables:
+                    own |= new_variables
+                    changed = True
+    return {
+        proc_symbol: None if own is None else {name for _, name in own}
+        for proc_symbol, own in variables.items()
+    }
+
+
+def compute_mod_sets(tree):
+    """Return {proc_symbol: names} of the variables visible to the callers
+    of each procedure that a call of the procedure may assign, directly
+    or through the procedures it calls. The names are None when that is
+    unknown: when a procedure (transitively) calls a procedure whose
+    declaration isn't in the tree, e.g. through a symbol copied by a
+    worker process of the parallel semantic analysis.
+    """
+    collector = ProcedureEffectsCollector()
+    collector.visit(tree)
+    return _transitive_effects(
+        collector.procedures, lambda effects: effects.assigned
+    )
+
+
+def compute_ref_sets(tree):
+    """Return {proc_symbol: names} of the variables visible to the callers
+    of each procedure that a call of the procedure may read, None when
+    that is unknown, like compute_mod_sets."""
+    collector = ProcedureEffectsCollector()
+    collector.visit(tree)
+    return _transitive_effects(
+        collector.procedures, lambda effects: effects.read
+    )
+
+
+def mark_pure_functions(tree):
+    """Set FunctionDecl.pure of every function of an analyzed tree and
+    return the list of the pure ones.
+
+    A function is pure when a call of it, the procedures and functions
+    it calls included, reads no variable but its parameters and locals
+    and assigns no variable but its locals and its result: its value
+    then depends on its arguments only, and calling it has no effect
+    but computing that value. A function whose mod or ref set is
+    unknown isn't pure.
+    """
+    collector = ProcedureEffectsCollector()
+    collector.visit(tree)
+    mod_sets = _transitive_effects(
+        collector.procedures, lambda effects: effects.assigned
+    )
+    ref_sets = _transitive_effects(
+        collector.procedures, lambda effects: effects.read
+    )
+    pure = []
+    for declaration in collector.declarations:
+        if isinstance(declaration, FunctionDecl):
+            proc_symbol = declaration.proc_symbol
+            declaration.pure = (
+                mod_sets[proc_symbol] == set() and
+                ref_sets[proc_symbol] == set()
+            )
+            if declaration.pure:
+                pure.append(declaration)
+    return pure
+
+
+def _constant_key(node):
+    return type(node.value), repr(node.value)
+
+
+class ConstantPropagator(ConstantFolder):
+    """Substitutes the known constant values of variables into the
+    expressions that read them and folds the results.
+
+    A forward pass over the statements of every block: an assignment of
+    a constant records the variable's value, any other assignment
+    forgets it, and a procedure or function call forgets the values of
+    the variables in the callee's mod set (all of them if it is
+    unknown). A FOR or WHILE loop forgets all the values, before its
+    body, and its condition, and after it. After an IF, the values known
+    are those both branches leave. Every block
+    starts with no known values, so nothing is assumed about the globals
+    a procedure body reads or about its parameters.
+    """
+    def __init__(self, mod_sets):
+        super().__init__()
+        self.mod_sets = mod_sets
+        self.constants = {}  # variable name -> Num
+        self.loads_eliminated = 0
+
+    def visit_Program(self, node):
+        self.constants = {}
+        node.block = self.visit(node.block)
+        return node
+
+    def visit_ProcedureDecl(self, node):
+        enclosing_constants, self.constants = self.constants, {}
+        node.block_node = self.visit(node.block_node)
+        self.constants = enclosing_constants
+        return node
+
+    def visit_Assign(self, node):
+        if isinstance(node.left, Index):
+            # elements have no known values
+            return super().visit_Assign(node)
+        node.right = self.visit(node.right)
+        if isinstance(node.right, Num):
+            self.constants[node.left.value] = node.right
+        else:
+            self.constants.pop(node.left.value, None)
+        return node
+
+    def visit_For(self, node):
+        node.start = self.visit(node.start)
+        node.stop = self.visit(node.stop)
+        # the body may run any number of times, after itself too, so
+        # nothing is known when an iteration starts or after the loop
+        self.constants = {}
+        node.body = self.visit_for_body(node)
+        self.constants = {}
+        return node
+
+    def visit_If(self, node):
+        node.condition = self.visit(node.condition)
+        branch = self.taken_branch(node)
+        if branch is not None:
+            return self.visit(branch)
+        before = dict(self.constants)
+        node.then_branch = self.visit_conditional(node.then_branch)
+        then_constants, self.constants = self.constants, before
+        if node.else_branch is not None:
+            node.else_branch = self.visit_conditional(node.else_branch)
+        # a value survives if both branches leave the same one; 0.0 and
+        # -0.0 are equal but not interchangeable
+        self.constants = {
+            name: constant for name, constant in then_constants.items()
+            if name in self.constants and
+            _constant_key(self.constants[name]) == _constant_key(constant)
+        }
+        return node
+
+    def visit_While(self, node):
+        self.constants = {}
+        node.condition = self.visit(node.condition)
+        if self.condition_value(node.condition) is False:
+            self.folded += 1
+            return NoOp()
+        node.body = self.visit_conditional(node.body)
+        self.constants = {}
+        return node
+
+    def visit_ProcedureCall(self, node):
+        node = super().visit_ProcedureCall(node)
+        if isinstance(node.proc_symbol, BuiltinProcedureSymbol):
+            # it assigns arrays only, which have no known values
+            return node
+        mod_set = self.mod_sets.get(node.proc_symbol)
+        if mod_set is None:
+            self.constants.clear()
+        else:
+            for name in mod_set:
+                self.constants.pop(name, None)
+        return node
+
+    def visit_Var(self, node):
+        constant = self.constants.get(node.value)
+        if constant is None:
+            return node
+        self.loads_eliminated += 1
+        return make_num(constant.value, node.type, node.token)
+
+
+def _may_raise(node):
+    """Return True if evaluating an expression may raise an exception,
+    that is if it divides by anything but a nonzero constant, indexes an
+    array with a bounds check or calls a function, which may have
+    effects besides. The builtin functions have none and never raise."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FunctionCall):
+            if not isinstance(node.proc_symbol, BuiltinProcedureSymbol):
+                return True
+            stack.extend(node.actual_params)
+        if isinstance(node, BinOp):
+            divisor = node.right
+            if (node.op.type in (TokenType.INTEGER_DIV, TokenType.FLOAT_DIV)
+                    and not (isinstance(divisor, Num) and divisor.value)):
+                return True
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, BoolOp):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, (UnaryOp, TempStore)):
+            stack.append(node.expr)
+        elif isinstance(node, Index):
+            if node.checked:
+                return True
+            stack.append(node.index)
+    return False
+
+
+def _shift_count(value):
+    """Return k if value is the INTEGER 2 ** k for some k >= 1, else
+    None."""
+    if type(value) is int and value > 1 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return None
+
+
+# Identities of a BinOp with a constant operand and another operand x,
+# each one (operator, the constant's side, the constant, the type x must
+# have or None for any type, the rewrite). The constant is an INTEGER
+# constant or 'power of two'. The rewrite is 'x' to replace the BinOp
+# with x, 'zero' to replace it with the INTEGER 0 or the TokenType of a
+# shift of x by k for a constant 2 ** k.
+#
+# The REAL results must stay exactly the same, NaN, the infinities and
+# the sign of zero included, and so must their Python types, since a
+# REAL variable can hold an INTEGER value.
+_BINARY_IDENTITIES = [
+    # -0.0 + 0 is 0.0
+    (TokenType.PLUS, 'right', 0, INTEGER_TYPE, 'x'),
+    (TokenType.PLUS, 'left', 0, INTEGER_TYPE, 'x'),
+    (TokenType.MINUS, 'right', 0, None, 'x'),
+    (TokenType.MUL, 'right', 1, None, 'x'),
+    (TokenType.MUL, 'left', 1, None, 'x'),
+    # NaN * 0 is NaN and -1.5 * 0 is -0.0
+    (TokenType.MUL, 'right', 0, INTEGER_TYPE, 'zero'),
+    (TokenType.MUL, 'left', 0, INTEGER_TYPE, 'zero'),
+    (TokenType.INTEGER_DIV, 'right', 1, INTEGER_TYPE, 'x'),
+    (TokenType.MUL, 'right', 'power of two', INTEGER_TYPE, TokenType.SHL),
+    (TokenType.MUL, 'left', 'power of two', INTEGER_TYPE, TokenType.SHL),
+    # >> floors like DIV, for negative x too
+    (TokenType.INTEGER_DIV, 'right', 'power of two', INTEGER_TYPE,
+     TokenType.SHR),
+]
+
+# Identities of a UnaryOp, each one (operator, the operator of the
+# operand if it has to be a UnaryOp or None, the replacement: the
+# operand 'x' or the operand of the operand 'x.expr').
+_UNARY_IDENTITIES = [
+    (TokenType.PLUS, None, 'x'),
+    (TokenType.MINUS, TokenType.MINUS, 'x.expr'),
+    (TokenType.NOT, TokenType.NOT, 'x.expr'),
+]
+
+# NOT (a op b) is a inverted b when a and b are INTEGERs. With a REAL
+# operand it isn't: every comparison with NaN is false.
+_INVERTED_COMPARISONS = {
+    TokenType.EQUAL: TokenType.NOT_EQUAL,
+    TokenType.NOT_EQUAL: TokenType.EQUAL,
+    TokenType.LESS: TokenType.GREATER_EQUAL,
+    TokenType.GREATER_EQUAL: TokenType.LESS,
+    TokenType.GREATER: TokenType.LESS_EQUAL,
+    TokenType.LESS_EQUAL: TokenType.GREATER,
+}
+
+
+class AlgebraicSimplifier(ConstantFolder):
+    """Rewrites the BinOp and UnaryOp nodes that match an identity of
+    _BINARY_IDENTITIES or _UNARY_IDENTITIES into cheaper nodes, and
+    the negations of INTEGER comparisons into the inverted comparisons
+    of _INVERTED_COMPARISONS, and folds the constant subtrees that
+    result.
+
+    A rewrite never drops an operand that may raise, so x * 0 stays if
+    x divides by a variable. Reading a variable before it is assigned
+    is an error the rewrites may hide, like the other passes.
+    """
+    def __init__(self):
+        super().__init__()
+        self.simplified = 0  # the number of identities applied
+        self.binary_identities = {}
+        for op, side, constant, x_type, rewrite in _BINARY_IDENTITIES:
+            self.binary_identities.setdefault(op, []).append(
+                (side, constant, x_type, rewrite)
+            )
+
+    def visit_BinOp(self, node):
+        node = super().visit_BinOp(node)
+        if not isinstance(node, BinOp):
+            return node
+
+        for side, constant, x_type, rewrite in self.binary_identities.get(
+            node.op.type, ()
+        ):
+            if side == 'right':
+                constant_node, x = node.right, node.left
+            else:
+                constant_node, x = node.left, node.right
+            if not isinstance(constant_node, Num):
+                continue
+            value = constant_node.value
+            if constant == 'power of two':
+                shift = _shift_count(value)
+                if shift is None:
+                    continue
+            elif type(value) is not int or value != constant:
+                continue
+            if x_type is not None and x.type is not x_type:
+                continue
+
+            if rewrite == 'x':
+                replacement = x
+            elif rewrite == 'zero':
+                if _may_raise(x):
+                    continue
+                replacement = make_num(0, INTEGER_TYPE, node.token)
+            else:
+                replacement = BinOp(
+                    x,
+                    Token(rewrite, rewrite.value,
+                          node.token.lineno, node.token.column),
+                    make_num(shift, INTEGER_TYPE, constant_node.token),
+                )
+                replacement.type = INTEGER_TYPE
+            self.simplified += 1
+            return replacement
+        return node
+
+    def visit_UnaryOp(self, node):
+        node = super().visit_UnaryOp(node)
+        if not isinstance(node, UnaryOp):
+            return node
+
+        for op, operand_op, rewrite in _UNARY_IDENTITIES:
+            if node.op.type != op:
+                continue
+            x = node.expr
+            if operand_op is not None and not (
+                isinstance(x, UnaryOp) and x.op.type == operand_op
+            ):
+                continue
+            self.simplified += 1
+            return x if rewrite == 'x' else x.expr
+
+        x = node.expr
+        if (node.op.type == TokenType.NOT and isinstance(x, BinOp) and
+                x.op.type in _INVERTED_COMPARISONS and
+                x.left.type is INTEGER_TYPE and
+                x.right.type is INTEGER_TYPE):
+            inverted = _INVERTED_COMPARISONS[x.op.type]
+            replacement = BinOp(
+                x.left,
+                Token(inverted, inverted.value,
+                      x.token.lineno, x.token.column),
+                x.right,
+            )
+            replacement.type = BOOLEAN_TYPE
+            self.simplified += 1
+            return replacement
+        return node
+
+
+class DeadStoreEliminator(NodeTransformer):
+    """Removes the assignments whose values are never read and the local
+    variable declarations of procedures, and the TempDecls of the
+    program block, that are never referenced.
+
+    A backward liveness pass over the statements of every block: a
+    variable is live if a later statement may read it before assigning
+    it, and an assignment to a variable that isn't live is dead, unless
+    its expression may raise. A procedure or function call reads the
+    variables in the callee's ref set (all of them if it is unknown).
+    The body of a FOR or WHILE loop may run after itself, so what it
+    reads is live throughout it, and so is what a WHILE condition reads.
+    After the condition of an IF, what either branch needs is live.
+
+    At the end of the program, the variables named by observable are
+    live, by default all the global variables (TempDecls aren't), so the
+    final contents of GLOBAL_MEMORY stay the same; pass a smaller
+    collection when only those variables of the final memory are
+    inspected. At the end of a procedure, all the variables but its own
+    parameters and locals are, a function's result included. Visiting
+    an assignment returns None when it is dead.
+    """
+    def __init__(self, ref_sets, names, observable=None):
+        self.ref_sets = ref_sets
+        self.names = names  # every variable name in the tree
+        self.observable = observable
+        self.live = set()
+        self.stores_eliminated = 0
+        self.declarations_eliminated = 0
+
+    def visit_Program(self, node):
+        if self.observable is None:
+            live = {
+                declaration.var_node.value
+                for declaration in node.block.declarations
+                if isinstance(declaration, VarDecl) and
+                not isinstance(declaration, TempDecl)
+            }
+        else:
+            live = set(self.observable)
+        self.eliminate(node.block, live)
+
+        # only the program block's statements can use its TempDecls
+        collector = ProcedureEffectsCollector()
+        collector.current = effects = ProcedureEffects(set())
+        collector.visit(node.block.compound_statement)
+        self.drop_unreferenced(
+            node.block, effects.assigned | effects.read, TempDecl
+        )
+        return node
+
+    def visit_ProcedureDecl(self, node):
+        block = node.block_node
+        local = {param.var_node.value for param in node.params}
+        local.update(
+            declaration.var_node.value
+            for declaration in block.declarations
+            if isinstance(declaration, VarDecl)
+        )
+        self.eliminate(block, self.names - local)
+
+        collector = ProcedureEffectsCollector()
+        collector.visit(node)
+        referenced = set()
+        for effects in collector.procedures.values():
+            referenced |= effects.assigned | effects.read
+        self.drop_unreferenced(block, referenced, VarDecl)
+        return node
+
+    def drop_unreferenced(self, block, referenced, declaration_class):
+        declarations = [
+            declaration for declaration in block.declarations
+            if not isinstance(declaration, declaration_class) or
+            declaration.var_node.value in referenced
+        ]
+        self.declarations_eliminated += (
+            len(block.declarations) - len(declarations)
+        )
+        block.declarations = declarations
+
+    def eliminate(self, block, live):
+        block.declarations = [
+            self.visit(declaration) for declaration in block.declarations
+        ]
+        self.live = live
+        block.compound_statement = self.visit(block.compound_statement)
+
+    def visit_Compound(self, node):
+        children = []
+        for child in reversed(node.children):
+            child = self.visit(child)
+            if child is not None:
+                children.append(child)
+        children.reverse()
+        node.children = children or [NoOp()]
+        return node
+
+    def visit_Assign(self, node):
+        if isinstance(node.left, Index):
+            # the other elements stay live, so the store is kept
+            self.read(node.right)
+            self.read(node.left.index)
+            return node
+        name = node.left.value
+        if name not in self.live and not _may_raise(node.right):
+            self.stores_eliminated += 1
+            return None
+        self.live.discard(name)
+        self.read(node.right)
+        return node
+
+    def visit_For(self, node):
+        # the body may run after itself, so whatever it reads is live at
+        # its end, and before the loop, which may not run at all
+        self.live |= self.statement_reads(node.body)
+        live = set(self.live)
+        node.body = self.visit(node.body) or NoOp()
+        self.live = live
+        self.read(node.start)
+        self.read(node.stop)
+        return node
+
+    def visit_If(self, node):
+        live = set(self.live)
+        node.then_branch = self.visit(node.then_branch) or NoOp()
+        then_live, self.live = self.live, live
+        if node.else_branch is not None:
+            node.else_branch = self.visit(node.else_branch) or NoOp()
+        self.live |= then_live
+        self.read(node.condition)
+        return node
+
+    def visit_While(self, node):
+        # the condition is evaluated after every iteration, the last one
+        # included, and before the first
+        self.read(node.condition)
+        self.live |= self.statement_reads(node.body)
+        live = set(self.live)
+        node.body = self.visit(node.body) or NoOp()
+        self.live = live
+        return node
+
+    def visit_ProcedureCall(self, node):
+        self.read_callee(node.proc_symbol)
+        for param_node in node.actual_params:
+            self.read(param_node)
+        return node
+
+    def statement_reads(self, node):
+        """Return the names of the variables a statement may read."""
+        collector = ProcedureEffectsCollector()
+        collector.current = effects = ProcedureEffects(set())
+        collector.visit(node)
+        names = effects.read
+        for proc_symbol in effects.callees:
+            ref_set = self.ref_sets.get(proc_symbol)
+            if ref_set is None:
+                return set(self.names)
+            names |= ref_set
+        return names
+
+    def read(self, node):
+        """Make the variables an expression reads live."""
+        self.live |= expression_names(node)
+        for call in expression_calls(node):
+            self.read_callee(call.proc_symbol)
+
+    def read_callee(self, proc_symbol):
+        if isinstance(proc_symbol, BuiltinProcedureSymbol):
+            # it reads its arguments only
+            return
+        ref_set = self.ref_sets.get(proc_symbol)
+        self.live |= self.names if ref_set is None else ref_set
+
+
+class TempStore(AST):
+    """Evaluates expr, keeps its value in the compiler temporary 'index'
+    and returns it."""
+    def __init__(self, index, expr):
+        self.index = index
+        self.expr = expr
+        self.token = expr.token
+        self.type = expr.type
+
+
+class TempLoad(AST):
+    """Returns the value of the compiler temporary 'index'."""
+    def __init__(self, index, token, type):
+        self.index = index
+        self.token = token
+        self.type = type
+
+
+class CommonSubexpressionEliminator(NodeTransformer):
+    """Evaluates repeated BinOp and UnaryOp subtrees once and reuses their
+    values through compiler temporaries.
+
+    Every expression gets a value number: variables are numbered by
+    their name and version, which an assignment to the variable bumps,
+    numbers by their type and representation, operations by their
+    operator and the value numbers of their operands. Expressions are
+    pure, so two subtrees with the same value number in the same basic
+    block have the same value. A procedure call ends the basic block, so
+    no temporary lives across a call, and so does a statement calling
+    functions, whose expressions are left alone. A FOR loop ends the
+    basic block too, and its body starts a new one in every iteration.
+    So do IF and WHILE, whose branches and bodies are basic blocks of
+    their own; their conditions are left alone, since the right operand
+    of AND and OR may not run.
+
+    The pass goes twice over the statements of each block. The first
+    time it numbers the subtrees and counts the occurrences of each
+    value number, not counting inside an occurrence that will be
+    replaced. The second time it wraps the first occurrence of a value
+    number counted more than once in a TempStore and replaces the later
+    ones with TempLoad nodes. The other passes know nothing about the
+    temporaries, so this one runs last.
+    """
+    def __init__(self):
+        self.temporaries = 0  # the number of temporaries allocated
+        self.eliminated = 0  # the number of subtrees replaced by TempLoad
+
+    def visit_Program(self, node):
+        self.eliminate(node.block)
+        return node
+
+    def visit_ProcedureDecl(self, node):
+        self.eliminate(node.block_node)
+        return node
+
+    def eliminate(self, block):
+        for declaration in block.declarations:
+            self.visit(declaration)
+
+        self.versions = {}  # variable name -> version
+        self.region = 0  # the number of the current basic block
+        self.numbers = {}  # structure -> value number
+        self.node_numbers = {}  # id(node) -> value number
+        self.counts = {}  # value number -> occurrences
+        self.statements(block.compound_statement, self.number_and_count)
+
+        self.temporary_indices = {}  # value number -> temporary
+        self.statements(block.compound_statement, self.rewrite)
+
+    def statements(self, node, expression):
+        """Replace each expression e of the statements in node with
+        expression(e), in the order the statements run."""
+        if isinstance(node, Compound):
+            for child in node.children:
+                self.statements(child, expression)
+        elif isinstance(node, Assign):
+            left = node.left
+            if isinstance(left, Index):
+                if expression_calls(left.index):
+                    self.region += 1
+                # an element store changes the array
+                left = left.var_node
+            if expression_calls(node.right):
+                self.region += 1
+            else:
+                node.right = expression(node.right)
+            name = left.value
+            self.versions[name] = self.versions.get(name, 0) + 1
+        elif isinstance(node, ProcedureCall):
+            if not any(map(expression_calls, node.actual_params)):
+                node.actual_params = [
+                    expression(param_node)
+                    for param_node in node.actual_params
+                ]
+            self.region += 1
+        elif isinstance(node, For):
+            if not (expression_calls(node.start)
+                    or expression_calls(node.stop)):
+                node.start = expression(node.start)
+                node.stop = expression(node.stop)
+            # an iteration is a basic block of its own
+            self.region += 1
+            self.statements(node.body, expression)
+            self.region += 1
+        elif isinstance(node, If):
+            self.region += 1
+            self.statements(node.then_branch, expression)
+            self.region += 1
+            if node.else_branch is not None:
+                self.statements(node.else_branch, expression)
+                self.region += 1
+        elif isinstance(node, While):
+            self.region += 1
+            self.statements(node.body, expression)
+            self.region += 1
+        elif not isinstance(node, NoOp):
+            self.region += 1
+
+    def value_number(self, node):
+        if isinstance(node, Var):
+            structure = (node.value, self.versions.get(node.value, 0))
+        elif isinstance(node, Num):
+            # 0.0 and -0.0 are equal but not interchangeable
+            structure = (type(node.value), repr(node.value))
+        elif isinstance(node, BinOp):
+            left = self.value_number(node.left)
+            right = self.value_number(node.right)
+            if left is None or right is None:
+                return None
+            structure = (node.op.type, left, right)
+        elif isinstance(node, UnaryOp):
+            expr = self.value_number(node.expr)
+            if expr is None:
+                return None
+            structure = (node.op.type, expr)
+        else:
+            return None
+
+        number = self.numbers.setdefault(
+            (self.region, structure), len(self.numbers)
+        )
+        if isinstance(node, (BinOp, UnaryOp)):
+            self.node_numbers[id(node)] = number
+        return number
+
+    def number_and_count(self, node):
+        self.value_number(node)
+        self.count(node)
+        return node
+
+    def count(self, node):
+        number = self.node_numbers.get(id(node))
+        if number is not None:
+            self.counts[number] = self.counts.get(number, 0) + 1
+            if self.counts[number] > 1:
+                return
+        if isinstance(node, BinOp):
+            self.count(node.left)
+            self.count(node.right)
+        elif isinstance(node, UnaryOp):
+            self.count(node.expr)
+
+    def rewrite(self, node):
+        number = self.node_numbers.get(id(node))
+        if number is not None and self.counts[number] > 1:
+            index = self.temporary_indices.get(number)
+            if index is not None:
+                self.eliminated += 1
+                return TempLoad(index, node.token, node.type)
+            index = self.temporary_indices[number] = self.temporaries
+            self.temporaries += 1
+            return TempStore(index, self.rewrite_operands(node))
+        return self.rewrite_operands(node)
+
+    def rewrite_operands(self, node):
+        if isinstance(node, BinOp):
+            node.left = self.rewrite(node.left)
+            node.right = self.rewrite(node.right)
+        elif isinstance(node, UnaryOp):
+            node.expr = self.rewrite(node.expr)
+        return node
+
+
+class TempDecl(VarDecl):
+    """A variable declared by an optimization pass, not by the program.
+
+    Its name has an underscore, so it can't clash with a Pascal
+    identifier. Declared in the program block, it isn't a global
+    variable: the engines keep it out of GLOBAL_MEMORY.
+    """
+
+
+def _inline_shape(node):
+    """Return (number of nodes, names of the variables) of a procedure
+    body, or None if the body makes calls."""
+    size = 0
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        size += 1
+        if isinstance(node, Compound):
+            stack.extend(node.children)
+        elif isinstance(node, (Assign, BinOp, BoolOp)):
+            stack.append(node.left)
+            stack.append(node.right)
+        elif isinstance(node, UnaryOp):
+            stack.append(node.expr)
+        elif isinstance(node, For):
+            stack.extend((node.var_node, node.start, node.stop, node.body))
+        elif isinstance(node, If):
+            stack.extend((node.condition, node.then_branch))
+            if node.else_branch is not None:
+                stack.append(node.else_branch)
+        elif isinstance(node, While):
+            stack.extend((node.condition, node.body))
+        elif isinstance(node, Index):
+            stack.extend((node.var_node, node.index))
+        elif isinstance(node, Var):
+            names.add(node.value)
+        elif not isinstance(node, (Num, NoOp)):
+            return None
+    return size, names
+
+
+def _unassigned_reads(node, unassigned, found):
+    """Add to found the names in unassigned that a statement without
+    calls may read before assigning them, and return the names that may
+    still be unassigned after it."""
+    if isinstance(node, Compound):
+        for child in node.children:
+            unassigned = _unassigned_reads(child, unassigned, found)
+    elif isinstance(node, Assign):
+        found |= expression_names(node.right) & unassigned
+        if isinstance(node.left, Index):
+            found |= expression_names(node.left) & unassigned
+        else:
+            unassigned = unassigned - {node.left.value}
+    elif isinstance(node, For):
+        found |= expression_names(node.start) & unassigned
+        found |= expression_names(node.stop) & unassigned
+        # the body may run no times
+        _unassigned_reads(
+            node.body, unassigned - {node.var_node.value}, found
+        )
+    elif isinstance(node, If):
+        found |= expression_names(node.condition) & unassigned
+        after_then = _unassigned_reads(node.then_branch, unassigned, found)
+        if node.else_branch is not None:
+            unassigned = _unassigned_reads(
+                node.else_branch, unassigned, found
+            )
+        unassigned = unassigned | after_then
+    elif isinstance(node, While):
+        found |= expression_names(node.condition) & unassigned
+        _unassigned_reads(node.body, unassigned, found)
+    return unassigned
+
+
+class InlineCandidate(object):
+    """What ProcedureInliner knows about a procedure it may inline."""
+    __slots__ = (
+        'proc_decl', 'scopes', 'size', 'free_names', 'unassigned_reads',
+    )
+
+    def __init__(self, proc_decl, scopes, size, free_names,
+                 unassigned_reads):
+        self.proc_decl = proc_decl
+        # the scopes enclosing the procedure, see ProcedureInliner.scopes
+        self.scopes = scopes
+        self.size = size  # None when the body makes calls
+        # the names of the variables the body uses but doesn't declare
+        self.free_names = free_names
+        # the local variables the body may read before assigning them
+        self.unassigned_reads = unassigned_reads
+
+
+class BodyCopier(NodeVisitor):
+    """Copies a procedure body for ProcedureInliner, renaming the
+    variables in renames to fresh variables."""
+    def __init__(self, renames):
+        self.renames = renames  # name -> (fresh name, VarSymbol)
+
+    def visit_Compound(self, node):
+        compound = Compound()
+        compound.children = [self.visit(child) for child in node.children]
+        return compound
+
+    def visit_Assign(self, node):
+        return Assign(self.visit(node.left), node.op, self.visit(node.right))
+
+    def visit_For(self, node):
+        return For(
+            self.visit(node.var_node),
+            self.visit(node.start),
+            self.visit(node.stop),
+            node.downto,
+            self.visit(node.body),
+            node.token,
+        )
+
+    def visit_If(self, node):
+        return If(
+            self.visit(node.condition),
+            self.visit(node.then_branch),
+            None if node.else_branch is None
+            else self.visit(node.else_branch),
+            node.token,
+        )
+
+    def visit_While(self, node):
+        return While(
+            self.visit(node.condition), self.visit(node.body), node.token
+        )
+
+    def visit_NoOp(self, node):
+        return NoOp()
+
+    def visit_BinOp(self, node):
+        copy = BinOp(self.visit(node.left), node.op, self.visit(node.right))
+        copy.type = node.type
+        return copy
+
+    def visit_BoolOp(self, node):
+        copy = BoolOp(self.visit(node.left), node.op, self.visit(node.right))
+        copy.type = node.type
+        return copy
+
+    def visit_UnaryOp(self, node):
+        copy = UnaryOp(node.op, self.visit(node.expr))
+        copy.type = node.type
+        return copy
+
+    def visit_Num(self, node):
+        return make_num(node.value, node.type, node.token)
+
+    def visit_Index(self, node):
+        copy = Index(self.visit(node.var_node), self.visit(node.index),
+                     node.token)
+        copy.checked = node.checked
+        copy.low = node.low
+        copy.high = node.high
+        copy.type = node.type
+        return copy
+
+    def visit_Var(self, node):
+        rename = self.renames.get(node.value)
+        if rename is None:
+            copy = Var(node.token)
+            copy.symbol = node.symbol
+        else:
+            fresh_name, copy_symbol = rename
+            copy = Var(Token(
+                TokenType.ID, fresh_name, node.token.lineno, node.token.column
+            ))
+            copy.symbol = copy_symbol
+        copy.type = node.type
+        return copy
+
+
+class ProcedureInliner(NodeTransformer):
+    """Replaces procedure calls with copies of the procedures' bodies.
+
+    A call is inlined when its proc_symbol is that of a ProcedureDecl
+    of the tree whose body has at most max_size nodes and makes no
+    calls, and while the inlined copies add up to at most max_growth
+    nodes. Procedures are visited in declaration order, so the calls in
+    a body are inlined before the body itself is considered; a
+    recursive procedure keeps its calls and is never inlined.
+
+    At the call site, each argument is evaluated once into a fresh
+    variable standing for its parameter, and the copy of the body uses
+    fresh variables for the procedure's parameters and local variables.
+    The fresh variables are TempDecls of the caller's block, so a
+    parameter shadowing a global variable stays distinct from it. The
+    other variables of the body must be the ones their names denote at
+    the call site as well, otherwise the call is kept.
+
+    A fresh local variable keeps its value from one run of the inlined
+    code to the next, where the local variables of a call start out
+    undefined every time. So the calls of a procedure whose body may
+    read a local variable before assigning it are kept: that read fails
+    in every call, as it should, and the inlined code never reads the
+    value a previous run left.
+
+    'report' gets a line per procedure called: how many of its calls
+    were inlined and why the others weren't.
+    """
+    MAX_SIZE = 40
+    MAX_GROWTH = 100000
+
+    def __init__(self, max_size=MAX_SIZE, max_growth=MAX_GROWTH):
+        self.max_size = max_size
+        self.max_growth = max_growth
+        self.inlined = 0  # the number of calls inlined
+        self.growth = 0  # the number of nodes they added
+        self.fresh_variables = 0
+        # one dict per enclosing block, the program block first:
+        # variable name -> its VarDecl or Param
+        self.scopes = []
+        self.candidates = {}  # ProcedureSymbol -> InlineCandidate
+        # the blocks being visited and the TempDecls they get
+        self.blocks = []
+        # ProcedureDecl -> [calls, calls inlined, reason for the others]
+        self.calls = {}
+        self.report = []
+
+    def visit_Program(self, node):
+        self.scopes = [{}]
+        node.block = self.visit(node.block)
+        for proc_decl, (calls, inlined, reason) in self.calls.items():
+            line = f'{proc_decl.proc_name}: {inlined} of {calls} calls inlined'
+            if inlined < calls:
+                line += f', {reason}'
+            self.report.append(line)
+        return node
+
+    def visit_Block(self, node):
+        scope = self.scopes[-1]
+        for declaration in node.declarations:
+            if isinstance(declaration, VarDecl):
+                scope[declaration.var_node.value] = declaration
+            else:
+                self.visit(declaration)
+
+        temp_decls = []
+        self.blocks.append(temp_decls)
+        node.compound_statement = self.visit(node.compound_statement)
+        self.blocks.pop()
+
+        if temp_decls:
+            # after the variable declarations, before the procedures
+            position = sum(
+                1 for declaration in node.declarations
+                if isinstance(declaration, VarDecl)
+            )
+            node.declarations[position:position] = temp_decls
+        return node
+
+    def visit_ProcedureDecl(self, node):
+        scopes = tuple(self.scopes)
+        self.scopes.append(
+            {param.var_node.value: param for param in node.params}
+        )
+        node.block_node = self.visit(node.block_node)
+        self.scopes.pop()
+
+        compound_statement = node.block_node.compound_statement
+        shape = _inline_shape(compound_statement)
+        unassigned_reads = set()
+        if shape is None:
+            size, free_names = None, None
+        else:
+            size, names = shape
+            variable_names = {
+                declaration.var_node.value
+                for declaration in node.block_node.declarations
+                if isinstance(declaration, VarDecl)
+            }
+            local_names = variable_names | {
+                param.var_node.value for param in node.params
+            }
+            free_names = names - local_names
+            _unassigned_reads(
+                compound_statement, variable_names, unassigned_reads
+            )
+        self.candidates[node.proc_symbol] = InlineCandidate(
+            node, scopes, size, free_names, unassigned_reads
+        )
+        return node
+
+    def visit_Compound(self, node):
+        children = []
+        for child in node.children:
+            if isinstance(child, ProcedureCall):
+                statements = self.inline(child)
+                if statements is not None:
+                    children.extend(statements)
+                    continue
+            children.append(self.visit(child))
+        node.children = children
+        return node
+
+    def lookup(self, scopes, name):
+        for scope in reversed(scopes):
+            declaration = scope.get(name)
+            if declaration is not None:
+                return declaration
+        return None
+
+    def keep(self, proc_decl, reason):
+        counts = self.calls.setdefault(proc_decl, [0, 0, None])
+        counts[0] += 1
+        counts[2] = reason
+        return None
+
+    def inline(self, node):
+        """Return the statements replacing a call, None to keep it."""
+        candidate = self.candidates.get(node.proc_symbol)
+        if candidate is None:
+            # a recursive call or a symbol from a worker process
+            return None
+        proc_decl = candidate.proc_decl
+        if any(isinstance(declaration, VarDecl) and
+               isinstance(declaration.type_node, ArrayType)
+               for declaration in proc_decl.block_node.declarations):
+            # an array local to the call has no fresh variable
+            return self.keep(proc_decl, 'it declares arrays')
+        if candidate.size is None:
+            return self.keep(proc_decl, 'it makes calls')
+        if candidate.unassigned_reads:
+            name = min(candidate.unassigned_reads)
+            return self.keep(
+                proc_decl, f"it may read '{name}' before assigning it"
+            )
+        if candidate.size > self.max_size:
+            return self.keep(
+                proc_decl, f'{candidate.size} nodes > {self.max_size}'
+            )
+        if self.growth + candidate.size > self.max_growth:
+            return self.keep(proc_decl, 'the program grew too big')
+        for name in candidate.free_names:
+            if (self.lookup(self.scopes, name) is not
+                    self.lookup(candidate.scopes, name)):
+                return self.keep(
+                    proc_decl, f"'{name}' is another variable at the call"
+                )
+
+        block = proc_decl.block_node
+        renames = {}
+        statements = []
+        for param, param_node in zip(proc_decl.params, node.actual_params):
+            var = self.fresh_variable(param, renames)
+            statements.append(Assign(
+                var,
+                Token(TokenType.ASSIGN, TokenType.ASSIGN.value,
+                      node.token.lineno, node.token.column),
+                param_node,
+            ))
+        for declaration in block.declarations:
+            if isinstance(declaration, VarDecl):
+                self.fresh_variable(declaration, renames)
+        statements.extend(
+            BodyCopier(renames).visit(block.compound_statement).children
+        )
+
+        self.inlined += 1
+        self.growth += candidate.size
+        counts = self.calls.setdefault(proc_decl, [0, 0, None])
+        counts[0] += 1
+        counts[1] += 1
+        return statements
+
+    def fresh_variable(self, declaration, renames):
+        """Declare a fresh variable for a Param or VarDecl in the block
+        of the call, add it to renames and return a Var of it."""
+        var_node = declaration.var_node
+        # the part before the underscore of a fresh variable's name
+        root = var_node.value.split('_')[0]
+        fresh_name = f'{root}_{self.fresh_variables}'
+        self.fresh_variables += 1
+
+        type_symbol = _builtin_type(declaration.type_node.value)
+        token = Token(
+            TokenType.ID, fresh_name, var_node.token.lineno,
+            var_node.token.column,
+        )
+        self.blocks[-1].append(
+            TempDecl(Var(token), declaration.type_node)
+        )
+        renames[var_node.value] = (
+            fresh_name, VarSymbol(fresh_name, type_symbol)
+        )
+        var = Var(token)
+        var.symbol = renames[var_node.value][1]
+        var.type = type_symbol
+        return var
+
+
+def optimize(tree, stats=None, observable=None, inliner=None):
+    """Run the optimization passes over an analyzed tree.
+
+    If stats is a dict, it receives the counts the passes report. The
+    variables named by observable, by default all the global variables,
+    keep their final values, see DeadStoreEliminator. inliner is the
+    ProcedureInliner to run first, by default one with the default
+    thresholds.
+    """
+    if inliner is None:
+        inliner = ProcedureInliner()
+    inliner.visit(tree)
+
+    constant_propagator = ConstantPropagator(compute_mod_sets(tree))
+    constant_propagator.visit(tree)
+
+    algebraic_simplifier = AlgebraicSimplifier()
+    algebraic_simplifier.visit(tree)
+
+    collector = ProcedureEffectsCollector()
+    collector.visit(tree)
+    dead_store_eliminator = DeadStoreEliminator(
+        compute_ref_sets(tree), collector.names, observable
+    )
+    dead_store_eliminator.visit(tree)
+
+    subexpression_eliminator = CommonSubexpressionEliminator()
+    subexpression_eliminator.visit(tree)
+
+    if stats is not None:
+        stats['calls inlined'] = inliner.inlined
+        stats['nodes folded'] = (
+            constant_propagator.folded + algebraic_simplifier.folded
+        )
+        stats['loads eliminated'] = constant_propagator.loads_eliminated
+        stats['identities applied'] = algebraic_simplifier.simplified
+        stats['stores eliminated'] = dead_store_eliminator.stores_eliminated
+        stats['declarations eliminated'] = (
+            dead_store_eliminator.declarations_eliminated
+        )
+        stats['subexpressions eliminated'] = (
+            subexpression_eliminator.eliminated
+        )
+    return tree
+
+
+###############################################################################
+#                                                                             #
+#  INTERPRETER                                                                #
+#                                                                             #
+###############################################################################
+
+class FrameResolver(NodeVisitor):
+    """Lays out the frames of the procedures of an analyzed tree and
+    resolves every variable access and procedure call to them.
+
+    Afterwards
+        ProcedureDecl.frame_size   is the number of slots of its frames:
+                                   the parameters, in order, then the
+                                   local variables
+        FunctionDecl.result_slot   is the slot of the function's result,
+                                   right after the parameters
+        Program.frame_size         is the number of slots of the
+                                   program's frame, which holds the
+                                   TempDecls of the program block only
+        Program.global_slots       maps the name of each other variable
+                                   of the program block, a global
+                                   variable, to its slot in the list of
+                                   global values
+        Program.global_arrays      is a list of (name, ArrayTypeSymbol)
+                                   of the global arrays
+        ProcedureDecl.local_arrays is a list of (slot, ArrayTypeSymbol)
+                                   of the procedure's local arrays
+        Var.address                is None for a global variable, else
+                                   (hops, slot): the slot of the frame
+                                   reached by following 'hops' static
+                                   links from the running frame
+        Var.global_slot            is the slot of a global variable
+        ProcedureCall.callee       is the ProcedureDecl called, a
+                                   FunctionDecl for a FunctionCall, or
+                                   the BuiltinProcedureSymbol of a
+                                   builtin no declaration hides
+        ProcedureCall.static_hops  is None for a procedure declared in
+                                   the program block, else the number of
+                                   static links to follow from the
+                                   caller's frame to the callee's
+                                   enclosing frame
+
+    Names are resolved lexically, the way SemanticAnalyzer resolves
+    them, so trees rewritten by optimize() and symbols copied by
+    parallel workers don't matter.
+    """
+    def __init__(self):
+        # one dict per enclosing block, the program block first: name ->
+        # slot of a variable (None for a global variable) or ProcedureDecl
+        self.scopes = []
+        self.frame_sizes = []  # the number of slots of each block
+        self.global_slots = {}  # name -> slot of a global variable
+        # the (name or slot, ArrayTypeSymbol) of each block's arrays
+        self.arrays = []
+
+    def resolve(self, tree):
+        self.visit(tree)
+        return tree
+
+    def lookup(self, name, procedure=False):
+        """Return (depth, slot or ProcedureDecl) of a name, the depth of
+        the program block being 0. If procedure is true, the name is
+        called, so the result variable of a function doesn't hide it."""
+        for depth in range(len(self.scopes) - 1, -1, -1):
+            scope = self.scopes[depth]
+            if name in scope:
+                target = scope[name]
+                if procedure and not isinstance(target, ProcedureDecl):
+                    continue
+                return depth, target
+        raise KeyError(name)
+
+    def visit_Program(self, node):
+        self.scopes = [{}]
+        self.frame_sizes = [0]
+        self.global_slots = {}
+        self.arrays = [[]]
+        self.visit(node.block)
+        node.frame_size = self.frame_sizes[0]
+        node.global_slots = self.global_slots
+        node.global_arrays = self.arrays[0]
+
+    def visit_Block(self, node):
+        scope = self.scopes[-1]
+        for declaration in node.declarations:
+            if (len(self.scopes) == 1 and
+                    not isinstance(declaration, (TempDecl, ProcedureDecl))):
+                name = declaration.var_node.value
+                scope[name] = None
+                self.global_slots[name] = len(self.global_slots)
+                if isinstance(declaration.type_node, ArrayType):
+                    self.arrays[-1].append(
+                        (name, declaration.type_node.symbol)
+                    )
+            elif isinstance(declaration, VarDecl):
+                slot = self.frame_sizes[-1]
+                scope[declaration.var_node.value] = slot
+                self.frame_sizes[-1] += 1
+                if isinstance(declaration.type_node, ArrayType):
+                    self.arrays[-1].append(
+                        (slot, declaration.type_node.symbol)
+                    )
+            else:
+                scope[declaration.proc_name] = declaration
+                self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_ProcedureDecl(self, node):
+        scope = {}
+        for param in node.params:
+            scope[param.var_node.value] = len(scope)
+        if isinstance(node, FunctionDecl):
+            node.result_slot = scope[node.proc_name] = len(scope)
+        self.scopes.append(scope)
+        self.frame_sizes.append(len(scope))
+        self.arrays.append([])
+        self.visit(node.block_node)
+        self.scopes.pop()
+        node.frame_size = self.frame_sizes.pop()
+        node.local_arrays = self.arrays.pop()
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_Assign(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_For(self, node):
+        self.visit(node.var_node)
+        self.visit(node.start)
+        self.visit(node.stop)
+        self.visit(node.body)
+
+    def visit_If(self, node):
+        self.visit(node.condition)
+        self.visit(node.then_branch)
+        if node.else_branch is not None:
+            self.visit(node.else_branch)
+
+    def visit_While(self, node):
+        self.visit(node.condition)
+        self.visit(node.body)
+
+    def visit_Index(self, node):
+        self.visit(node.var_node)
+        self.visit(node.index)
+
+    def visit_ProcedureCall(self, node):
+        for param_node in node.actual_params:
+            self.visit(param_node)
+        try:
+            depth, node.callee = self.lookup(node.proc_name, procedure=True)
+        except KeyError:
+            node.callee = BUILTIN_PROCEDURES[node.proc_name]
+            depth = 0
+        if depth == 0:
+            node.static_hops = None
+        else:
+            node.static_hops = len(self.scopes) - 1 - depth
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_BoolOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+
+    def visit_Num(self, node):
+        pass
+
+    def visit_Var(self, node):
+        depth, slot = self.lookup(node.value)
+        if slot is None:
+            node.address = None
+            node.global_slot = self.global_slots[node.value]
+        else:
+            node.address = (len(self.scopes) - 1 - depth, slot)
+
+    def visit_TempStore(self, node):
+        self.visit(node.expr)
+
+    def visit_TempLoad(self, node):
+        pass
+
+
+class ActivationRecord(object):
+    """The frame of one procedure call.
+
+    'slots' holds the arguments followed by the local variables.
+    'enclosing' is the static link: the record of the procedure that
+    lexically encloses this one, or None when the procedure is declared
+    in the program block, whose variables are the global variables.
+    """
+    __slots__ = ('name', 'procedure', 'slots', 'enclosing')
+
+    def __init__(self, name, procedure, slots, enclosing=None):
+        self.name = name
+        self.procedure = procedure
+        self.slots = slots
+        self.enclosing = enclosing
+
+    def __str__(self):
+        return '<{class_name}(name={name}, slots={slots})>'.format(
+            class_name=self.__class__.__name__,
+            name=self.name,
+            slots=self.slots,
+        )
+
+    __repr__ = __str__
+
+
+class FramePool(object):
+    """The free ActivationRecords of one procedure.
+
+    A record is a fixed-size list of slots. Once a procedure has been
+    called, calling it again at the same recursion depth reuses the
+    record of the previous call instead of allocating a new one. The
+    slots of the local arrays, a sequence of (slot, ArrayTypeSymbol),
+    get new arrays of zeros on every call.
+    """
+    __slots__ = (
+        'name', 'procedure', 'param_count', 'frame_size', 'blank', 'free',
+        'arrays',
+    )
+
+    def __init__(self, name, procedure, param_count, frame_size, arrays=()):
+        self.name = name
+        self.procedure = procedure
+        self.param_count = param_count
+        self.frame_size = frame_size
+        # local variables start out undefined
+        self.blank = [None] * (frame_size - param_count)
+        self.free = []
+        self.arrays = tuple(arrays)
+
+    def acquire(self, args, enclosing):
+        if self.free:
+            record = self.free.pop()
+            slots = record.slots
+            slots[:self.param_count] = args
+            slots[self.param_count:] = self.blank
+            record.enclosing = enclosing
+        else:
+            record = ActivationRecord(
+                self.name, self.procedure, list(args) + self.blank, enclosing
+            )
+        for slot, array_type in self.arrays:
+            record.slots[slot] = array_type.allocate()
+        return record
+
+    def release(self, record):
+        record.enclosing = None
+        self.free.append(record)
+
+
+class CallStack(object):
+    def __init__(self):
+        self._records = []
+
+    def push(self, ar):
+        self._records.append(ar)
+
+    def pop(self):
+        return self._records.pop()
+
+    def peek(self):
+        return self._records[-1]
+
+    def __len__(self):
+        return len(self._records)
+
+    def __str__(self):
+        s = '\n'.join(repr(ar) for ar in reversed(self._records))
+        s = f'CALL STACK\n{s}\n'
+        return s
+
+    __repr__ = __str__
+
+
+class GlobalMemory(Mapping):
+    """A read-only view of an interpreter's global variables by name.
+
+    The values live in a list indexed by the slots of
+    Program.global_slots. Variables that have never been assigned hold
+    None and are left out of the view, as they are left out of the
+    GLOBAL_MEMORY dicts of the other engines.
+    """
+    __slots__ = ('global_slots', 'values')
+
+    def __init__(self, global_slots, values):
+        self.global_slots = global_slots  # name -> slot
+        self.values = values
+
+    def __getitem__(self, name):
+        value = self.values[self.global_slots[name]]
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __iter__(self):
+        values = self.values
+        for name, slot in self.global_slots.items():
+            if values[slot] is not None:
+                yield name
+
+    def __len__(self):
+        return sum(value is not None for value in self.values)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({dict(self)!r})'
+
+
+def array_buffers(memory):
+    """Return {name: memoryview} of the array variables of a
+    GLOBAL_MEMORY.
+
+    The views share the buffers of the arrays instead of copying them:
+    a consumer can write one to a file, or wrap it with
+    numpy.frombuffer, at the cost of the elements' bytes only. The
+    format of a view is 'q' for INTEGER and 'd' for REAL elements.
+    """
+    return {
+        name: memoryview(value)
+        for name, value in memory.items()
+        if isinstance(value, array)
+    }
+
+
+def _format_value(value):
+    if value is True:
+        return 'TRUE'
+    if value is False:
+        return 'FALSE'
+    return str(value)
+
+
+class OutputBuffer(object):
+    """Collects the text WRITE and WRITELN write and hands it to 'sink'
+    in large pieces, so the cost of a line is formatting it rather than
+    a write to a file.
+
+    The arguments of a call are written separated by spaces, BOOLEANs
+    as TRUE and FALSE, and WRITELN ends the line. The text goes to the
+    sink, any object with a write(str) method, sys.stdout at that moment
+    when it is None, once capacity characters are pending, and at the
+    flush points: FLUSH and the end of the program, including an end by
+    an exception. A flush also flushes the sink if it has a flush()
+    method.
+    """
+    CAPACITY = 1 << 20
+
+    def __init__(self, sink=None, capacity=CAPACITY):
+        self.sink = sink
+        self.capacity = capacity
+        self.pending = []
+        self.size = 0  # characters in pending
+
+    def write(self, values):
+        text = ' '.join(map(_format_value, values))
+        self.pending.append(text)
+        self.size += len(text)
+        if self.size >= self.capacity:
+            self.drain()
+
+    def writeln(self, values):
+        text = ' '.join(map(_format_value, values)) + '\n'
+        self.pending.append(text)
+        self.size += len(text)
+        if self.size >= self.capacity:
+            self.drain()
+
+    def drain(self):
+        """Write the pending text to the sink."""
+        if self.pending:
+            text = ''.join(self.pending)
+            self.pending.clear()
+            self.size = 0
+            sink = sys.stdout if self.sink is None else self.sink
+            sink.write(text)
+
+    def flush(self):
+        self.drain()
+        sink = sys.stdout if self.sink is None else self.sink
+        flush = getattr(sink, 'flush', None)
+        if flush is not None:
+            flush()
+
+
+def _memo_key(args):
+    """Return the key of the arguments of a call in a memo cache.
+
+    1 and 1.0, and 0.0 and -0.0, are equal keys of a dict but not
+    interchangeable arguments, hence the representation of the
+    arguments that aren't INTEGERs.
+    """
+    return tuple(
+        arg if arg.__class__ is int else repr(arg) for arg in args
+    )
+
+
+class Interpreter(NodeVisitor):
+    """Walks an analyzed AST and executes it.
+
+    Global variables are kept in the list 'globals', indexed by the
+    slots FrameResolver gives them, so every interpreter has its own.
+    GLOBAL_MEMORY is a read-only view of them by name; set_global()
+    assigns one before the program runs.
+
+    The calls of the functions mark_pure_functions() finds pure are
+    memoised: each pure function has an LRU cache of the results of
+    its last memo_size distinct argument lists in 'memo_caches', and
+    'memo_hits' and 'memo_misses' count the calls answered from the
+    caches and the calls that ran. A memo_size of 0 disables it.
+
+    WRITE and WRITELN write to 'output', an OutputBuffer writing to
+    sys.stdout unless one is passed.
+    """
+    MEMO_SIZE = 1024
+
+    def __init__(self, tree, memo_size=MEMO_SIZE, output=None):
+        self.tree = tree
+        self.output = OutputBuffer() if output is None else output
+        global_slots = {}
+        self.memo_size = memo_size
+        # FunctionDecl -> OrderedDict: memo key -> result
+        self.memo_caches = {}
+        self.memo_hits = 0
+        self.memo_misses = 0
+        if tree is not None:
+            global_slots = FrameResolver().resolve(tree).global_slots
+            if memo_size > 0:
+                self.memo_caches = {
+                    func_decl: OrderedDict()
+                    for func_decl in mark_pure_functions(tree)
+                }
+        self.globals = [None] * len(global_slots)
+        self.GLOBAL_MEMORY = GlobalMemory(global_slots, self.globals)
+        self.temporaries = {}  # see CommonSubexpressionEliminator
+        self.call_stack = CallStack()
+        self.frame_pools = {}  # ProcedureDecl -> FramePool
+
+    def visit_Program(self, node):
+        # the program's own record holds its TempDecls
+        self.call_stack.push(
+            ActivationRecord(node.name, node, [None] * node.frame_size)
+        )
+        for name, array_type in node.global_arrays:
+            self.set_global(name, array_type.allocate())
+        self.visit(node.block)
+        self.call_stack.pop()
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            self.visit(declaration)
+        self.visit(node.compound_statement)
+
+    def visit_VarDecl(self, node):
+        # Do nothing
+        pass
+
+    def visit_Type(self, node):
+        # Do nothing
+        pass
+
+    def visit_BinOp(self, node):
+        # the operands of '/' need no coercion: true division yields a
+        # REAL for INTEGER and REAL operands alike
+        return node.function(self.visit(node.left), self.visit(node.right))
+
+    def visit_BoolOp(self, node):
+        if self.visit(node.left) == node.short_circuit:
+            return node.short_circuit
+        return self.visit(node.right)
+
+    def visit_Num(self, node):
+        return node.value
+
+    def visit_UnaryOp(self, node):
+        return node.function(self.visit(node.expr))
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def frame(self, hops):
+        """Return the slots of the frame 'hops' static links up from
+        the running procedure's frame."""
+        ar = self.call_stack.peek()
+        for _ in range(hops):
+            ar = ar.enclosing
+        return ar.slots
+
+    def visit_Assign(self, node):
+        if isinstance(node.left, Index):
+            elements, position = self.element(node.left)
+            elements[position] = self.visit(node.right)
+            return
+        var_value = self.visit(node.right)
+        address = node.left.address
+        if address is None:
+            self.globals[node.left.global_slot] = var_value
+        else:
+            hops, slot = address
+            self.frame(hops)[slot] = var_value
+
+    def visit_Var(self, node):
+        address = node.address
+        if address is None:
+            return self.globals[node.global_slot]
+        hops, slot = address
+        return self.frame(hops)[slot]
+
+    def element(self, node):
+        """Return the array of an Index node and the position of the
+        element in it."""
+        index = self.visit(node.index)
+        if node.checked and not node.low <= index <= node.high:
+            raise IndexError('array index out of range')
+        return self.visit_Var(node.var_node), index - node.low
+
+    def visit_Index(self, node):
+        elements, position = self.element(node)
+        return elements[position]
+
+    def visit_For(self, node):
+        # the bounds are evaluated once and the control variable's
+        # values come from a range: each iteration stores the next one
+        # in the variable's slot and runs the body's statements
+        start = self.visit(node.start)
+        stop = self.visit(node.stop)
+        if node.downto:
+            values = range(start, stop - 1, -1)
+        else:
+            values = range(start, stop + 1)
+        address = node.var_node.address
+        if address is None:
+            slots, slot = self.globals, node.var_node.global_slot
+        else:
+            hops, slot = address
+            slots = self.frame(hops)
+
+        body = node.body
+        statements = body.children if isinstance(body, Compound) else [body]
+        visit = self.visit
+        for value in values:
+            slots[slot] = value
+            for statement in statements:
+                visit(statement)
+
+    def visit_If(self, node):
+        if self.visit(node.condition):
+            self.visit(node.then_branch)
+        elif node.else_branch is not None:
+            self.visit(node.else_branch)
+
+    def visit_While(self, node):
+        condition = node.condition
+        body = node.body
+        statements = body.children if isinstance(body, Compound) else [body]
+        visit = self.visit
+        while visit(condition):
+            for statement in statements:
+                visit(statement)
+
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_TempStore(self, node):
+        value = self.temporaries[node.index] = self.visit(node.expr)
+        return value
+
+    def visit_TempLoad(self, node):
+        return self.temporaries[node.index]
+
+    def visit_ProcedureDecl(self, node):
         pass
 
-    def visit_UnaryOp(self, node):
-        pass
+    def visit_ProcedureCall(self, node):
+        args = [self.visit(param_node) for param_node in node.actual_params]
+        self.call(node, args)
+
+    def visit_FunctionCall(self, node):
+        args = [self.visit(param_node) for param_node in node.actual_params]
+        cache = self.memo_caches.get(node.callee)
+        if cache is None:
+            return self.call(node, args)
+
+        key = _memo_key(args)
+        if key in cache:
+            self.memo_hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+        self.memo_misses += 1
+        value = cache[key] = self.call(node, args)
+        if len(cache) > self.memo_size:
+            cache.popitem(last=False)
+        return value
+
+    def call(self, node, args):
+        """Run the procedure or function a call node calls on args and
+        return the function's result, None for a procedure."""
+        proc_decl = node.callee
+        if isinstance(proc_decl, OutputProcedureSymbol):
+            return proc_decl.function(self.output, args)
+        if isinstance(proc_decl, BuiltinProcedureSymbol):
+            # the arguments of its array parameters are the arrays
+            return proc_decl.function(*args)
+        enclosing = None
+        if node.static_hops is not None:
+            enclosing = self.call_stack.peek()
+            for _ in range(node.static_hops):
+                enclosing = enclosing.enclosing
+
+        pool = self.frame_pools.get(proc_decl)
+        if pool is None:
+            pool = self.frame_pools[proc_decl] = FramePool(
+                proc_decl.proc_name,
+                proc_decl,
+                len(proc_decl.params),
+                proc_decl.frame_size,
+                proc_decl.local_arrays,
+            )
+        ar = pool.acquire(args, enclosing)
+        self.call_stack.push(ar)
+        self.visit(proc_decl.block_node)
+        self.call_stack.pop()
+        result = None
+        if isinstance(node, FunctionCall):
+            result = ar.slots[proc_decl.result_slot]
+        pool.release(ar)
+        return result
+
+    def set_global(self, name, value):
+        """Assign value to the global variable name."""
+        self.globals[self.GLOBAL_MEMORY.global_slots[name]] = value
+
+    def interpret(self):
+        tree = self.tree
+        if tree is None:
+            return ''
+        try:
+            return self.visit(tree)
+        finally:
+            self.output.flush()
+
+
+###############################################################################
+#                                                                             #
+#  BATCH EXECUTION                                                            #
+#                                                                             #
+###############################################################################
+
+class BatchInterpreter(Interpreter):
+    """Runs an analyzed AST once over N sets of input values at a time.
+
+    'inputs' maps names of global variables to sequences of N values,
+    which become NumPy arrays. The operator functions of the nodes then
+    evaluate every BinOp and UnaryOp elementwise over whole arrays, DIV
+    as numpy.floor_divide and '/' as numpy.true_divide. Expressions
+    that depend on no input stay Python numbers and are computed once.
+    Afterwards GLOBAL_MEMORY maps every assigned global variable to an
+    array of its N values.
+
+    Element i of each array is the value the variable has after an
+    Interpreter run on input values i, provided INTEGER values fit in
+    64 bits and the INTEGER operands of '/' in 53 bits: NumPy integers
+    wrap around where Python integers grow. A division raises
+    ZeroDivisionError when the divisor is zero in any of the N runs.
+    The runs take the same path through the program: the conditions of
+    IF and WHILE must not depend on the inputs, and NumPy raises a
+    ValueError for a condition that is an array. So must the indices of
+    arrays, whose elements are single numbers.
+    """
+    def __init__(self, tree, inputs):
+        if np is None:
+            raise ImportError('BatchInterpreter requires NumPy')
+        # the arguments are arrays, which make poor memo keys
+        super().__init__(tree, memo_size=0)
+        self.inputs = {
+            name: np.asarray(values) for name, values in inputs.items()
+        }
+        sizes = {len(values) for values in self.inputs.values()}
+        if len(sizes) != 1:
+            raise ValueError('the inputs must have one and the same length')
+        self.size = sizes.pop()
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if (node.function in (operator.floordiv, operator.truediv) and
+                not np.all(right)):
+            raise ZeroDivisionError('division by zero')
+        return node.function(left, right)
+
+    def interpret(self):
+        for name, values in self.inputs.items():
+            self.set_global(name, values)
+        # overflows yield infinities and NaNs silently, as in Python
+        with np.errstate(all='ignore'):
+            super().interpret()
+        values = self.globals
+        for slot, value in enumerate(values):
+            if value is not None and not isinstance(value, np.ndarray):
+                values[slot] = np.full(self.size, value)
+
+
+###############################################################################
+#                                                                             #
+#  STREAMING COMPILATION                                                      #
+#                                                                             #
+###############################################################################
+
+class CompactProcedure(object):
+    """A program or procedure block lowered to compact code.
+
+    'code' is a flat tuple of statements, 'procedures' a tuple of the
+    CompactProcedure objects declared in the block.
+    """
+    __slots__ = ('name', 'params', 'variables', 'code', 'procedures')
+
+    def __init__(self, name, params, variables, code, procedures):
+        self.name = name
+        self.params = params  # a tuple of parameter names
+        # the names of the slots of a frame: params, then local variables
+        self.variables = variables
+        self.code = code
+        self.procedures = procedures
+
+    def __repr__(self):
+        return '<{class_name}(name={name}, params={params})>'.format(
+            class_name=self.__class__.__name__,
+            name=self.name,
+            params=self.params,
+        )
+
+
+class Lowerer(NodeVisitor):
+    """Lowers an analyzed block to compact code made of tuples, strings
+    and numbers only, so none of its tokens and AST nodes stay alive.
+
+    Statements:
+        ('assign', var_name, expr)
+        ('call', proc_name, (expr, ...))
+        ('for', var_name, start_expr, stop_expr, step, (statement, ...))
+        ('if', expr, (statement, ...), (statement, ...))
+        ('while', expr, (statement, ...))
+    a Compound is flattened into the enclosing statement tuple and a NoOp
+    disappears.
+
+    Expressions:
+        Num      ->  its value
+        Var      ->  the variable name
+        UnaryOp  ->  (operator_function, expr)
+        BinOp    ->  (operator_function, left_expr, right_expr)
+        BoolOp   ->  ('bool', short_circuit, left_expr, right_expr)
+    """
+    def lower_block(self, name, params, block_node):
+        procedures = tuple(
+            declaration for declaration in block_node.declarations
+            if isinstance(declaration, CompactProcedure)
+        )
+        params = tuple(sys.intern(param.var_node.value) for param in params)
+        variables = params + tuple(
+            sys.intern(declaration.var_node.value)
+            for declaration in block_node.declarations
+            if isinstance(declaration, VarDecl)
+        )
+        code = []
+        self.visit_statement(block_node.compound_statement, code)
+        return CompactProcedure(
+            sys.intern(name), params, variables, tuple(code), procedures
+        )
+
+    def visit_statement(self, node, code):
+        if isinstance(node, Compound):
+            for child in node.children:
+                self.visit_statement(child, code)
+        elif isinstance(node, Assign):
+            code.append(
+                ('assign', sys.intern(node.left.value), self.visit(node.right))
+            )
+        elif isinstance(node, ProcedureCall):
+            code.append((
+                'call',
+                sys.intern(node.proc_name),
+                tuple(self.visit(param) for param in node.actual_params),
+            ))
+        elif isinstance(node, For):
+            body = []
+            self.visit_statement(node.body, body)
+            code.append((
+                'for',
+                sys.intern(node.var_node.value),
+                self.visit(node.start),
+                self.visit(node.stop),
+                -1 if node.downto else 1,
+                tuple(body),
+            ))
+        elif isinstance(node, If):
+            then_code = []
+            self.visit_statement(node.then_branch, then_code)
+            else_code = []
+            if node.else_branch is not None:
+                self.visit_statement(node.else_branch, else_code)
+            code.append((
+                'if',
+                self.visit(node.condition),
+                tuple(then_code),
+                tuple(else_code),
+            ))
+        elif isinstance(node, While):
+            body = []
+            self.visit_statement(node.body, body)
+            code.append(('while', self.visit(node.condition), tuple(body)))
+        elif not isinstance(node, NoOp):
+            self.generic_visit(node)
+
+    def visit_BinOp(self, node):
+        return (node.function, self.visit(node.left), self.visit(node.right))
+
+    def visit_BoolOp(self, node):
+        return (
+            'bool',
+            node.short_circuit,
+            self.visit(node.left),
+            self.visit(node.right),
+        )
+
+    def visit_UnaryOp(self, node):
+        return (node.function, self.visit(node.expr))
+
+    def visit_Num(self, node):
+        return node.value
+
+    def visit_Var(self, node):
+        return sys.intern(node.value)
+
+
+class StreamingParser(Parser):
+    """Parses, analyzes and lowers a program one procedure at a time.
+
+    Every ProcedureDecl is resolved while it is parsed (see the analyzer
+    argument of Parser) and lowered to a CompactProcedure as soon as its
+    closing SEMI is consumed, so its tokens, AST nodes and symbol table
+    can be freed right away. Peak memory is governed by the largest
+    procedure rather than by the whole program.
+
+    parse() returns the CompactProcedure of the main program block.
+    Compact code has no functions, arrays and builtins: a FUNCTION
+    declaration, an ARRAY type or a call of a builtin is a ParserError.
+    """
+    def __init__(self, lexer):
+        super().__init__(lexer, analyzer=SemanticAnalyzer())
+        self.lowerer = Lowerer()
+
+    def procedure_declaration(self):
+        proc_decl = super().procedure_declaration()
+        return self.lowerer.lower_block(
+            proc_decl.proc_name, proc_decl.params, proc_decl.block_node
+        )
+
+    def function_declaration(self):
+        # compact code has no expression calls
+        self.error(ErrorCode.UNSUPPORTED, self.current_token)
+
+    def array_type(self):
+        # compact code has no element loads and stores
+        self.error(ErrorCode.UNSUPPORTED, self.current_token)
+
+    def proccall_statement(self):
+        node = super().proccall_statement()
+        if isinstance(node.proc_symbol, BuiltinProcedureSymbol):
+            # compact code calls declared procedures only
+            self.error(ErrorCode.UNSUPPORTED, node.token)
+        return node
+
+    def parse(self):
+        program_node = super().parse()
+        return self.lowerer.lower_block(
+            program_node.name, [], program_node.block
+        )
+
+
+class CompactInterpreter(object):
+    """Runs a program lowered by StreamingParser.
+
+    Calls get their ActivationRecords from FramePools, like in
+    Interpreter. Compact code keeps names rather than frame addresses,
+    so a name is looked up in the running procedure, then in the
+    procedures lexically enclosing it and then in GLOBAL_MEMORY.
+    """
+    def __init__(self, program):
+        self.program = program
+        self.GLOBAL_MEMORY = {}
+        self.current = None  # the ActivationRecord of the running call
+        # CompactProcedure -> (slots by name, procedures by name, FramePool)
+        self.layouts = {}
+
+    def layout(self, procedure):
+        layout = self.layouts.get(procedure)
+        if layout is None:
+            layout = self.layouts[procedure] = (
+                {name: slot for slot, name in enumerate(procedure.variables)},
+                {nested.name: nested for nested in procedure.procedures},
+                FramePool(
+                    procedure.name,
+                    procedure,
+                    len(procedure.params),
+                    len(procedure.variables),
+                ),
+            )
+        return layout
+
+    def execute(self, code):
+        evaluate = self.evaluate
+        for statement in code:
+            if statement[0] == 'assign':
+                self.store(statement[1], evaluate(statement[2]))
+            elif statement[0] == 'call':
+                self.call(
+                    statement[1], [evaluate(expr) for expr in statement[2]]
+                )
+            elif statement[0] == 'for':
+                _, name, start, stop, step, body = statement
+                for value in range(
+                    evaluate(start), evaluate(stop) + step, step
+                ):
+                    self.store(name, value)
+                    self.execute(body)
+            elif statement[0] == 'if':
+                _, condition, then_code, else_code = statement
+                self.execute(then_code if evaluate(condition) else else_code)
+            else:
+                _, condition, body = statement
+                while evaluate(condition):
+                    self.execute(body)
+
+    def call(self, name, args):
+        caller = enclosing = self.current
+        while enclosing is not None:
+            procedure = self.layouts[enclosing.procedure][1].get(name)
+            if procedure is not None:
+                break
+            enclosing = enclosing.enclosing
+        else:
+            procedure = self.layout(self.program)[1][name]
+        pool = self.layout(procedure)[2]
+        ar = self.current = pool.acquire(args, enclosing)
+        self.execute(procedure.code)
+        self.current = caller
+        pool.release(ar)
+
+    def store(self, name, value):
+        ar = self.current
+        while ar is not None:
+            slot = self.layouts[ar.procedure][0].get(name)
+            if slot is not None:
+                ar.slots[slot] = value
+                return
+            ar = ar.enclosing
+        self.GLOBAL_MEMORY[name] = value
+
+    def load(self, name):
+        ar = self.current
+        while ar is not None:
+            slot = self.layouts[ar.procedure][0].get(name)
+            if slot is not None:
+                return ar.slots[slot]
+            ar = ar.enclosing
+        return self.GLOBAL_MEMORY.get(name)
+
+    def evaluate(self, expr):
+        expr_class = expr.__class__
+        if expr_class is tuple:
+            if len(expr) == 3:
+                return expr[0](self.evaluate(expr[1]), self.evaluate(expr[2]))
+            if len(expr) == 4:
+                _, short_circuit, left, right = expr
+                if self.evaluate(left) == short_circuit:
+                    return short_circuit
+                return self.evaluate(right)
+            return expr[0](self.evaluate(expr[1]))
+        if expr_class is str:
+            return self.load(expr)
+        return expr
+
+    def interpret(self):
+        self.execute(self.program.code)
+
+
+###############################################################################
+#                                                                             #
+#  CLOSURE COMPILER                                                           #
+#                                                                             #
+###############################################################################
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector.
+
+    Compilers allocate lots of long-lived objects but no reference
+    cycles. Left running, the collector traverses the whole tree over
+    and over while they're created, which takes several times longer
+    than the compilation itself.
+    """
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+class ClosureCompiler(NodeVisitor):
+    """Converts an analyzed AST into nested Python closures.
+
+    Every expression node becomes a closure that takes no arguments and
+    returns the node's value, every statement node a closure that
+    executes it. The closures are specialised by node kind, operator and
+    the kind of their operands: a BinOp whose operands are variables or
+    numbers reads them directly instead of calling a closure per
+    operand, and an Assign of such a BinOp becomes a single closure that
+    reads two variables and stores the result. The condition of an IF or
+    a WHILE decides the branch directly: its NOTs swap the branches, and
+    AND and OR are Python's and/or, so no BOOLEAN value is computed for
+    them.
+
+    Each closure is created once; running the program then only calls
+    the root closure returned by compile(), with no visit dispatch and
+    no tests on node.op.type.
+
+    Variables of the program block live in memory. Parameters and local
+    variables live in the slots of pooled ActivationRecords, laid out by
+    FrameResolver; the closures reach the running procedure's record
+    through a cell shared by all of them. An array variable holds the
+    array.array of its elements.
+
+    WRITE and WRITELN write to the OutputBuffer 'output'.
+    """
+    def __init__(self, memory, output=None):
+        self.memory = memory
+        self.output = OutputBuffer() if output is None else output
+        self.temporaries = {}
+        self.current = [None]  # the ActivationRecord of the running call
+        self.bodies = {}  # ProcedureDecl -> a cell holding its closure
+        self.frame_pools = {}  # ProcedureDecl -> FramePool
+
+    def compile(self, tree):
+        with _gc_paused():
+            FrameResolver().resolve(tree)
+            return self.visit(tree)
+
+    def operand(self, node):
+        """Return ('num', value) for a Num, ('var', name) for a variable
+        of the program block and (None, closure) for any other
+        expression node."""
+        if isinstance(node, Num):
+            return 'num', node.value
+        if isinstance(node, Var) and node.address is None:
+            return 'var', node.value
+        return None, self.visit(node)
+
+    def body(self, proc_decl):
+        # a procedure can be called before its body is compiled: from
+        # its own body or from the body of a nested procedure
+        cell = self.bodies.get(proc_decl)
+        if cell is None:
+            cell = self.bodies[proc_decl] = [None]
+        return cell
+
+    def load(self, address):
+        current = self.current
+        hops, slot = address
+        if hops == 0:
+            return lambda: current[0].slots[slot]
+        if hops == 1:
+            return lambda: current[0].enclosing.slots[slot]
+
+        def load():
+            ar = current[0]
+            for _ in range(hops):
+                ar = ar.enclosing
+            return ar.slots[slot]
+        return load
+
+    def store(self, address, value):
+        current = self.current
+        hops, slot = address
+        if hops == 0:
+            def assign():
+                current[0].slots[slot] = value()
+            return assign
+
+        def assign():
+            ar = current[0]
+            for _ in range(hops):
+                ar = ar.enclosing
+            ar.slots[slot] = value()
+        return assign
+
+    def visit_Program(self, node):
+        current = self.current
+        name = node.name
+        frame_size = node.frame_size
+        memory = self.memory
+        global_arrays = tuple(node.global_arrays)
+        block = self.visit(node.block)
+
+        def program():
+            # the program's own record holds its TempDecls
+            current[0] = ActivationRecord(name, node, [None] * frame_size)
+            for array_name, array_type in global_arrays:
+                memory[array_name] = array_type.allocate()
+            block()
+            current[0] = None
+        return program
+
+    def visit_Block(self, node):
+        for declaration in node.declarations:
+            if isinstance(declaration, ProcedureDecl):
+                self.visit(declaration)
+        return self.visit(node.compound_statement)
+
+    def visit_Compound(self, node):
+        statements = []
+        for child in node.children:
+            statement = self.visit(child)
+            if statement is not None:
+                statements.append(statement)
+        statements = tuple(statements)
+
+        if len(statements) == 1:
+            return statements[0]
+
+        def compound():
+            for statement in statements:
+                statement()
+        return compound
+
+    def visit_NoOp(self, node):
+        return None
+
+    def visit_For(self, node):
+        current = self.current
+        memory = self.memory
+        start = self.visit(node.start)
+        stop = self.visit(node.stop)
+        step = -1 if node.downto else 1
+        body = self.visit(node.body) or (lambda: None)
+        address = node.var_node.address
+
+        if address is None:
+            name = node.var_node.value
+
+            def global_loop():
+                for value in range(start(), stop() + step, step):
+                    memory[name] = value
+                    body()
+            return global_loop
+
+        hops, slot = address
+
+        def loop():
+            ar = current[0]
+            for _ in range(hops):
+                ar = ar.enclosing
+            slots = ar.slots
+            for value in range(start(), stop() + step, step):
+                slots[slot] = value
+                body()
+        return loop
+
+    def branch_condition(self, node):
+        """Return the closure of a condition without its NOTs and
+        whether there was an odd number of them: the NOTs then choose
+        the branch taken instead of computing a value."""
+        negated = False
+        while isinstance(node, UnaryOp) and node.op.type == TokenType.NOT:
+            node = node.expr
+            negated = not negated
+        return self.visit(node), negated
+
+    def visit_If(self, node):
+        condition, negated = self.branch_condition(node.condition)
+        then_branch = self.visit(node.then_branch)
+        else_branch = None
+        if node.else_branch is not None:
+            else_branch = self.visit(node.else_branch)
+        if negated:
+            then_branch, else_branch = else_branch, then_branch
+
+        if then_branch is None and else_branch is None:
+            # the condition may call functions
+            return condition
+        if else_branch is None:
+            def if_then():
+                if condition():
+                    then_branch()
+            return if_then
+        if then_branch is None:
+            def if_else():
+                if not condition():
+                    else_branch()
+            return if_else
+
+        def if_then_else():
+            if condition():
+                then_branch()
+            else:
+                else_branch()
+        return if_then_else
+
+    def visit_While(self, node):
+        condition, negated = self.branch_condition(node.condition)
+        body = self.visit(node.body) or (lambda: None)
+
+        if negated:
+            def loop():
+                while not condition():
+                    body()
+            return loop
+
+        def loop():
+            while condition():
+                body()
+        return loop
+
+    def visit_ProcedureDecl(self, node):
+        self.body(node)[0] = self.visit(node.block_node)
+        return None
+
+    def visit_ProcedureCall(self, node):
+        if isinstance(node.callee, BuiltinProcedureSymbol):
+            return self.builtin_call(node)
+        current = self.current
+        proc_decl = node.callee
+        body = self.body(proc_decl)
+        pool = self.frame_pools.get(proc_decl)
+        if pool is None:
+            pool = self.frame_pools[proc_decl] = FramePool(
+                proc_decl.proc_name,
+                proc_decl,
+                len(proc_decl.params),
+                proc_decl.frame_size,
+                proc_decl.local_arrays,
+            )
+        acquire = pool.acquire
+        release = pool.release
+        args = tuple(self.visit(param) for param in node.actual_params)
+        hops = node.static_hops
+
+        if isinstance(node, FunctionCall):
+            result_slot = proc_decl.result_slot
+
+            def call_function():
+                caller = current[0]
+                enclosing = caller
+                if hops is None:
+                    enclosing = None
+                else:
+                    for _ in range(hops):
+                        enclosing = enclosing.enclosing
+                ar = acquire([arg() for arg in args], enclosing)
+                current[0] = ar
+                body[0]()
+                current[0] = caller
+                value = ar.slots[result_slot]
+                release(ar)
+                return value
+            return call_function
+
+        def call():
+            caller = current[0]
+            enclosing = caller
+            if hops is None:
+                enclosing = None
+            else:
+                for _ in range(hops):
+                    enclosing = enclosing.enclosing
+            ar = acquire([arg() for arg in args], enclosing)
+            current[0] = ar
+            body[0]()
+            current[0] = caller
+            release(ar)
+        return call
+
+    def builtin_call(self, node):
+        function = node.callee.function
+        args = tuple(self.visit(param) for param in node.actual_params)
+        if isinstance(node.callee, OutputProcedureSymbol):
+            return self.output_call(function, args)
+        if len(args) == 1:
+            arg, = args
+            return lambda: function(arg())
+        first, second = args
+        return lambda: function(first(), second())
+
+    def output_call(self, function, args):
+        output = self.output
+        if not args:
+            return lambda: function(output, ())
+        if len(args) == 1:
+            arg, = args
+            return lambda: function(output, (arg(),))
+        return lambda: function(output, [arg() for arg in args])
+
+    def visit_Assign(self, node):
+        if isinstance(node.left, Index):
+            return self.store_element(node.left, self.visit(node.right))
+        if node.left.address is not None:
+            return self.store(node.left.address, self.visit(node.right))
+
+        memory = self.memory
+        get = memory.get
+        name = node.left.value
+        right = node.right
+
+        if (isinstance(right, BinOp) and
+                isinstance(right.left, (Var, Num)) and
+                isinstance(right.right, (Var, Num))):
+            op = right.function
+            left_kind, a = self.operand(right.left)
+            right_kind, b = self.operand(right.right)
+            if left_kind == 'var' and right_kind == 'var':
+                def assign():
+                    memory[name] = op(get(a), get(b))
+                return assign
+            if left_kind == 'var' and right_kind == 'num':
+                def assign():
+                    memory[name] = op(get(a), b)
+                return assign
+            if left_kind == 'num' and right_kind == 'var':
+                def assign():
+                    memory[name] = op(a, get(b))
+                return assign
+
+        kind, value = self.operand(right)
+        if kind == 'num':
+            def assign():
+                memory[name] = value
+        elif kind == 'var':
+            def assign():
+                memory[name] = get(value)
+        else:
+            def assign():
+                memory[name] = value()
+        return assign
+
+    def visit_BinOp(self, node):
+        get = self.memory.get
+        op = node.function
+        left_kind, a = self.operand(node.left)
+        right_kind, b = self.operand(node.right)
+
+        if left_kind == 'var':
+            if right_kind == 'var':
+                return lambda: op(get(a), get(b))
+            if right_kind == 'num':
+                return lambda: op(get(a), b)
+            return lambda: op(get(a), b())
+        if left_kind == 'num':
+            if right_kind == 'var':
+                return lambda: op(a, get(b))
+            if right_kind == 'num':
+                return lambda: op(a, b)
+            return lambda: op(a, b())
+        if right_kind == 'var':
+            return lambda: op(a(), get(b))
+        if right_kind == 'num':
+            return lambda: op(a(), b)
+        return lambda: op(a(), b())
+
+    def visit_BoolOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if node.short_circuit:
+            return lambda: left() or right()
+        return lambda: left() and right()
+
+    def visit_UnaryOp(self, node):
+        get = self.memory.get
+        kind, value = self.operand(node.expr)
+        if node.function is operator.not_:
+            # the operand of NOT is a BOOLEAN expression, never a
+            # variable or a number
+            return lambda: not value()
+        if node.function is operator.neg:
+            if kind == 'var':
+                return lambda: -get(value)
+            if kind == 'num':
+                return lambda: -value
+            return lambda: -value()
+        if kind == 'var':
+            return lambda: +get(value)
+        if kind == 'num':
+            return lambda: +value
+        return lambda: +value()
+
+    def visit_Num(self, node):
+        value = node.value
+        return lambda: value
+
+    def visit_Var(self, node):
+        if node.address is not None:
+            return self.load(node.address)
+        get = self.memory.get
+        name = node.value
+        return lambda: get(name)
+
+    def element(self, node):
+        """Return closures of the array of an Index node and of the
+        position of the element in it, which checks the bounds unless
+        the analysis proved them."""
+        elements = self.visit(node.var_node)
+        low, high = node.low, node.high
+        if isinstance(node.index, Num) and not node.checked:
+            position = node.index.value - low
+            return elements, lambda: position
+        index = self.visit(node.index)
+        if not node.checked:
+            if low == 0:
+                return elements, index
+            return elements, lambda: index() - low
+
+        def position():
+            value = index()
+            if not low <= value <= high:
+                raise IndexError('array index out of range')
+            return value - low
+        return elements, position
+
+    def visit_Index(self, node):
+        elements, position = self.element(node)
+        return lambda: elements()[position()]
+
+    def store_element(self, node, value):
+        elements, position = self.element(node)
+
+        def assign():
+            # the index first, as the other engines evaluate it
+            at = position()
+            elements()[at] = value()
+        return assign
+
+    def visit_TempStore(self, node):
+        temporaries = self.temporaries
+        index = node.index
+        expr = self.visit(node.expr)
+
+        def store():
+            value = temporaries[index] = expr()
+            return value
+        return store
+
+    def visit_TempLoad(self, node):
+        temporaries = self.temporaries
+        index = node.index
+        return lambda: temporaries[index]
+
+
+class ClosureInterpreter(object):
+    """Runs an analyzed AST compiled to closures by ClosureCompiler."""
+    def __init__(self, tree, output=None):
+        self.tree = tree
+        self.GLOBAL_MEMORY = {}
+        self.output = OutputBuffer() if output is None else output
+        self.code = ClosureCompiler(
+            self.GLOBAL_MEMORY, self.output
+        ).compile(tree)
+
+    def interpret(self):
+        if self.code is not None:
+            try:
+                self.code()
+            finally:
+                self.output.flush()
+
+
+###############################################################################
+#                                                                             #
+#  PYTHON CODE GENERATOR                                                      #
+#                                                                             #
+###############################################################################
+
+_PY_BINARY_OPS = {
+    TokenType.PLUS: pyast.Add,
+    TokenType.MINUS: pyast.Sub,
+    TokenType.MUL: pyast.Mult,
+    TokenType.INTEGER_DIV: pyast.FloorDiv,
+    TokenType.FLOAT_DIV: pyast.Div,
+    TokenType.SHL: pyast.LShift,
+    TokenType.SHR: pyast.RShift,
+}
+
+_PY_UNARY_OPS = {
+    TokenType.PLUS: pyast.UAdd,
+    TokenType.MINUS: pyast.USub,
+    TokenType.NOT: pyast.Not,
+}
+
+_PY_COMPARISONS = {
+    TokenType.EQUAL: pyast.Eq,
+    TokenType.NOT_EQUAL: pyast.NotEq,
+    TokenType.LESS: pyast.Lt,
+    TokenType.LESS_EQUAL: pyast.LtE,
+    TokenType.GREATER: pyast.Gt,
+    TokenType.GREATER_EQUAL: pyast.GtE,
+}
+
+
+def _py_name(name):
+    # Pascal identifiers are alphanumeric, so a trailing underscore
+    # can't clash with any other identifier
+    if name in ('None', 'True', 'False'):
+        return name + '_'
+    return name
+
+
+# the Python builtins the generated code calls, under names starting
+# with an underscore, which no Pascal identifier shadows
+_PY_BUILTINS = {'_range': range}
+
+
+class PyCodeCompiler(NodeVisitor):
+    """Lowers an analyzed Program to a Python ast.Module.
+
+    The program and every procedure become Python functions, nested the
+    way the Pascal scopes are nested, so every Pascal variable is a
+    local variable (a frame slot) of the function of its scope, and
+    nested procedures reach their enclosing scopes through closure
+    cells ('nonlocal' for the variables they assign). The arithmetic
+    maps to Python's operators: DIV to '//' and '/' to true division,
+    which always yields a float. AND and OR map to Python's and/or,
+    which short-circuit the same way.
+
+    Every generated node carries the position of its Pascal token, so a
+    traceback of the compiled program points into the Pascal source.
+    Running the module defines the program function; calling it runs the
+    program and returns the values of the program's variables. Pascal
+    functions and arrays aren't supported: a FunctionDecl or an ARRAY
+    declaration is a CompilerError.
+    """
+    def __init__(self):
+        # one dict per enclosing function: Pascal name -> Python name
+        self.scopes = []
+        # Python names the current function assigns in enclosing scopes
+        self.nonlocal_names = None
+
+    def compile(self, tree, filename='<pascal>'):
+        with _gc_paused():
+            module = pyast.Module(body=[self.visit(tree)], type_ignores=[])
+            return compile(module, filename, 'exec')
+
+    def locate(self, py_node, token):
+        """Give py_node the position of a Pascal token, or of the
+        beginning of the program if there is no token."""
+        if token is None:
+            py_node.lineno = py_node.end_lineno = 1
+            py_node.col_offset = py_node.end_col_offset = 0
+        else:
+            py_node.lineno = py_node.end_lineno = token.lineno
+            py_node.col_offset = token.column - 1
+            py_node.end_col_offset = token.column - 1 + len(str(token.value))
+        return py_node
+
+    def function(self, name, params, block_node, token, result_names=None):
+        for declaration in block_node.declarations:
+            if (isinstance(declaration, VarDecl) and
+                    isinstance(declaration.type_node, ArrayType)):
+                raise CompilerError(
+                    error_code=ErrorCode.UNSUPPORTED,
+                    token=declaration.type_node.token,
+                    message=f'{ErrorCode.UNSUPPORTED.value} -> '
+                            f'{declaration.type_node.token}',
+                )
+        scope = {}
+        for param in params:
+            scope[param.var_node.value] = _py_name(param.var_node.value)
+        local_names = [
+            declaration.var_node.value
+            for declaration in block_node.declarations
+            if isinstance(declaration, VarDecl)
+        ]
+        for local_name in local_names:
+            scope[local_name] = _py_name(local_name)
+
+        self.scopes.append(scope)
+        nested_functions = [
+            self.visit(declaration)
+            for declaration in block_node.declarations
+            if isinstance(declaration, ProcedureDecl)
+        ]
+        enclosing_nonlocal_names = self.nonlocal_names
+        self.nonlocal_names = set()
+        statements = self.visit(block_node.compound_statement)
+        nonlocal_names = self.nonlocal_names
+        self.nonlocal_names = enclosing_nonlocal_names
+        self.scopes.pop()
+
+        locate = self.locate
+        body = []
+        if nonlocal_names:
+            body.append(locate(
+                pyast.Nonlocal(names=sorted(nonlocal_names)), token
+            ))
+        # Pascal variables start out undefined: None makes reading one
+        # fail the same way it does in Interpreter
+        for local_name in local_names:
+            body.append(locate(pyast.Assign(
+                targets=[locate(
+                    pyast.Name(id=scope[local_name], ctx=pyast.Store()),
+                    token,
+                )],
+                value=locate(pyast.Constant(value=None), token),
+            ), token))
+        body.extend(nested_functions)
+        body.extend(statements)
+        if result_names is not None:
+            body.append(locate(pyast.Return(value=locate(pyast.Tuple(
+                elts=[
+                    locate(
+                        pyast.Name(id=scope[result_name], ctx=pyast.Load()),
+                        token,
+                    )
+                    for result_name in result_names
+                ],
+                ctx=pyast.Load(),
+            ), token)), token))
+        if not body:
+            body.append(locate(pyast.Pass(), token))
+
+        function_def = pyast.FunctionDef(
+            name=_py_name(name),
+            args=pyast.arguments(
+                posonlyargs=[],
+                args=[
+                    locate(
+                        pyast.arg(arg=_py_name(param.var_node.value)),
+                        param.var_node.token,
+                    )
+                    for param in params
+                ],
+                kwonlyargs=[],
+                kw_defaults=[],
+                defaults=[],
+            ),
+            body=body,
+            decorator_list=[],
+            returns=None,
+        )
+        if 'type_params' in pyast.FunctionDef._fields:
+            function_def.type_params = []  # Python 3.12+
+        return locate(function_def, token)
+
+    def visit_Program(self, node):
+        self.result_names = [
+            declaration.var_node.value
+            for declaration in node.block.declarations
+            if isinstance(declaration, VarDecl) and
+            not isinstance(declaration, TempDecl)
+        ]
+        return self.function(
+            node.name, [], node.block, None, result_names=self.result_names
+        )
+
+    def visit_ProcedureDecl(self, node):
+        return self.function(
+            node.proc_name, node.params, node.block_node, node.token
+        )
+
+    def visit_FunctionDecl(self, node):
+        raise CompilerError(
+            error_code=ErrorCode.UNSUPPORTED,
+            token=node.token,
+            message=f'{ErrorCode.UNSUPPORTED.value} -> {node.token}',
+        )
+
+    def visit_Compound(self, node):
+        statements = []
+        for child in node.children:
+            statement = self.visit(child)
+            if isinstance(statement, list):
+                statements.extend(statement)
+            elif statement is not None:
+                statements.append(statement)
+        return statements
+
+    def visit_NoOp(self, node):
+        return None
+
+    def visit_Assign(self, node):
+        var_name = node.left.value
+        if var_name not in self.scopes[-1]:
+            # a variable of an enclosing scope
+            self.nonlocal_names.add(_py_name(var_name))
+        target = self.locate(
+            pyast.Name(id=_py_name(var_name), ctx=pyast.Store()),
+            node.left.token,
+        )
+        return self.locate(
+            pyast.Assign(targets=[target], value=self.visit(node.right)),
+            node.left.token,
+        )
+
+    def visit_For(self, node):
+        var_name = node.var_node.value
+        if var_name not in self.scopes[-1]:
+            self.nonlocal_names.add(_py_name(var_name))
+        locate = self.locate
+        token = node.token
+        # _range(start, stop + 1) or _range(start, stop - 1, -1)
+        step = -1 if node.downto else 1
+        range_args = [
+            self.visit(node.start),
+            locate(pyast.BinOp(
+                left=self.visit(node.stop),
+                op=pyast.Add(),
+                right=locate(pyast.Constant(value=step), token),
+            ), token),
+        ]
+        if node.downto:
+            range_args.append(locate(pyast.Constant(value=step), token))
+
+        body = self.statements(node.body, token)
+        return locate(pyast.For(
+            target=locate(
+                pyast.Name(id=_py_name(var_name), ctx=pyast.Store()),
+                node.var_node.token,
+            ),
+            iter=locate(pyast.Call(
+                func=locate(
+                    pyast.Name(id='_range', ctx=pyast.Load()), token
+                ),
+                args=range_args,
+                keywords=[],
+            ), token),
+            body=body,
+            orelse=[],
+        ), token)
+
+    def statements(self, node, token):
+        """Return the non-empty list of Python statements of a Pascal
+        statement in the body of a compound Python statement."""
+        statements = self.visit(node)
+        if statements is None:
+            statements = []
+        elif not isinstance(statements, list):
+            statements = [statements]
+        return statements or [self.locate(pyast.Pass(), token)]
+
+    def visit_If(self, node):
+        orelse = []
+        if node.else_branch is not None:
+            orelse = self.statements(node.else_branch, node.token)
+        return self.locate(pyast.If(
+            test=self.visit(node.condition),
+            body=self.statements(node.then_branch, node.token),
+            orelse=orelse,
+        ), node.token)
+
+    def visit_While(self, node):
+        return self.locate(pyast.While(
+            test=self.visit(node.condition),
+            body=self.statements(node.body, node.token),
+            orelse=[],
+        ), node.token)
 
     def visit_ProcedureCall(self, node):
-        for param_node in node.actual_params:
-            self.visit(param_node)
+        if isinstance(node.proc_symbol, BuiltinProcedureSymbol):
+            raise CompilerError(
+                error_code=ErrorCode.UNSUPPORTED,
+                token=node.token,
+                message=f'{ErrorCode.UNSUPPORTED.value} -> {node.token}',
+            )
+        call = pyast.Call(
+            func=self.locate(
+                pyast.Name(id=_py_name(node.proc_name), ctx=pyast.Load()),
+                node.token,
+            ),
+            args=[self.visit(param) for param in node.actual_params],
+            keywords=[],
+        )
+        return self.locate(
+            pyast.Expr(value=self.locate(call, node.token)), node.token
+        )
+
+    def visit_BinOp(self, node):
+        if node.op.type in RELATIONAL_OPERATORS:
+            return self.locate(
+                pyast.Compare(
+                    left=self.visit(node.left),
+                    ops=[_PY_COMPARISONS[node.op.type]()],
+                    comparators=[self.visit(node.right)],
+                ),
+                node.token,
+            )
+        return self.locate(
+            pyast.BinOp(
+                left=self.visit(node.left),
+                op=_PY_BINARY_OPS[node.op.type](),
+                right=self.visit(node.right),
+            ),
+            node.token,
+        )
+
+    def visit_BoolOp(self, node):
+        return self.locate(
+            pyast.BoolOp(
+                op=pyast.Or() if node.short_circuit else pyast.And(),
+                values=[self.visit(node.left), self.visit(node.right)],
+            ),
+            node.token,
+        )
+
+    def visit_UnaryOp(self, node):
+        return self.locate(
+            pyast.UnaryOp(
+                op=_PY_UNARY_OPS[node.op.type](),
+                operand=self.visit(node.expr),
+            ),
+            node.token,
+        )
+
+    def visit_Num(self, node):
+        return self.locate(pyast.Constant(value=node.value), node.token)
+
+    def visit_Var(self, node):
+        return self.locate(
+            pyast.Name(id=_py_name(node.value), ctx=pyast.Load()),
+            node.token,
+        )
+
+    # Pascal identifiers have no underscores, so the names of the
+    # temporaries can't clash with the variables
+
+    def visit_TempStore(self, node):
+        return self.locate(
+            pyast.NamedExpr(
+                target=self.locate(
+                    pyast.Name(id=f'_t{node.index}', ctx=pyast.Store()),
+                    node.token,
+                ),
+                value=self.visit(node.expr),
+            ),
+            node.token,
+        )
+
+    def visit_TempLoad(self, node):
+        return self.locate(
+            pyast.Name(id=f'_t{node.index}', ctx=pyast.Load()),
+            node.token,
+        )
+
+
+class PyCodeInterpreter(object):
+    """Runs an analyzed AST compiled to a Python code object by
+    PyCodeCompiler, so CPython's bytecode interpreter executes it.
+    """
+    def __init__(self, tree, filename='<pascal>'):
+        self.tree = tree
+        self.GLOBAL_MEMORY = {}
+        compiler = PyCodeCompiler()
+        self.code = compiler.compile(tree, filename)
+        self.result_names = compiler.result_names
+        self.program_name = _py_name(tree.name)
+
+    def interpret(self):
+        namespace = dict(_PY_BUILTINS)
+        exec(self.code, namespace)
+        values = namespace[self.program_name]()
+        self.GLOBAL_MEMORY.clear()
+        for name, value in zip(self.result_names, values):
+            # variables that were never assigned are left out,
+            # same as in Interpreter
+            if value is not None:
+                self.GLOBAL_MEMORY[name] = value
 
 
 ###############################################################################
 #                                                                             #
-#  INTERPRETER                                                                #
+#  BYTECODE VIRTUAL MACHINE                                                   #
 #                                                                             #
 ###############################################################################
 
-class Interpreter(NodeVisitor):
-    def __init__(self, tree):
-        self.tree = tree
-        self.GLOBAL_MEMORY = {}
+class OpCode(IntEnum):
+    # instructions with an operand
+    LOAD_CONST    = 1  # push consts[operand]
+    LOAD_VAR      = 2  # push the variable in slot operand
+    STORE_VAR     = 3  # pop a value into slot operand
+    LOAD_LOCAL    = 4  # push slot operand of the running procedure's frame
+    STORE_LOCAL   = 5  # pop a value into slot operand of that frame
+    # instructions with two operands: a number of static links to
+    # follow from the running frame and a slot of the frame reached, or
+    # the index of a procedure and where its static link points
+    LOAD_OUTER    = 6
+    STORE_OUTER   = 7
+    CALL          = 8  # see VirtualMachine
+    # instructions without an operand
+    RETURN        = 9  # resume the caller after its CALL
+    ADD           = 10
+    SUB           = 11
+    MUL           = 12
+    INT_DIV       = 13
+    FLOAT_DIV     = 14
+    NEG           = 15
+    POS           = 16
+    DUP           = 17  # push the value on top of the stack again
+    SHL           = 18
+    SHR           = 19
+    # comparisons push True or False
+    EQUAL         = 20
+    NOT_EQUAL     = 21
+    LESS          = 22
+    LESS_EQUAL    = 23
+    GREATER       = 24
+    GREATER_EQUAL = 25
+    # instructions with an operand, the position to jump to
+    JUMP          = 30
+    JUMP_IF_FALSE = 31  # pop a value and jump if it is false
+    JUMP_IF_TRUE  = 32  # pop a value and jump if it is true
+
+
+# the number of operands that follow the opcodes that have some
+_OPERAND_COUNTS = {
+    OpCode.LOAD_CONST: 1,
+    OpCode.LOAD_VAR: 1,
+    OpCode.STORE_VAR: 1,
+    OpCode.LOAD_LOCAL: 1,
+    OpCode.STORE_LOCAL: 1,
+    OpCode.LOAD_OUTER: 2,
+    OpCode.STORE_OUTER: 2,
+    OpCode.CALL: 2,
+    OpCode.JUMP: 1,
+    OpCode.JUMP_IF_FALSE: 1,
+    OpCode.JUMP_IF_TRUE: 1,
+}
+
+_BINARY_OPCODES = {
+    TokenType.PLUS: OpCode.ADD,
+    TokenType.MINUS: OpCode.SUB,
+    TokenType.MUL: OpCode.MUL,
+    TokenType.INTEGER_DIV: OpCode.INT_DIV,
+    TokenType.FLOAT_DIV: OpCode.FLOAT_DIV,
+    TokenType.SHL: OpCode.SHL,
+    TokenType.SHR: OpCode.SHR,
+    TokenType.EQUAL: OpCode.EQUAL,
+    TokenType.NOT_EQUAL: OpCode.NOT_EQUAL,
+    TokenType.LESS: OpCode.LESS,
+    TokenType.LESS_EQUAL: OpCode.LESS_EQUAL,
+    TokenType.GREATER: OpCode.GREATER,
+    TokenType.GREATER_EQUAL: OpCode.GREATER_EQUAL,
+}
+
+_UNARY_OPCODES = {
+    TokenType.PLUS: OpCode.POS,
+    TokenType.MINUS: OpCode.NEG,
+}
+
+
+class BytecodeProcedure(object):
+    """A procedure or function of a Bytecode program.
+
+    Its code starts at 'entry' and ends with a RETURN, which a function
+    precedes by pushing its result. 'variables' names the slots of its
+    frames as FrameResolver lays them out: the parameters, a function's
+    result, then the local variables. 'enclosing' is the index of the
+    procedure it is declared in, -1 for the program block.
+    """
+    __slots__ = ('name', 'entry', 'variables', 'param_count', 'enclosing')
 
-    def visit_Program(self, node):
-        self.visit(node.block)
+    def __init__(self, name, entry, variables, param_count, enclosing):
+        self.name = name
+        self.entry = entry
+        self.variables = variables
+        self.param_count = param_count
+        self.enclosing = enclosing
+
+
+class Bytecode(object):
+    """A program compiled for the VirtualMachine.
+
+    'code' is a flat array('i') of opcodes, each followed by its operands
+    if it has some. Operands are indices into 'consts' (the constant
+    pool), variable slots, indices into 'procedures' or positions in
+    the code to jump to, and 'names' maps
+    the slots of the program's variables back to their names. The slots
+    of the 'temporaries' compiler temporaries follow those of the
+    variables. The code of the procedures comes first; that of the
+    program block starts at 'entry'. Bytecode holds no reference to the
+    AST, so it is cheap to pickle or to save to a file (see dumps) and
+    run somewhere else.
+    """
+    MAGIC = b'SPIB'
+    VERSION = 3
+    _HEADER = struct.Struct('<4sH')
 
-    def visit_Block(self, node):
-        for declaration in node.declarations:
-            self.visit(declaration)
-        self.visit(node.compound_statement)
+    def __init__(self, name, code, consts, names, temporaries=0,
+                 procedures=(), entry=0):
+        self.name = name
+        self.code = code
+        self.consts = consts
+        self.names = names
+        self.temporaries = temporaries
+        self.procedures = list(procedures)
+        self.entry = entry
+
+    def dumps(self):
+        """Return the bytes of a bytecode file: a header with a magic
+        number and the format version followed by a marshalled tuple of
+        the program name, the names, the constants, the number of
+        temporaries, the entry, a tuple per procedure and the code as
+        little-endian 32-bit integers.
+        """
+        code = array('i', self.code)
+        if sys.byteorder == 'big':
+            code.byteswap()
+        payload = marshal.dumps((
+            self.name,
+            tuple(self.names),
+            tuple(self.consts),
+            self.temporaries,
+            self.entry,
+            tuple(
+                (procedure.name, procedure.entry, tuple(procedure.variables),
+                 procedure.param_count, procedure.enclosing)
+                for procedure in self.procedures
+            ),
+            code.tobytes(),
+        ))
+        return self._HEADER.pack(self.MAGIC, self.VERSION) + payload
+
+    @classmethod
+    def loads(cls, data):
+        magic, version = cls._HEADER.unpack_from(data)
+        if magic != cls.MAGIC:
+            raise ValueError('Not a bytecode file')
+        if version != cls.VERSION:
+            raise ValueError(f'Unsupported bytecode version {version}')
+        (name, names, consts, temporaries, entry, procedures,
+         code_bytes) = marshal.loads(data[cls._HEADER.size:])
+        code = array('i')
+        code.frombytes(code_bytes)
+        if sys.byteorder == 'big':
+            code.byteswap()
+        procedures = [
+            BytecodeProcedure(name_, entry_, list(variables), *rest)
+            for name_, entry_, variables, *rest in procedures
+        ]
+        return cls(
+            name, code, list(consts), list(names), temporaries, procedures,
+            entry,
+        )
 
-    def visit_VarDecl(self, node):
-        # Do nothing
-        pass
+    def disassemble(self):
+        """Return a listing of the instructions, one per line. If the
+        program has procedures, a line with its name precedes the code
+        of each and of the program block."""
+        lines = []
+        code = self.code
+        entries = {procedure.entry: procedure for procedure in self.procedures}
+        procedure = None
+        pc = 0
+        while pc < len(code):
+            if pc in entries:
+                procedure = entries[pc]
+                lines.append(f'{procedure.name}:')
+            elif pc == self.entry and self.procedures:
+                procedure = None
+                lines.append(f'{self.name}:')
+            opcode = OpCode(code[pc])
+            count = _OPERAND_COUNTS.get(opcode, 0)
+            if count:
+                operands = code[pc + 1:pc + 1 + count]
+                line = '{:>6} {:<13} {}'.format(
+                    pc, opcode.name,
+                    ' '.join('{:>4}'.format(operand) for operand in operands),
+                )
+                argument = self.argument(opcode, operands, procedure)
+                if argument is not None:
+                    line += f' ({argument})'
+                lines.append(line)
+                pc += 1 + count
+            else:
+                lines.append('{:>6} {}'.format(pc, opcode.name))
+                pc += 1
+        return '\n'.join(lines)
+
+    def argument(self, opcode, operands, procedure):
+        """Return what the operands of an instruction of 'procedure'
+        (None for the program block) refer to, for disassemble, or None
+        for a jump."""
+        operand = operands[0]
+        if opcode >= OpCode.JUMP:
+            return None
+        if opcode == OpCode.LOAD_CONST:
+            return repr(self.consts[operand])
+        if opcode == OpCode.CALL:
+            return self.procedures[operand].name
+        if opcode in (OpCode.LOAD_LOCAL, OpCode.STORE_LOCAL):
+            return procedure.variables[operand]
+        if opcode in (OpCode.LOAD_OUTER, OpCode.STORE_OUTER):
+            for _ in range(operand):
+                procedure = self.procedures[procedure.enclosing]
+            return f'{procedure.name}.{procedure.variables[operands[1]]}'
+        if operand < len(self.names):
+            return self.names[operand]
+        return f'$t{operand - len(self.names)}'
+
+
+class BytecodeCompiler(NodeVisitor):
+    """Compiles an analyzed Program to Bytecode for the stack-based
+    VirtualMachine.
+
+    The program's variables get slots in declaration order, followed
+    by the temporary slots of its TempDecls and of the compiler
+    temporaries. Each procedure and function gets a BytecodeProcedure,
+    and its variables live in the frames FrameResolver lays out. An IF
+    or WHILE condition compiles to comparisons and conditional jumps,
+    AND and OR jumping past their right operand when the left one
+    decides. A FOR statement is a CompilerError, as is an ARRAY variable
+    or a call of a builtin procedure.
+    """
+    def __init__(self):
+        self.code = array('i')
+        self.consts = []
+        self.const_indices = {}
+        self.names = []
+        self.slots = {}
+        self.temporaries = 0
+        self.temp_decls = 0
+        self.procedures = []
+        self.procedure_indices = {}  # ProcedureDecl -> index in procedures
+        self.procedure = None  # the ProcedureDecl being compiled
+        self.entry = 0
+
+    def compile(self, tree):
+        FrameResolver().resolve(tree)
+        self.visit(tree)
+        return Bytecode(
+            tree.name, self.code, self.consts, self.names, self.temporaries,
+            self.procedures, self.entry,
+        )
 
-    def visit_Type(self, node):
-        # Do nothing
-        pass
+    def error(self, error_code, token):
+        raise CompilerError(
+            error_code=error_code,
+            token=token,
+            message=f'{error_code.value} -> {token}',
+        )
 
-    def visit_BinOp(self, node):
-        if node.op.type == TokenType.PLUS:
-            return self.visit(node.left) + self.visit(node.right)
-        elif node.op.type == TokenType.MINUS:
-            return self.visit(node.left) - self.visit(node.right)
-        elif node.op.type == TokenType.MUL:
-            return self.visit(node.left) * self.visit(node.right)
-        elif node.op.type == TokenType.INTEGER_DIV:
-            return self.visit(node.left) // self.visit(node.right)
-        elif node.op.type == TokenType.FLOAT_DIV:
-            return float(self.visit(node.left)) / float(self.visit(node.right))
+    def emit(self, opcode, *operands):
+        self.code.append(opcode)
+        self.code.extend(operands)
 
-    def visit_Num(self, node):
-        return node.value
+    def jump(self, opcode, label):
+        """Emit a jump to a label, a list of the positions of the jumps
+        to it that place() fills in."""
+        self.emit(opcode, 0)
+        label.append(len(self.code) - 1)
 
-    def visit_UnaryOp(self, node):
-        op = node.op.type
-        if op == TokenType.PLUS:
-            return +self.visit(node.expr)
-        elif op == TokenType.MINUS:
-            return -self.visit(node.expr)
+    def place(self, label):
+        """Make the jumps to label jump to the next instruction."""
+        for position in label:
+            self.code[position] = len(self.code)
+
+    def visit_Program(self, node):
+        temp_decls = []
+        for declaration in node.block.declarations:
+            if isinstance(declaration, TempDecl):
+                temp_decls.append(declaration.var_node.value)
+            elif isinstance(declaration, VarDecl):
+                if isinstance(declaration.type_node, ArrayType):
+                    self.error(
+                        ErrorCode.UNSUPPORTED, declaration.type_node.token
+                    )
+                name = declaration.var_node.value
+                self.slots[name] = len(self.names)
+                self.names.append(name)
+        for name in temp_decls:
+            self.slots[name] = len(self.names) + self.temp_decls
+            self.temp_decls += 1
+        self.temporaries = self.temp_decls
+        self.declare_procedures(node.block, -1)
+        self.visit_procedures(node.block)
+        self.entry = len(self.code)
+        self.visit(node.block.compound_statement)
+
+    def declare_procedures(self, block, enclosing):
+        """Add a BytecodeProcedure for each procedure declared in block
+        and, recursively, in theirs."""
+        for declaration in block.declarations:
+            if not isinstance(declaration, ProcedureDecl):
+                continue
+            variables = [param.var_node.value for param in declaration.params]
+            if isinstance(declaration, FunctionDecl):
+                variables.append(declaration.proc_name)
+            for local in declaration.block_node.declarations:
+                if isinstance(local, VarDecl):
+                    if isinstance(local.type_node, ArrayType):
+                        self.error(
+                            ErrorCode.UNSUPPORTED, local.type_node.token
+                        )
+                    variables.append(local.var_node.value)
+            index = self.procedure_indices[declaration] = len(self.procedures)
+            self.procedures.append(BytecodeProcedure(
+                declaration.proc_name, None, variables,
+                len(declaration.params), enclosing,
+            ))
+            self.declare_procedures(declaration.block_node, index)
+
+    def visit_procedures(self, block):
+        for declaration in block.declarations:
+            if isinstance(declaration, ProcedureDecl):
+                self.visit(declaration)
+
+    def visit_ProcedureDecl(self, node):
+        self.visit_procedures(node.block_node)
+        enclosing, self.procedure = self.procedure, node
+        self.procedures[self.procedure_indices[node]].entry = len(self.code)
+        self.visit(node.block_node.compound_statement)
+        if isinstance(node, FunctionDecl):
+            self.emit(OpCode.LOAD_LOCAL, node.result_slot)
+        self.emit(OpCode.RETURN)
+        self.procedure = enclosing
 
     def visit_Compound(self, node):
         for child in node.children:
             self.visit(child)
 
+    def visit_NoOp(self, node):
+        pass
+
+    def visit_ProcedureCall(self, node):
+        if isinstance(node.callee, BuiltinProcedureSymbol):
+            self.error(ErrorCode.UNSUPPORTED, node.token)
+        for param_node in node.actual_params:
+            self.visit(param_node)
+        hops = -1 if node.static_hops is None else node.static_hops
+        self.emit(OpCode.CALL, self.procedure_indices[node.callee], hops)
+
+    def visit_For(self, node):
+        self.error(ErrorCode.UNSUPPORTED, node.token)
+
+    def visit_If(self, node):
+        end = []
+        if node.else_branch is None:
+            self.branch(node.condition, False, end)
+            self.visit(node.then_branch)
+        else:
+            else_branch = []
+            self.branch(node.condition, False, else_branch)
+            self.visit(node.then_branch)
+            self.jump(OpCode.JUMP, end)
+            self.place(else_branch)
+            self.visit(node.else_branch)
+        self.place(end)
+
+    def visit_While(self, node):
+        loop = len(self.code)
+        end = []
+        self.branch(node.condition, False, end)
+        self.visit(node.body)
+        self.emit(OpCode.JUMP, loop)
+        self.place(end)
+
+    def branch(self, node, if_true, label):
+        """Emit the code of a condition that jumps to label if its value
+        is if_true and goes on with the next instruction otherwise."""
+        if isinstance(node, UnaryOp):  # NOT
+            self.branch(node.expr, not if_true, label)
+        elif isinstance(node, BoolOp):
+            if if_true == node.short_circuit:
+                # either operand decides
+                self.branch(node.left, if_true, label)
+                self.branch(node.right, if_true, label)
+            else:
+                # the right operand decides unless the left one does
+                skip = []
+                self.branch(node.left, not if_true, skip)
+                self.branch(node.right, if_true, label)
+                self.place(skip)
+        elif isinstance(node, Num):
+            # a condition the optimizer folded
+            if bool(node.value) == if_true:
+                self.jump(OpCode.JUMP, label)
+        else:
+            self.visit(node)
+            if if_true:
+                self.jump(OpCode.JUMP_IF_TRUE, label)
+            else:
+                self.jump(OpCode.JUMP_IF_FALSE, label)
+
     def visit_Assign(self, node):
-        var_name = node.left.value
-        var_value = self.visit(node.right)
-        self.GLOBAL_MEMORY[var_name] = var_value
+        self.visit(node.right)
+        var = node.left
+        if var.address is None or self.procedure is None:
+            self.emit(OpCode.STORE_VAR, self.slots[var.value])
+        elif var.address[0] == 0:
+            self.emit(OpCode.STORE_LOCAL, var.address[1])
+        else:
+            self.emit(OpCode.STORE_OUTER, *var.address)
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        self.emit(_BINARY_OPCODES[node.op.type])
+
+    def visit_UnaryOp(self, node):
+        self.visit(node.expr)
+        self.emit(_UNARY_OPCODES[node.op.type])
+
+    def visit_Num(self, node):
+        # 1 and 1.0 are equal keys of a dict, hence the type in the key
+        key = (type(node.value), node.value)
+        index = self.const_indices.get(key)
+        if index is None:
+            index = self.const_indices[key] = len(self.consts)
+            self.consts.append(node.value)
+        self.emit(OpCode.LOAD_CONST, index)
 
     def visit_Var(self, node):
-        var_name = node.value
-        var_value = self.GLOBAL_MEMORY.get(var_name)
-        return var_value
+        # the program block reaches its TempDecls by name, too
+        if node.address is None or self.procedure is None:
+            self.emit(OpCode.LOAD_VAR, self.slots[node.value])
+        elif node.address[0] == 0:
+            self.emit(OpCode.LOAD_LOCAL, node.address[1])
+        else:
+            self.emit(OpCode.LOAD_OUTER, *node.address)
 
-    def visit_NoOp(self, node):
-        pass
+    def temporary_slot(self, node):
+        slot = self.temp_decls + node.index
+        self.temporaries = max(self.temporaries, slot + 1)
+        return len(self.names) + slot
+
+    def visit_TempStore(self, node):
+        self.visit(node.expr)
+        self.emit(OpCode.DUP)
+        self.emit(OpCode.STORE_VAR, self.temporary_slot(node))
+
+    def visit_TempLoad(self, node):
+        self.emit(OpCode.LOAD_VAR, self.temporary_slot(node))
+
+
+class VirtualMachine(object):
+    """Executes Bytecode with an operand stack and one slot per variable.
+
+    The dispatch loop compares the opcode with plain ints, most frequent
+    instructions first; there is no method lookup per instruction.
+
+    CALL pops the arguments into a new frame: a list of the slots of the
+    procedure's variables followed by its static link, the frame of the
+    procedure it is declared in (None for the program block). The return
+    address and the caller's frame go on a stack of their own, so deep
+    recursion uses no Python stack.
+    """
+    def __init__(self, bytecode):
+        self.bytecode = bytecode
+        self.GLOBAL_MEMORY = {}
+        self.instructions_executed = 0
+
+    def run(self, slots):
+        """Execute the code on slots and return the number of
+        instructions executed."""
+        LOAD_CONST = OpCode.LOAD_CONST.value
+        LOAD_VAR = OpCode.LOAD_VAR.value
+        STORE_VAR = OpCode.STORE_VAR.value
+        LOAD_LOCAL = OpCode.LOAD_LOCAL.value
+        STORE_LOCAL = OpCode.STORE_LOCAL.value
+        LOAD_OUTER = OpCode.LOAD_OUTER.value
+        CALL = OpCode.CALL.value
+        RETURN = OpCode.RETURN.value
+        ADD = OpCode.ADD.value
+        SUB = OpCode.SUB.value
+        MUL = OpCode.MUL.value
+        INT_DIV = OpCode.INT_DIV.value
+        FLOAT_DIV = OpCode.FLOAT_DIV.value
+        NEG = OpCode.NEG.value
+        POS = OpCode.POS.value
+        SHL = OpCode.SHL.value
+        SHR = OpCode.SHR.value
+        EQUAL = OpCode.EQUAL.value
+        NOT_EQUAL = OpCode.NOT_EQUAL.value
+        LESS = OpCode.LESS.value
+        LESS_EQUAL = OpCode.LESS_EQUAL.value
+        GREATER = OpCode.GREATER.value
+        GREATER_EQUAL = OpCode.GREATER_EQUAL.value
+        JUMP = OpCode.JUMP.value
+        JUMP_IF_FALSE = OpCode.JUMP_IF_FALSE.value
+
+        code = self.bytecode.code.tolist()
+        consts = self.bytecode.consts
+        # (entry, number of parameters, the other slots of a new frame)
+        procedures = [
+            (procedure.entry, procedure.param_count,
+             [None] * (len(procedure.variables) - procedure.param_count))
+            for procedure in self.bytecode.procedures
+        ]
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        returns = []  # (return address, frame) of each active call
+        frame = None
+        pc = self.bytecode.entry
+        end = len(code)
+        executed = 0
+        while pc < end:
+            op = code[pc]
+            executed += 1
+            if op == LOAD_VAR:
+                push(slots[code[pc + 1]])
+                pc += 2
+            elif op == LOAD_CONST:
+                push(consts[code[pc + 1]])
+                pc += 2
+            elif op == STORE_VAR:
+                slots[code[pc + 1]] = pop()
+                pc += 2
+            elif op == LOAD_LOCAL:
+                push(frame[code[pc + 1]])
+                pc += 2
+            elif op == STORE_LOCAL:
+                frame[code[pc + 1]] = pop()
+                pc += 2
+            elif op >= JUMP:
+                if op == JUMP_IF_FALSE:
+                    pc = pc + 2 if pop() else code[pc + 1]
+                elif op == JUMP:
+                    pc = code[pc + 1]
+                else:  # JUMP_IF_TRUE
+                    pc = code[pc + 1] if pop() else pc + 2
+            elif op >= ADD:
+                if op == ADD:
+                    right = pop()
+                    stack[-1] = stack[-1] + right
+                elif op == MUL:
+                    right = pop()
+                    stack[-1] = stack[-1] * right
+                elif op == SUB:
+                    right = pop()
+                    stack[-1] = stack[-1] - right
+                elif op == INT_DIV:
+                    right = pop()
+                    stack[-1] = stack[-1] // right
+                elif op == FLOAT_DIV:
+                    right = pop()
+                    stack[-1] = stack[-1] / right
+                elif op == NEG:
+                    stack[-1] = -stack[-1]
+                elif op == SHL:
+                    right = pop()
+                    stack[-1] = stack[-1] << right
+                elif op == SHR:
+                    right = pop()
+                    stack[-1] = stack[-1] >> right
+                elif op == LESS:
+                    right = pop()
+                    stack[-1] = stack[-1] < right
+                elif op == NOT_EQUAL:
+                    right = pop()
+                    stack[-1] = stack[-1] != right
+                elif op == EQUAL:
+                    right = pop()
+                    stack[-1] = stack[-1] == right
+                elif op == GREATER:
+                    right = pop()
+                    stack[-1] = stack[-1] > right
+                elif op == LESS_EQUAL:
+                    right = pop()
+                    stack[-1] = stack[-1] <= right
+                elif op == GREATER_EQUAL:
+                    right = pop()
+                    stack[-1] = stack[-1] >= right
+                elif op == POS:
+                    stack[-1] = +stack[-1]
+                else:  # DUP
+                    push(stack[-1])
+                pc += 1
+            elif op == CALL:
+                entry, param_count, blank = procedures[code[pc + 1]]
+                hops = code[pc + 2]
+                if hops < 0:
+                    link = None
+                else:
+                    link = frame
+                    for _ in range(hops):
+                        link = link[-1]
+                if param_count:
+                    callee = stack[-param_count:]
+                    del stack[-param_count:]
+                else:
+                    callee = []
+                callee += blank
+                callee.append(link)
+                returns.append((pc + 3, frame))
+                frame = callee
+                pc = entry
+            elif op == RETURN:
+                pc, frame = returns.pop()
+            else:
+                outer = frame
+                for _ in range(code[pc + 1]):
+                    outer = outer[-1]
+                if op == LOAD_OUTER:
+                    push(outer[code[pc + 2]])
+                else:  # STORE_OUTER
+                    outer[code[pc + 2]] = pop()
+                pc += 3
+        return executed
+    def interpret(self):
+        # None marks a variable that has never been assigned
+        slots = [None] * (
+            len(self.bytecode.names) + self.bytecode.temporaries
+        )
+        self.instructions_executed = self.run(slots)
+        self.GLOBAL_MEMORY.clear()
+        for name, value in zip(self.bytecode.names, slots):
+            if value is not None:
+                self.GLOBAL_MEMORY[name] = value
+
+
+class VMInterpreter(VirtualMachine):
+    """Compiles an analyzed AST with BytecodeCompiler and runs it."""
+    def __init__(self, tree):
+        super().__init__(BytecodeCompiler().compile(tree))
+        self.tree = tree
+
+
+###############################################################################
+#                                                                             #
+#  REGISTER VIRTUAL MACHINE                                                   #
+#                                                                             #
+###############################################################################
+
+class RegisterOpCode(IntEnum):
+    MOVE          = 1  # MOVE dst, src
+    ADD           = 2  # ADD dst, left, right
+    SUB           = 3
+    MUL           = 4
+    INT_DIV       = 5
+    FLOAT_DIV     = 6
+    NEG           = 7  # NEG dst, src
+    SHL           = 8
+    SHR           = 9
+    LOAD_GLOBAL   = 10  # LOAD_GLOBAL dst, slot of the global variable
+    STORE_GLOBAL  = 11  # STORE_GLOBAL slot, src
+    LOAD_OUTER    = 12  # LOAD_OUTER dst, hops, slot of the frame reached
+    STORE_OUTER   = 13  # STORE_OUTER hops, slot, src
+    ARG           = 14  # ARG src: pass an argument to the next CALL
+    CALL          = 15  # CALL dst, procedure, hops, see RegisterMachine
+    RETURN        = 16  # RETURN
+    RETURN_VALUE  = 17  # RETURN_VALUE src: return src to the CALL's dst
+    EQUAL         = 18  # EQUAL dst, left, right: dst := left = right
+    NOT_EQUAL     = 19
+    LESS          = 20
+    LESS_EQUAL    = 21
+    GREATER       = 22
+    GREATER_EQUAL = 23
+    JUMP          = 24  # JUMP position
+    JUMP_IF_FALSE = 25  # JUMP_IF_FALSE src, position
+    JUMP_IF_TRUE  = 26
+
+
+_BINARY_REGISTER_OPCODES = {
+    TokenType.PLUS: RegisterOpCode.ADD,
+    TokenType.MINUS: RegisterOpCode.SUB,
+    TokenType.MUL: RegisterOpCode.MUL,
+    TokenType.INTEGER_DIV: RegisterOpCode.INT_DIV,
+    TokenType.FLOAT_DIV: RegisterOpCode.FLOAT_DIV,
+    TokenType.SHL: RegisterOpCode.SHL,
+    TokenType.SHR: RegisterOpCode.SHR,
+    TokenType.EQUAL: RegisterOpCode.EQUAL,
+    TokenType.NOT_EQUAL: RegisterOpCode.NOT_EQUAL,
+    TokenType.LESS: RegisterOpCode.LESS,
+    TokenType.LESS_EQUAL: RegisterOpCode.LESS_EQUAL,
+    TokenType.GREATER: RegisterOpCode.GREATER,
+    TokenType.GREATER_EQUAL: RegisterOpCode.GREATER_EQUAL,
+}
+
+# the opcodes whose first operand is the register they write
+_WRITING_REGISTER_OPCODES = frozenset(
+    list(_BINARY_REGISTER_OPCODES.values()) + [
+        RegisterOpCode.MOVE,
+        RegisterOpCode.NEG,
+        RegisterOpCode.LOAD_GLOBAL,
+        RegisterOpCode.LOAD_OUTER,
+        RegisterOpCode.CALL,
+    ]
+)
+
+# the number of register operands of the instructions that have only
+# register operands and fewer than three of them
+_REGISTER_OPERAND_COUNTS = {
+    RegisterOpCode.MOVE: 2,
+    RegisterOpCode.NEG: 2,
+    RegisterOpCode.ARG: 1,
+    RegisterOpCode.RETURN: 0,
+    RegisterOpCode.RETURN_VALUE: 1,
+}
+
+
+class RegisterProcedure(object):
+    """A procedure or function of a RegisterCode program.
+
+    Its code starts at 'entry'. Its registers are the slots of its frame
+    as FrameResolver lays them out, named by 'variables' (the parameters,
+    a function's result, then the local variables), followed by its
+    'consts', its 'temporaries' and its static link. 'result_slot' is
+    None for a procedure, and 'enclosing' is the index of the procedure
+    it is declared in, -1 for the program block.
+    """
+    __slots__ = (
+        'name', 'entry', 'param_count', 'variables', 'consts',
+        'temporaries', 'result_slot', 'enclosing',
+    )
+
+    def __init__(self, name, entry, param_count, variables, consts,
+                 temporaries, result_slot, enclosing):
+        self.name = name
+        self.entry = entry
+        self.param_count = param_count
+        self.variables = variables
+        self.consts = consts
+        self.temporaries = temporaries
+        self.result_slot = result_slot
+        self.enclosing = enclosing
+
+    def registers(self):
+        """Return a new frame with the constants loaded."""
+        return (
+            [None] * len(self.variables) + list(self.consts) +
+            [None] * (self.temporaries + 1)
+        )
+
+
+class RegisterCode(object):
+    """A program compiled for the RegisterMachine.
+
+    Every instruction is four ints in 'code': the opcode followed by its
+    operands, padded with zeros. The register file holds the program's
+    variables first, then the constants and then 'temporaries' registers
+    for intermediate results. The code of the 'procedures' comes first,
+    each running on registers of its own (see RegisterProcedure); that
+    of the program block starts at 'entry'.
+    """
+    WIDTH = 4
+
+    def __init__(self, name, code, names, consts, temporaries,
+                 procedures=(), entry=0):
+        self.name = name
+        self.code = code
+        self.names = names
+        self.consts = consts
+        self.temporaries = temporaries
+        self.procedures = list(procedures)
+        self.entry = entry
+
+    def registers(self):
+        """Return a new register file with the constants loaded."""
+        return (
+            [None] * len(self.names) + list(self.consts) +
+            [None] * self.temporaries
+        )
+
+    def register_name(self, register, procedure=None):
+        if procedure is None:
+            variables, consts = self.names, self.consts
+        else:
+            variables, consts = procedure.variables, procedure.consts
+        if register < len(variables):
+            return variables[register]
+        register -= len(variables)
+        if register < len(consts):
+            return repr(consts[register])
+        return 't{}'.format(register - len(consts))
+
+    def outer_name(self, procedure, hops, slot):
+        for _ in range(hops):
+            procedure = self.procedures[procedure.enclosing]
+        return f'{procedure.name}.{procedure.variables[slot]}'
+
+    def operand_names(self, opcode, operands, procedure):
+        """Return the names of the operands of an instruction of
+        'procedure' (None for the program block)."""
+        def name(register):
+            return self.register_name(register, procedure)
+
+        first, second, third = operands
+        if opcode == RegisterOpCode.LOAD_GLOBAL:
+            return [name(first), self.names[second]]
+        if opcode == RegisterOpCode.STORE_GLOBAL:
+            return [self.names[first], name(second)]
+        if opcode == RegisterOpCode.LOAD_OUTER:
+            return [name(first), self.outer_name(procedure, second, third)]
+        if opcode == RegisterOpCode.STORE_OUTER:
+            return [self.outer_name(procedure, first, second), name(third)]
+        if opcode == RegisterOpCode.CALL:
+            callee = self.procedures[second]
+            if callee.result_slot is None:
+                return [callee.name]
+            return [name(first), callee.name]
+        if opcode == RegisterOpCode.JUMP:
+            return [str(first // self.WIDTH)]
+        if opcode in (RegisterOpCode.JUMP_IF_FALSE,
+                      RegisterOpCode.JUMP_IF_TRUE):
+            return [name(first), str(second // self.WIDTH)]
+        count = _REGISTER_OPERAND_COUNTS.get(opcode, 3)
+        return [name(register) for register in operands[:count]]
+
+    def disassemble(self):
+        """Return a listing of the instructions, one per line. If the
+        program has procedures, a line with its name precedes the code
+        of each and of the program block."""
+        lines = []
+        code = self.code
+        entries = {procedure.entry: procedure for procedure in self.procedures}
+        procedure = None
+        for pc in range(0, len(code), self.WIDTH):
+            if pc in entries:
+                procedure = entries[pc]
+                lines.append(f'{procedure.name}:')
+            elif pc == self.entry and self.procedures:
+                procedure = None
+                lines.append(f'{self.name}:')
+            opcode = RegisterOpCode(code[pc])
+            operands = code[pc + 1:pc + self.WIDTH]
+            lines.append('{:>6} {:<13} {}'.format(
+                pc // self.WIDTH,
+                opcode.name,
+                ', '.join(self.operand_names(opcode, operands, procedure)),
+            ).rstrip())
+        return '\n'.join(lines)
+
+
+class RegisterCompiler(NodeVisitor):
+    """Compiles an analyzed Program to RegisterCode.
+
+    Operands are register references: ('var', slot), ('const', index),
+    ('temp', n), where n numbers the virtual temporaries, one per
+    intermediate result, ('temp_decl', n) for the n-th TempDecl, which
+    gets a register of its own after the temporaries, ('label', n) for
+    the position of the n-th label of the code, or ('int', n) for an
+    operand that is no register. An operation at the root of an
+    assignment writes straight into the variable, unary plus costs no
+    instruction, so x := (a + b) * 2 compiles to two instructions.
+
+    The program block and each procedure and function are compiled to
+    code of their own. A procedure's registers start with the slots of
+    its frame as FrameResolver lays them out; it reaches the global
+    variables and those of the procedures it is nested in through LOAD
+    and STORE instructions.
+
+    When the whole program is compiled, allocate_temporaries maps the
+    virtual temporaries of each code to as few registers as possible by
+    linear scan over their live intervals, and the references become
+    register numbers. An IF or WHILE condition compiles to comparisons
+    and conditional jumps, AND and OR jumping past their right operand
+    when the left one decides. A FOR statement is a CompilerError, as is
+    an ARRAY variable or a call of a builtin procedure.
+    """
+    def __init__(self):
+        self.instructions = []
+        self.names = []
+        self.slots = {}
+        self.consts = []
+        self.const_indices = {}
+        self.temporaries = 0
+        self.temp_decls = {}  # TempDecl name -> n
+        # TempStore index -> the register holding its value
+        self.stored_temporaries = {}
+        self.procedures = []
+        self.procedure_indices = {}  # ProcedureDecl -> index in procedures
+        self.procedure = None  # the ProcedureDecl being compiled
+        # the instruction each label of the code being compiled is at
+        self.labels = []
+        # (RegisterProcedure, instructions, labels) in the order of their
+        # code
+        self.units = []
+
+    def compile(self, tree):
+        with _gc_paused():
+            return self.compile_program(tree)
+
+    def error(self, error_code, token):
+        raise CompilerError(
+            error_code=error_code,
+            token=token,
+            message=f'{error_code.value} -> {token}',
+        )
+
+    def compile_program(self, tree):
+        FrameResolver().resolve(tree)
+        self.visit(tree)
+        code = array('i')
+        for procedure, instructions, labels in self.units:
+            procedure.entry = len(code)
+            procedure.temporaries = self.assemble(
+                code, instructions, labels, len(procedure.variables),
+                procedure.consts,
+            )
+        entry = len(code)
+        temporaries = self.assemble(
+            code, self.instructions, self.labels, len(self.names),
+            self.consts,
+        )
+        return RegisterCode(
+            tree.name, code, self.names, self.consts,
+            temporaries + len(self.temp_decls), self.procedures, entry,
+        )
+
+    def assemble(self, code, instructions, labels, variables, consts):
+        """Append instructions to code, their references mapped to the
+        registers of 'variables' variables followed by consts, and return
+        the number of registers the temporaries take."""
+        temporaries, registers = self.allocate_temporaries(instructions)
+        first_temporary = variables + len(consts)
+        start = len(code)
+
+        def register(reference):
+            kind, n = reference
+            if kind in ('var', 'int'):
+                return n
+            if kind == 'label':
+                return start + labels[n] * RegisterCode.WIDTH
+            if kind == 'const':
+                return variables + n
+            if kind == 'temp_decl':
+                return first_temporary + temporaries + n
+            return first_temporary + registers[n]
+
+        for opcode, *operands in instructions:
+            code.append(opcode)
+            code.extend(register(r) for r in operands)
+            code.extend([0] * (RegisterCode.WIDTH - 1 - len(operands)))
+        return temporaries
+
+    def allocate_temporaries(self, instructions):
+        """Return (number of registers, {temporary: register}).
+
+        A temporary lives from the instruction that writes it to the last
+        one that reads it. An instruction reads its sources before it
+        writes its destination, so a temporary last read by an instruction
+        can share a register with the one the instruction writes. No
+        temporary is live where a jump goes, so the intervals hold in
+        code with jumps too.
+        """
+        intervals = {}
+        for index, (opcode, *operands) in enumerate(instructions):
+            destination = None
+            if opcode in _WRITING_REGISTER_OPCODES:
+                destination, *operands = operands
+            for kind, n in operands:
+                if kind == 'temp':
+                    intervals[n][1] = index
+            if destination is not None and destination[0] == 'temp':
+                intervals[destination[1]] = [index, index]
+
+        registers = {}
+        active = []  # (end, temporary), sorted
+        free = []
+        count = 0
+        # temporaries are numbered in the order they are written
+        for temporary, (start, end) in sorted(intervals.items()):
+            while active and active[0][0] <= start:
+                _, expired = active.pop(0)
+                free.append(registers[expired])
+            if free:
+                free.sort()
+                registers[temporary] = free.pop(0)
+            else:
+                registers[temporary] = count
+                count += 1
+            active.append((end, temporary))
+            active.sort()
+        return count, registers
+
+    def new_temporary(self):
+        self.temporaries += 1
+        return ('temp', self.temporaries - 1)
+
+    def begin_unit(self):
+        """Start the code of a procedure or of the program block."""
+        self.instructions = []
+        self.consts = []
+        self.const_indices = {}
+        self.temporaries = 0
+        self.stored_temporaries = {}
+        self.labels = []
+
+    def new_label(self):
+        self.labels.append(None)
+        return ('label', len(self.labels) - 1)
+
+    def place(self, label):
+        """Make label the position of the next instruction."""
+        self.labels[label[1]] = len(self.instructions)
+
+    def visit_Program(self, node):
+        for declaration in node.block.declarations:
+            if isinstance(declaration, TempDecl):
+                name = declaration.var_node.value
+                self.temp_decls[name] = len(self.temp_decls)
+            elif isinstance(declaration, VarDecl):
+                if isinstance(declaration.type_node, ArrayType):
+                    self.error(
+                        ErrorCode.UNSUPPORTED, declaration.type_node.token
+                    )
+                name = declaration.var_node.value
+                self.slots[name] = len(self.names)
+                self.names.append(name)
+        self.declare_procedures(node.block, -1)
+        self.visit_procedures(node.block)
+        self.begin_unit()
+        self.visit(node.block.compound_statement)
+
+    def declare_procedures(self, block, enclosing):
+        """Add a RegisterProcedure for each procedure declared in block
+        and, recursively, in theirs."""
+        for declaration in block.declarations:
+            if not isinstance(declaration, ProcedureDecl):
+                continue
+            variables = [param.var_node.value for param in declaration.params]
+            result_slot = None
+            if isinstance(declaration, FunctionDecl):
+                result_slot = declaration.result_slot
+                variables.append(declaration.proc_name)
+            for local in declaration.block_node.declarations:
+                if isinstance(local, VarDecl):
+                    if isinstance(local.type_node, ArrayType):
+                        self.error(
+                            ErrorCode.UNSUPPORTED, local.type_node.token
+                        )
+                    variables.append(local.var_node.value)
+            index = self.procedure_indices[declaration] = len(self.procedures)
+            self.procedures.append(RegisterProcedure(
+                declaration.proc_name, None, len(declaration.params),
+                variables, None, None, result_slot, enclosing,
+            ))
+            self.declare_procedures(declaration.block_node, index)
+
+    def visit_procedures(self, block):
+        for declaration in block.declarations:
+            if isinstance(declaration, ProcedureDecl):
+                self.visit(declaration)
 
     def visit_ProcedureDecl(self, node):
+        self.visit_procedures(node.block_node)
+        procedure = self.procedures[self.procedure_indices[node]]
+        self.begin_unit()
+        self.procedure = node
+        self.visit(node.block_node.compound_statement)
+        if procedure.result_slot is None:
+            self.instructions.append((RegisterOpCode.RETURN,))
+        else:
+            self.instructions.append(
+                (RegisterOpCode.RETURN_VALUE, ('var', procedure.result_slot))
+            )
+        procedure.consts = self.consts
+        self.units.append((procedure, self.instructions, self.labels))
+        self.procedure = None
+
+    def visit_Compound(self, node):
+        for child in node.children:
+            self.visit(child)
+
+    def visit_NoOp(self, node):
         pass
 
     def visit_ProcedureCall(self, node):
-        pass
+        self.call(node, ('int', 0))
+
+    def call(self, node, destination):
+        if isinstance(node.callee, BuiltinProcedureSymbol):
+            self.error(ErrorCode.UNSUPPORTED, node.token)
+        for param_node in node.actual_params:
+            self.instructions.append(
+                (RegisterOpCode.ARG, self.expression(param_node))
+            )
+        hops = -1 if node.static_hops is None else node.static_hops
+        self.instructions.append((
+            RegisterOpCode.CALL, destination,
+            ('int', self.procedure_indices[node.callee]), ('int', hops),
+        ))
+
+    def visit_For(self, node):
+        self.error(ErrorCode.UNSUPPORTED, node.token)
+
+    def visit_If(self, node):
+        end = self.new_label()
+        if node.else_branch is None:
+            self.branch(node.condition, False, end)
+            self.visit(node.then_branch)
+        else:
+            else_branch = self.new_label()
+            self.branch(node.condition, False, else_branch)
+            self.visit(node.then_branch)
+            self.instructions.append((RegisterOpCode.JUMP, end))
+            self.place(else_branch)
+            self.visit(node.else_branch)
+        self.place(end)
+
+    def visit_While(self, node):
+        loop = self.new_label()
+        end = self.new_label()
+        self.place(loop)
+        self.branch(node.condition, False, end)
+        self.visit(node.body)
+        self.instructions.append((RegisterOpCode.JUMP, loop))
+        self.place(end)
+
+    def branch(self, node, if_true, label):
+        """Emit the code of a condition that jumps to label if its value
+        is if_true and goes on with the next instruction otherwise."""
+        if isinstance(node, UnaryOp):  # NOT
+            self.branch(node.expr, not if_true, label)
+        elif isinstance(node, BoolOp):
+            if if_true == node.short_circuit:
+                # either operand decides
+                self.branch(node.left, if_true, label)
+                self.branch(node.right, if_true, label)
+            else:
+                # the right operand decides unless the left one does
+                skip = self.new_label()
+                self.branch(node.left, not if_true, skip)
+                self.branch(node.right, if_true, label)
+                self.place(skip)
+        elif isinstance(node, Num):
+            # a condition the optimizer folded
+            if bool(node.value) == if_true:
+                self.instructions.append((RegisterOpCode.JUMP, label))
+        else:
+            opcode = RegisterOpCode.JUMP_IF_FALSE
+            if if_true:
+                opcode = RegisterOpCode.JUMP_IF_TRUE
+            self.instructions.append((opcode, self.expression(node), label))
+
+    def variable(self, node):
+        """Return the register reference of a Var. In a procedure, a
+        global variable or one of an enclosing procedure is loaded into
+        a temporary first."""
+        if self.procedure is None:
+            n = self.temp_decls.get(node.value)
+            if n is not None:
+                return ('temp_decl', n)
+            return ('var', self.slots[node.value])
+        if node.address is None:
+            destination = self.new_temporary()
+            self.instructions.append((
+                RegisterOpCode.LOAD_GLOBAL, destination,
+                ('int', self.slots[node.value]),
+            ))
+            return destination
+        hops, slot = node.address
+        if hops == 0:
+            return ('var', slot)
+        destination = self.new_temporary()
+        self.instructions.append((
+            RegisterOpCode.LOAD_OUTER, destination, ('int', hops),
+            ('int', slot),
+        ))
+        return destination
+
+    def visit_Assign(self, node):
+        var = node.left
+        if self.procedure is not None and var.address is None:
+            self.instructions.append((
+                RegisterOpCode.STORE_GLOBAL, ('int', self.slots[var.value]),
+                self.expression(node.right),
+            ))
+        elif self.procedure is not None and var.address[0]:
+            hops, slot = var.address
+            self.instructions.append((
+                RegisterOpCode.STORE_OUTER, ('int', hops), ('int', slot),
+                self.expression(node.right),
+            ))
+        else:
+            variable = self.variable(var)
+            source = self.expression(node.right, variable)
+            if source != variable:
+                self.instructions.append(
+                    (RegisterOpCode.MOVE, variable, source)
+                )
+
+    def expression(self, node, destination=None):
+        """Emit the code of an expression and return the register that
+        holds its value, destination if it is given and an instruction
+        has to compute the value.
+        """
+        if isinstance(node, Var):
+            return self.variable(node)
+        if isinstance(node, Num):
+            # 1 and 1.0 are equal keys of a dict, hence the type in the key
+            key = (type(node.value), node.value)
+            index = self.const_indices.get(key)
+            if index is None:
+                index = self.const_indices[key] = len(self.consts)
+                self.consts.append(node.value)
+            return ('const', index)
+        if isinstance(node, TempStore):
+            # the value outlives the assignment, it can't be computed
+            # into the assigned variable
+            source = self.expression(node.expr)
+            self.stored_temporaries[node.index] = source
+            return source
+        if isinstance(node, TempLoad):
+            return self.stored_temporaries[node.index]
+        if isinstance(node, FunctionCall):
+            destination = destination or self.new_temporary()
+            self.call(node, destination)
+            return destination
+        if isinstance(node, UnaryOp):
+            if node.op.type == TokenType.PLUS:
+                return self.expression(node.expr, destination)
+            source = self.expression(node.expr)
+            destination = destination or self.new_temporary()
+            self.instructions.append(
+                (RegisterOpCode.NEG, destination, source)
+            )
+            return destination
+        left = self.expression(node.left)
+        if left[0] == 'var' and expression_calls(node.right):
+            # the call may assign the variable before the operation
+            # reads it
+            moved = self.new_temporary()
+            self.instructions.append((RegisterOpCode.MOVE, moved, left))
+            left = moved
+        right = self.expression(node.right)
+        destination = destination or self.new_temporary()
+        self.instructions.append(
+            (_BINARY_REGISTER_OPCODES[node.op.type], destination, left, right)
+        )
+        return destination
+
+
+class RegisterMachine(object):
+    """Executes RegisterCode on a flat list of registers.
+
+    CALL pops the arguments ARG passed into a copy of the callee's
+    registers, sets its static link, the last register, to the frame of
+    the procedure it is declared in, and runs it on them. The return
+    address, the caller's registers and the CALL's destination register
+    go on a stack of their own.
+    """
+    def __init__(self, code):
+        self.code = code
+        self.GLOBAL_MEMORY = {}
+        self.instructions_executed = 0
+
+    def run(self, registers):
+        """Execute the code on registers and return the number of
+        instructions executed."""
+        MOVE = RegisterOpCode.MOVE.value
+        ADD = RegisterOpCode.ADD.value
+        SUB = RegisterOpCode.SUB.value
+        MUL = RegisterOpCode.MUL.value
+        INT_DIV = RegisterOpCode.INT_DIV.value
+        FLOAT_DIV = RegisterOpCode.FLOAT_DIV.value
+        NEG = RegisterOpCode.NEG.value
+        SHL = RegisterOpCode.SHL.value
+        SHR = RegisterOpCode.SHR.value
+        LOAD_GLOBAL = RegisterOpCode.LOAD_GLOBAL.value
+        STORE_GLOBAL = RegisterOpCode.STORE_GLOBAL.value
+        LOAD_OUTER = RegisterOpCode.LOAD_OUTER.value
+        ARG = RegisterOpCode.ARG.value
+        CALL = RegisterOpCode.CALL.value
+        RETURN = RegisterOpCode.RETURN.value
+        RETURN_VALUE = RegisterOpCode.RETURN_VALUE.value
+        EQUAL = RegisterOpCode.EQUAL.value
+        NOT_EQUAL = RegisterOpCode.NOT_EQUAL.value
+        LESS = RegisterOpCode.LESS.value
+        LESS_EQUAL = RegisterOpCode.LESS_EQUAL.value
+        GREATER = RegisterOpCode.GREATER.value
+        GREATER_EQUAL = RegisterOpCode.GREATER_EQUAL.value
+        JUMP = RegisterOpCode.JUMP.value
+        JUMP_IF_FALSE = RegisterOpCode.JUMP_IF_FALSE.value
+        JUMP_IF_TRUE = RegisterOpCode.JUMP_IF_TRUE.value
+
+        code = self.code.code.tolist()
+        # (entry, number of parameters, registers) of each procedure
+        procedures = [
+            (procedure.entry, procedure.param_count, procedure.registers())
+            for procedure in self.code.procedures
+        ]
+        args = []
+        # (return address, registers, destination) of each active call
+        returns = []
+        r = registers
+        pc = self.code.entry
+        end = len(code)
+        executed = 0
+        while pc < end:
+            op = code[pc]
+            executed += 1
+            if op == ADD:
+                r[code[pc + 1]] = r[code[pc + 2]] + r[code[pc + 3]]
+            elif op == MUL:
+                r[code[pc + 1]] = r[code[pc + 2]] * r[code[pc + 3]]
+            elif op == SUB:
+                r[code[pc + 1]] = r[code[pc + 2]] - r[code[pc + 3]]
+            elif op == INT_DIV:
+                r[code[pc + 1]] = r[code[pc + 2]] // r[code[pc + 3]]
+            elif op == FLOAT_DIV:
+                r[code[pc + 1]] = r[code[pc + 2]] / r[code[pc + 3]]
+            elif op == SHL:
+                r[code[pc + 1]] = r[code[pc + 2]] << r[code[pc + 3]]
+            elif op == SHR:
+                r[code[pc + 1]] = r[code[pc + 2]] >> r[code[pc + 3]]
+            elif op == MOVE:
+                r[code[pc + 1]] = r[code[pc + 2]]
+            elif op == NEG:
+                r[code[pc + 1]] = -r[code[pc + 2]]
+            elif op == JUMP_IF_FALSE:
+                if not r[code[pc + 1]]:
+                    pc = code[pc + 2]
+                    continue
+            elif op == JUMP_IF_TRUE:
+                if r[code[pc + 1]]:
+                    pc = code[pc + 2]
+                    continue
+            elif op == JUMP:
+                pc = code[pc + 1]
+                continue
+            elif op == LESS:
+                r[code[pc + 1]] = r[code[pc + 2]] < r[code[pc + 3]]
+            elif op == NOT_EQUAL:
+                r[code[pc + 1]] = r[code[pc + 2]] != r[code[pc + 3]]
+            elif op == EQUAL:
+                r[code[pc + 1]] = r[code[pc + 2]] == r[code[pc + 3]]
+            elif op == GREATER:
+                r[code[pc + 1]] = r[code[pc + 2]] > r[code[pc + 3]]
+            elif op == LESS_EQUAL:
+                r[code[pc + 1]] = r[code[pc + 2]] <= r[code[pc + 3]]
+            elif op == GREATER_EQUAL:
+                r[code[pc + 1]] = r[code[pc + 2]] >= r[code[pc + 3]]
+            elif op == LOAD_GLOBAL:
+                r[code[pc + 1]] = registers[code[pc + 2]]
+            elif op == STORE_GLOBAL:
+                registers[code[pc + 1]] = r[code[pc + 2]]
+            elif op == ARG:
+                args.append(r[code[pc + 1]])
+            elif op == CALL:
+                entry, param_count, callee = procedures[code[pc + 2]]
+                callee = callee[:]
+                if param_count:
+                    callee[:param_count] = args[-param_count:]
+                    del args[-param_count:]
+                hops = code[pc + 3]
+                if hops >= 0:
+                    link = r
+                    for _ in range(hops):
+                        link = link[-1]
+                    callee[-1] = link
+                returns.append((pc + 4, r, code[pc + 1]))
+                r = callee
+                pc = entry
+                continue
+            elif op == RETURN_VALUE:
+                value = r[code[pc + 1]]
+                pc, r, destination = returns.pop()
+                r[destination] = value
+                continue
+            elif op == RETURN:
+                pc, r, _ = returns.pop()
+                continue
+            elif op == LOAD_OUTER:
+                outer = r
+                for _ in range(code[pc + 2]):
+                    outer = outer[-1]
+                r[code[pc + 1]] = outer[code[pc + 3]]
+            else:  # STORE_OUTER
+                outer = r
+                for _ in range(code[pc + 1]):
+                    outer = outer[-1]
+                outer[code[pc + 2]] = r[code[pc + 3]]
+            pc += 4
+        return executed
 
     def interpret(self):
-        tree = self.tree
-        if tree is None:
-            return ''
-        return self.visit(tree)
+        registers = self.code.registers()
+        self.instructions_executed = self.run(registers)
+        self.GLOBAL_MEMORY.clear()
+        for name, value in zip(self.code.names, registers):
+            if value is not None:
+                self.GLOBAL_MEMORY[name] = value
+
+
+class RegisterInterpreter(RegisterMachine):
+    """Compiles an analyzed AST with RegisterCompiler and runs it."""
+    def __init__(self, tree):
+        super().__init__(RegisterCompiler().compile(tree))
+        self.tree = tree
 
 
 def main():
@@ -1094,29 +7336,141 @@ def main():
         help='Print scope information',
         action='store_true',
     )
+    parser.add_argument(
+        '--single-pass',
+        help='Resolve symbols while parsing instead of running '
+             'a separate semantic analysis pass',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--backend',
+        help='Execution engine: the AST interpreter (default), closures, '
+             'Python code objects, the stack-based bytecode virtual '
+             'machine or the register virtual machine',
+        choices=['tree', 'closure', 'pycode', 'vm', 'regvm'],
+        default='tree',
+    )
+    parser.add_argument(
+        '--save-bytecode',
+        metavar='FILE',
+        help='Save the program compiled for the virtual machine to FILE; '
+             'FILE can be run later in place of the Pascal source',
+    )
+    parser.add_argument(
+        '--disassemble',
+        help='Print the program compiled for the virtual machine',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--optimize',
+        help='Run the optimization passes over the analyzed tree',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--optimize-report',
+        help='Run the optimization passes and print what they did',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--inline-max-size',
+        help='Inline the procedures whose bodies have at most N nodes '
+             '(default: %(default)s)',
+        metavar='N',
+        type=int,
+        default=ProcedureInliner.MAX_SIZE,
+    )
+    parser.add_argument(
+        '--workers',
+        help='Analyze procedure bodies in a pool of worker processes',
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        '--streaming',
+        help='Parse, analyze and compile the program one procedure at a time',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--output',
+        metavar='FILE',
+        help='Write the output of WRITE and WRITELN to FILE instead of '
+             'the standard output',
+    )
     args = parser.parse_args()
     global _SHOULD_LOG_SCOPE
     _SHOULD_LOG_SCOPE = args.scope
 
-    text = open(args.inputfile, 'r').read()
+    with open(args.inputfile, 'rb') as f:
+        data = f.read()
+    if data.startswith(Bytecode.MAGIC):
+        interpreter = VirtualMachine(Bytecode.loads(data))
+        interpreter.interpret()
+        return
+
+    text = data.decode()
 
     lexer = Lexer(text)
+    semantic_analyzer = SemanticAnalyzer()
     try:
-        parser = Parser(lexer)
-        tree = parser.parse()
-    except (LexerError, ParserError) as e:
+        if args.streaming:
+            program = StreamingParser(lexer).parse()
+        elif args.single_pass:
+            parser = Parser(lexer, analyzer=semantic_analyzer)
+            tree = parser.parse()
+        else:
+            parser = Parser(lexer)
+            tree = parser.parse()
+            if args.workers:
+                with ProcessPoolExecutor(args.workers) as executor:
+                    semantic_analyzer.executor = executor
+                    semantic_analyzer.visit(tree)
+            else:
+                semantic_analyzer.visit(tree)
+        if (args.optimize or args.optimize_report) and not args.streaming:
+            stats = {}
+            inliner = ProcedureInliner(max_size=args.inline_max_size)
+            optimize(tree, stats, inliner=inliner)
+            if args.optimize_report:
+                for name, count in stats.items():
+                    print(f'{name}: {count}')
+                for line in inliner.report:
+                    print(line)
+    except (LexerError, ParserError, SemanticError) as e:
         print(e.message)
         sys.exit(1)
 
-    semantic_analyzer = SemanticAnalyzer()
+    output = OutputBuffer()
     try:
-        semantic_analyzer.visit(tree)
-    except SemanticError as e:
+        if args.streaming:
+            interpreter = CompactInterpreter(program)
+        elif args.backend == 'closure':
+            interpreter = ClosureInterpreter(tree, output=output)
+        elif args.backend == 'pycode':
+            interpreter = PyCodeInterpreter(tree, filename=args.inputfile)
+        elif args.backend == 'regvm':
+            interpreter = RegisterInterpreter(tree)
+        elif (args.backend == 'vm' or args.save_bytecode or
+              args.disassemble):
+            interpreter = VMInterpreter(tree)
+        else:
+            interpreter = Interpreter(tree, output=output)
+    except CompilerError as e:
         print(e.message)
         sys.exit(1)
 
-    interpreter = Interpreter(tree)
-    interpreter.interpret()
+    if isinstance(interpreter, VMInterpreter):
+        if args.disassemble:
+            print(interpreter.bytecode.disassemble())
+        if args.save_bytecode:
+            with open(args.save_bytecode, 'wb') as f:
+                f.write(interpreter.bytecode.dumps())
+            return
+    if args.output is None:
+        interpreter.interpret()
+    else:
+        with open(args.output, 'w') as sink:
+            output.sink = sink
+            interpreter.interpret()
 
     # print('')
     # print('Run-time GLOBAL_MEMORY contents:')
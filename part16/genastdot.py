@@ -107,6 +107,20 @@ class ASTVisualizer(NodeVisitor):
         node._num = self.ncount
         self.ncount += 1
 
+    def visit_ArrayType(self, node):
+        s = '  node{} [label="ARRAY[{}..{}]"]\n'.format(
+            self.ncount, node.low, node.high
+        )
+        self.dot_body.append(s)
+        node._num = self.ncount
+        self.ncount += 1
+
+        self.visit(node.element_type_node)
+        s = '  node{} -> node{}\n'.format(
+            node._num, node.element_type_node._num
+        )
+        self.dot_body.append(s)
+
     def visit_Num(self, node):
         s = '  node{} [label="{}"]\n'.format(self.ncount, node.token.value)
         self.dot_body.append(s)
@@ -126,6 +140,9 @@ class ASTVisualizer(NodeVisitor):
             s = '  node{} -> node{}\n'.format(node._num, child_node._num)
             self.dot_body.append(s)
 
+    def visit_BoolOp(self, node):
+        self.visit_BinOp(node)
+
     def visit_UnaryOp(self, node):
         s = '  node{} [label="unary {}"]\n'.format(self.ncount, node.op.value)
         self.dot_body.append(s)
@@ -160,12 +177,70 @@ class ASTVisualizer(NodeVisitor):
             s = '  node{} -> node{}\n'.format(node._num, child_node._num)
             self.dot_body.append(s)
 
+    def visit_For(self, node):
+        s = '  node{} [label="{}"]\n'.format(
+            self.ncount, 'FOR DOWNTO' if node.downto else 'FOR TO'
+        )
+        self.dot_body.append(s)
+        node._num = self.ncount
+        self.ncount += 1
+
+        children = (node.var_node, node.start, node.stop, node.body)
+        for child_node in children:
+            self.visit(child_node)
+
+        for child_node in children:
+            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
+            self.dot_body.append(s)
+
+    def visit_If(self, node):
+        s = '  node{} [label="IF"]\n'.format(self.ncount)
+        self.dot_body.append(s)
+        node._num = self.ncount
+        self.ncount += 1
+
+        children = [node.condition, node.then_branch]
+        if node.else_branch is not None:
+            children.append(node.else_branch)
+        for child_node in children:
+            self.visit(child_node)
+
+        for child_node in children:
+            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
+            self.dot_body.append(s)
+
+    def visit_While(self, node):
+        s = '  node{} [label="WHILE"]\n'.format(self.ncount)
+        self.dot_body.append(s)
+        node._num = self.ncount
+        self.ncount += 1
+
+        for child_node in (node.condition, node.body):
+            self.visit(child_node)
+
+        for child_node in (node.condition, node.body):
+            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
+            self.dot_body.append(s)
+
     def visit_Var(self, node):
         s = '  node{} [label="{}"]\n'.format(self.ncount, node.value)
         self.dot_body.append(s)
         node._num = self.ncount
         self.ncount += 1
 
+    def visit_Index(self, node):
+        s = '  node{} [label="[]"]\n'.format(self.ncount)
+        self.dot_body.append(s)
+        node._num = self.ncount
+        self.ncount += 1
+
+        for child_node in (node.var_node, node.index):
+            self.visit(child_node)
+
+        for child_node in (node.var_node, node.index):
+            s = '  node{} -> node{}\n'.format(node._num, child_node._num)
+            self.dot_body.append(s)
+
     def visit_NoOp(self, node):
         s = '  node{} [label="NoOp"]\n'.format(self.ncount)
         self.dot_body.append(s)
@@ -1,4 +1,6 @@
+import copy
 import unittest
+from unittest import mock
 
 
 class LexerTestCase(unittest.TestCase):
@@ -26,6 +28,21 @@ class LexerTestCase(unittest.TestCase):
             ('BEGIN', TokenType.BEGIN, 'BEGIN'),
             ('END', TokenType.END, 'END'),
             ('PROCEDURE', TokenType.PROCEDURE, 'PROCEDURE'),
+            ('=', TokenType.EQUAL, '='),
+            ('<>', TokenType.NOT_EQUAL, '<>'),
+            ('<', TokenType.LESS, '<'),
+            ('<=', TokenType.LESS_EQUAL, '<='),
+            ('>', TokenType.GREATER, '>'),
+            ('>=', TokenType.GREATER_EQUAL, '>='),
+            ('IF', TokenType.IF, 'IF'),
+            ('WHILE', TokenType.WHILE, 'WHILE'),
+            ('AND', TokenType.AND, 'AND'),
+            ('NOT', TokenType.NOT, 'NOT'),
+            ('[', TokenType.LBRACKET, '['),
+            (']', TokenType.RBRACKET, ']'),
+            ('..', TokenType.RANGE, '..'),
+            ('ARRAY', TokenType.ARRAY, 'ARRAY'),
+            ('OF', TokenType.OF, 'OF'),
         )
         for text, tok_type, tok_val in records:
             lexer = self.makeLexer(text)
@@ -35,7 +52,7 @@ class LexerTestCase(unittest.TestCase):
 
     def test_lexer_exception(self):
         from calc16 import LexerError
-        lexer = self.makeLexer('<')
+        lexer = self.makeLexer('!')
         with self.assertRaises(LexerError):
             lexer.get_next_token()
 
@@ -129,6 +146,28 @@ class ParserTestCase(unittest.TestCase):
         self.assertEqual(the_exception.token.value, 'VAR')
         self.assertEqual(the_exception.token.lineno, 5)  # second VAR
 
+    def test_operator_functions(self):
+        import operator
+        parser = self.makeParser(
+            """
+            PROGRAM Test;
+            VAR
+                a : REAL;
+            BEGIN
+               a := -a / 2 * (a DIV 3 - +a + 1)
+            END.
+            """
+        )
+        tree = parser.parse()
+        expr = tree.block.compound_statement.children[0].right
+        self.assertIs(expr.function, operator.mul)
+        self.assertIs(expr.left.function, operator.truediv)
+        self.assertIs(expr.left.left.function, operator.neg)
+        self.assertIs(expr.right.function, operator.add)
+        self.assertIs(expr.right.left.function, operator.sub)
+        self.assertIs(expr.right.left.left.function, operator.floordiv)
+        self.assertIs(expr.right.left.right.function, operator.pos)
+
 
 class SemanticAnalyzerTestCase(unittest.TestCase):
     def runSemanticAnalyzer(self, text):
@@ -136,6 +175,7 @@ class SemanticAnalyzerTestCase(unittest.TestCase):
         lexer = Lexer(text)
         parser = Parser(lexer)
         tree = parser.parse()
+        self.tree = tree
 
         semantic_analyzer = SemanticAnalyzer()
         semantic_analyzer.visit(tree)
@@ -177,6 +217,477 @@ class SemanticAnalyzerTestCase(unittest.TestCase):
         self.assertEqual(the_exception.error_code, ErrorCode.ID_NOT_FOUND)
         self.assertEqual(the_exception.token.value, 'b')
 
+    def test_semantic_expression_types(self):
+        analyzer = self.runSemanticAnalyzer(
+        """
+        PROGRAM Test;
+        VAR
+            a, b : INTEGER;
+            y    : REAL;
+        BEGIN
+           a := 7 DIV 2 - -a;
+           b := a * 2;
+           y := b / 2;
+           y := y + a
+        END.
+        """
+        )
+        (assign_a, assign_b, assign_y1, assign_y2) = (
+            self.tree.block.compound_statement.children
+        )
+        self.assertEqual(assign_a.right.type.name, 'INTEGER')
+        self.assertEqual(assign_a.right.left.type.name, 'INTEGER')
+        self.assertEqual(assign_a.right.right.type.name, 'INTEGER')
+        self.assertEqual(assign_b.right.type.name, 'INTEGER')
+        self.assertEqual(assign_y1.right.type.name, 'REAL')
+        self.assertEqual(assign_y2.right.type.name, 'REAL')
+        self.assertEqual(assign_y2.right.right.type.name, 'INTEGER')
+
+    def test_semantic_real_operand_of_div_error(self):
+        from calc16 import SemanticError, ErrorCode
+        with self.assertRaises(SemanticError) as cm:
+            self.runSemanticAnalyzer(
+            """
+            PROGRAM Test;
+            VAR
+                a : INTEGER;
+                y : REAL;
+            BEGIN
+               a := y DIV 2;
+            END.
+            """
+            )
+        the_exception = cm.exception
+        self.assertEqual(the_exception.error_code, ErrorCode.TYPE_MISMATCH)
+        self.assertEqual(the_exception.token.value, 'DIV')
+        self.assertEqual(the_exception.token.lineno, 7)
+
+    def test_semantic_real_assigned_to_integer_error(self):
+        from calc16 import SemanticError, ErrorCode
+        with self.assertRaises(SemanticError) as cm:
+            self.runSemanticAnalyzer(
+            """
+            PROGRAM Test;
+            VAR
+                a : INTEGER;
+            BEGIN
+               a := 4 / 2;
+            END.
+            """
+            )
+        the_exception = cm.exception
+        self.assertEqual(the_exception.error_code, ErrorCode.TYPE_MISMATCH)
+        self.assertEqual(the_exception.token.value, ':=')
+
+    def test_semantic_procedure_call_errors(self):
+        from calc16 import SemanticError, ErrorCode
+        for actual_params, error_code in (
+            ('1', ErrorCode.WRONG_PARAMS_NUM),
+            ('1, 2, 3', ErrorCode.WRONG_PARAMS_NUM),
+            ('1, 2.5', ErrorCode.TYPE_MISMATCH),
+        ):
+            with self.assertRaises(SemanticError) as cm:
+                self.runSemanticAnalyzer(
+                """
+                PROGRAM Test;
+                PROCEDURE Alpha(a : INTEGER; b : INTEGER);
+                BEGIN
+                END;
+                BEGIN
+                   Alpha(%s)
+                END.
+                """ % actual_params
+                )
+            self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_semantic_function_errors(self):
+        from calc16 import SemanticError, ErrorCode
+        for statement, error_code in (
+            # a procedure has no value
+            ('a := Alpha(1)', ErrorCode.TYPE_MISMATCH),
+            # a function's value has to be used
+            ('Beta(1)', ErrorCode.TYPE_MISMATCH),
+            # outside its body, a function's name isn't a variable
+            ('a := Beta', ErrorCode.TYPE_MISMATCH),
+            ('a := Beta(1, 2)', ErrorCode.WRONG_PARAMS_NUM),
+            ('a := Gamma()', ErrorCode.ID_NOT_FOUND),
+        ):
+            with self.assertRaises(SemanticError) as cm:
+                self.runSemanticAnalyzer(
+                """
+                PROGRAM Test;
+                VAR a : INTEGER;
+                PROCEDURE Alpha(a : INTEGER);
+                BEGIN
+                END;
+                FUNCTION Beta(b : INTEGER) : INTEGER;
+                BEGIN
+                   Beta := b
+                END;
+                BEGIN
+                   %s
+                END.
+                """ % statement
+                )
+            self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_semantic_function_result_type(self):
+        from calc16 import SemanticError, ErrorCode
+        with self.assertRaises(SemanticError) as cm:
+            self.runSemanticAnalyzer(
+            """
+            PROGRAM Test;
+            VAR a : INTEGER;
+            FUNCTION Half(b : INTEGER) : REAL;
+            BEGIN
+               Half := b / 2
+            END;
+            BEGIN
+               a := Half(3)
+            END.
+            """
+            )
+        self.assertEqual(cm.exception.error_code, ErrorCode.TYPE_MISMATCH)
+
+
+class SymbolTestCase(unittest.TestCase):
+    def analyze(self, text):
+        from calc16 import Lexer, Parser, SemanticAnalyzer
+        semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.leave_scope = lambda: None  # keep the scopes
+        semantic_analyzer.visit(Parser(Lexer(text)).parse())
+        return semantic_analyzer.current_scope
+
+    def test_builtin_types_are_shared_by_all_runs(self):
+        from calc16 import INTEGER_TYPE, REAL_TYPE
+        text = "PROGRAM T; VAR a : INTEGER; y : REAL; BEGIN END."
+        for _ in range(3):
+            scope = self.analyze(text)
+            self.assertIs(scope.lookup('INTEGER'), INTEGER_TYPE)
+            self.assertIs(scope.lookup('REAL'), REAL_TYPE)
+            self.assertIs(scope.lookup('a').type, INTEGER_TYPE)
+            self.assertIs(scope.lookup('y').type, REAL_TYPE)
+
+    def test_builtin_types_unpickle_as_singletons(self):
+        import pickle
+        from calc16 import INTEGER_TYPE, VarSymbol
+        var_symbol = pickle.loads(pickle.dumps(VarSymbol('a', INTEGER_TYPE)))
+        self.assertIs(var_symbol.type, INTEGER_TYPE)
+
+    def test_compact_symbols(self):
+        import sys
+        scope = self.analyze(
+            "PROGRAM T; PROCEDURE P(a, b : INTEGER); BEGIN END; BEGIN END."
+        )
+        proc_symbol = scope.lookup('P')
+        self.assertIsInstance(proc_symbol.params, tuple)
+        self.assertEqual([p.name for p in proc_symbol.params], ['a', 'b'])
+        for symbol in (
+            proc_symbol, proc_symbol.params[0], scope.lookup('REAL')
+        ):
+            self.assertFalse(hasattr(symbol, '__dict__'))
+            self.assertIs(symbol.name, sys.intern(symbol.name))
+
+
+def tree_annotations(node):
+    """Flatten the semantic annotations of a tree into a list of tuples."""
+    from calc16 import AST
+    result = [(
+        type(node).__name__,
+        getattr(getattr(node, 'type', None), 'name', None),
+        getattr(getattr(node, 'symbol', None), 'name', None),
+        getattr(getattr(node, 'proc_symbol', None), 'name', None),
+    )]
+    for value in vars(node).values():
+        children = value if isinstance(value, list) else [value]
+        for child in children:
+            if isinstance(child, AST):
+                result.extend(tree_annotations(child))
+    return result
+
+
+class SinglePassFrontEndTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Part12;
+VAR
+   number : INTEGER;
+   a, b   : INTEGER;
+   y      : REAL;
+
+PROCEDURE P1(c : REAL);
+VAR
+   a : REAL;
+   k : INTEGER;
+   PROCEDURE P2;
+   VAR
+      a, z : INTEGER;
+   BEGIN {P2}
+      a := 2;
+      z := 777 + k * -a;
+   END;  {P2}
+BEGIN {P1}
+   k := 4;
+   a := c / k;
+   P2()
+END;  {P1}
+
+BEGIN {Part12}
+   number := 2;
+   a := number ;
+   b := 10 * a + 10 * number DIV 4;
+   y := 20 / 7 + 3.14;
+   P1(y + b)
+END.  {Part12}
+"""
+
+    def parse(self, text, single_pass):
+        from calc16 import Lexer, Parser, SemanticAnalyzer
+        semantic_analyzer = SemanticAnalyzer()
+        if single_pass:
+            return Parser(Lexer(text), analyzer=semantic_analyzer).parse()
+        tree = Parser(Lexer(text)).parse()
+        semantic_analyzer.visit(tree)
+        return tree
+
+    def test_same_annotated_tree(self):
+        two_pass_tree = self.parse(self.program, single_pass=False)
+        single_pass_tree = self.parse(self.program, single_pass=True)
+        annotations = tree_annotations(single_pass_tree)
+        self.assertEqual(annotations, tree_annotations(two_pass_tree))
+        self.assertIn(('BinOp', 'REAL', None, None), annotations)
+        self.assertIn(('Var', 'INTEGER', 'k', None), annotations)
+        self.assertIn(('ProcedureCall', None, None, 'P1'), annotations)
+
+    def test_same_errors(self):
+        from calc16 import SemanticError
+        for text in (
+            "PROGRAM T; VAR a : INTEGER; a : REAL; BEGIN END.",
+            "PROGRAM T; VAR a : INTEGER; BEGIN a := 5 + b END.",
+            "PROGRAM T; VAR a : INTEGER; BEGIN b := c END.",
+            "PROGRAM T; VAR a : INTEGER; BEGIN a := 2.5 * a END.",
+            "PROGRAM T; VAR y : REAL; BEGIN y := y DIV 2 END.",
+            "PROGRAM T; PROCEDURE P(a : INTEGER); BEGIN END; BEGIN P() END.",
+            "PROGRAM T; BEGIN P(x) END.",
+        ):
+            errors = []
+            for single_pass in (False, True):
+                with self.assertRaises(SemanticError) as cm:
+                    self.parse(text, single_pass)
+                errors.append((cm.exception.error_code, cm.exception.token))
+            (code1, token1), (code2, token2) = errors
+            self.assertEqual(code1, code2)
+            self.assertEqual(
+                (token1.value, token1.lineno, token1.column),
+                (token2.value, token2.lineno, token2.column),
+            )
+
+    def test_single_pass_program(self):
+        from calc16 import Interpreter
+        tree = self.parse(self.program, single_pass=True)
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY['b'], 25)
+
+
+class ParallelSemanticAnalyzerTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from concurrent.futures import ProcessPoolExecutor
+        cls.executor = ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+
+    def analyze(self, text, parallel):
+        from calc16 import Lexer, Parser, SemanticAnalyzer
+        tree = Parser(Lexer(text)).parse()
+        if parallel:
+            semantic_analyzer = SemanticAnalyzer(self.executor, batch_size=3)
+        else:
+            semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.visit(tree)
+        return tree
+
+    def first_error(self, text, parallel):
+        from calc16 import SemanticError
+        with self.assertRaises(SemanticError) as cm:
+            self.analyze(text, parallel)
+        token = cm.exception.token
+        return cm.exception.error_code, token.value, token.lineno
+
+    def test_same_annotated_tree(self):
+        from bench import generate_procedures_program
+        text = generate_procedures_program(20)
+        self.assertEqual(
+            tree_annotations(self.analyze(text, parallel=True)),
+            tree_annotations(self.analyze(text, parallel=False)),
+        )
+
+    def test_same_optimizations(self):
+        # in batches of three, G calls F of its own batch and P and Q
+        # call F, G and R of the first one: every call must refer to the
+        # symbols of this process
+        text = """
+        PROGRAM Test;
+        VAR a, b : INTEGER;
+        FUNCTION F(x : INTEGER) : INTEGER;
+        BEGIN F := x * 2 END;
+        FUNCTION G(x : INTEGER) : INTEGER;
+        BEGIN G := F(x) + 1 END;
+        PROCEDURE R;
+        BEGIN b := a + 1 END;
+        PROCEDURE P;
+        BEGIN a := G(a) + G(a); b := 2 * 3 + a END;
+        PROCEDURE Q;
+        BEGIN P(); R(); a := F(3); b := b; a := 4 END;
+        BEGIN a := 1; Q(); b := G(b) END.
+        """
+        from calc16 import mark_pure_functions, optimize
+        results = []
+        for parallel in (True, False):
+            tree = self.analyze(text, parallel)
+            pure = [decl.proc_name for decl in mark_pure_functions(tree)]
+            stats = {}
+            optimize(tree, stats)
+            results.append((pure, stats))
+        self.assertEqual(results[0], results[1])
+        pure, stats = results[0]
+        self.assertEqual(pure, ['F', 'G'])
+        self.assertGreater(stats['calls inlined'], 0)
+
+    def test_same_first_error(self):
+        from bench import generate_procedures_program
+        from calc16 import ErrorCode
+        text = generate_procedures_program(20)
+        errors = (
+            # an unknown variable in P2
+            ('   x := c * 4 + number;', '   x := c * unknown;',
+             ErrorCode.ID_NOT_FOUND),
+            # a REAL assigned to an INTEGER in P5
+            ('   x := c * 7 + number;', '   x := d;',
+             ErrorCode.TYPE_MISMATCH),
+            # too few arguments in the main block
+            ('   P10(a + 10, y);', '   P10(a);',
+             ErrorCode.WRONG_PARAMS_NUM),
+        )
+        for start in range(len(errors)):
+            error_text = text
+            for line, error_line, _ in errors[start:]:
+                error_text = error_text.replace(line, error_line, 1)
+            error = self.first_error(error_text, parallel=True)
+            self.assertEqual(
+                error, self.first_error(error_text, parallel=False)
+            )
+            self.assertEqual(error[0], errors[start][2])
+
+    def test_error_before_procedures(self):
+        text = """
+        PROGRAM Test;
+        VAR
+            a : INTEGER;
+            a : REAL;
+        PROCEDURE P1;
+        BEGIN
+           b := 1
+        END;
+        BEGIN
+        END.
+        """
+        from calc16 import ErrorCode
+        error = self.first_error(text, parallel=True)
+        self.assertEqual(error, self.first_error(text, parallel=False))
+        self.assertEqual(error, (ErrorCode.DUPLICATE_ID, 'a', 5))
+
+    def test_error_in_declaration_after_error_in_body(self):
+        # the declaration of F fails in this process, after P's body
+        # has gone to a worker
+        text = """
+        PROGRAM Test;
+        PROCEDURE P;
+        BEGIN y := 1
+        END;
+        FUNCTION F(F : INTEGER) : INTEGER;
+        BEGIN
+        END;
+        BEGIN
+        END.
+        """
+        from calc16 import ErrorCode
+        error = self.first_error(text, parallel=True)
+        self.assertEqual(error, self.first_error(text, parallel=False))
+        self.assertEqual(error, (ErrorCode.ID_NOT_FOUND, 'y', 4))
+
+
+class StreamingCompilationTestCase(unittest.TestCase):
+    def compile(self, text):
+        from calc16 import Lexer, StreamingParser
+        return StreamingParser(Lexer(text)).parse()
+
+    def interpret(self, text):
+        from calc16 import CompactInterpreter
+        interpreter = CompactInterpreter(self.compile(text))
+        interpreter.interpret()
+        return interpreter.GLOBAL_MEMORY
+
+    def test_same_results_as_interpreter(self):
+        from calc16 import Lexer, Parser, SemanticAnalyzer, Interpreter
+        text = SinglePassFrontEndTestCase.program
+        tree = Parser(Lexer(text)).parse()
+        SemanticAnalyzer().visit(tree)
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(self.interpret(text), interpreter.GLOBAL_MEMORY)
+
+    def test_arithmetic_expressions(self):
+        for expr, result in (
+            ('7 + 3 * (10 DIV (12 DIV (3 + 1) - 1))', 22),
+            ('5 - - - + - (3 + 4) - +2', 10),
+            ('7.14 - 8 / 4', 5.14),
+        ):
+            memory = self.interpret(
+                'PROGRAM Test; VAR a : REAL; BEGIN a := %s END.' % expr
+            )
+            self.assertEqual(memory['a'], result)
+
+    def test_no_tokens_or_ast_nodes_are_kept(self):
+        from calc16 import AST, Token, CompactProcedure
+        program = self.compile(SinglePassFrontEndTestCase.program)
+        (p1,) = program.procedures
+        (p2,) = p1.procedures
+        self.assertEqual((p1.name, p1.params, p2.name), ('P1', ('c',), 'P2'))
+
+        def check(code):
+            self.assertNotIsInstance(code, (AST, Token))
+            if isinstance(code, CompactProcedure):
+                check(code.code)
+                check(code.procedures)
+            elif isinstance(code, tuple):
+                for item in code:
+                    check(item)
+        check(program)
+
+    def test_semantic_errors(self):
+        from calc16 import SemanticError, ErrorCode
+        with self.assertRaises(SemanticError) as cm:
+            self.compile(
+                "PROGRAM T; PROCEDURE P; BEGIN a := 1 END; BEGIN END."
+            )
+        self.assertEqual(cm.exception.error_code, ErrorCode.ID_NOT_FOUND)
+
+    def test_peak_memory(self):
+        from bench import (
+            generate_procedures_program,
+            measure_peak,
+            run_streaming,
+            run_two_pass,
+        )
+        text = generate_procedures_program(300)
+        two_pass_memory, two_pass_peak = measure_peak(run_two_pass, text)
+        streaming_memory, streaming_peak = measure_peak(run_streaming, text)
+        self.assertEqual(streaming_memory, two_pass_memory)
+        self.assertLess(streaming_peak * 3, two_pass_peak)
+
 
 class InterpreterTestCase(unittest.TestCase):
     def makeInterpreter(self, text):
@@ -296,5 +807,2881 @@ END.  {Part12}
         self.assertAlmostEqual(globals['y'], float(20) / 7 + 3.14)  # 5.9971...
 
 
+class ClosureInterpreterTestCase(InterpreterTestCase):
+    """Runs the InterpreterTestCase tests with ClosureInterpreter."""
+    def makeInterpreter(self, text):
+        from calc16 import Lexer, Parser, SemanticAnalyzer, ClosureInterpreter
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        tree = parser.parse()
+
+        semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.visit(tree)
+
+        interpreter = ClosureInterpreter(tree)
+        return interpreter
+
+    def test_same_results_as_interpreter(self):
+        from bench import generate_arithmetic_program
+        from calc16 import Interpreter
+        for seed in range(5):
+            interpreter = self.makeInterpreter(
+                generate_arithmetic_program(200, seed)
+            )
+            interpreter.interpret()
+            tree_interpreter = Interpreter(interpreter.tree)
+            tree_interpreter.interpret()
+            self.assertEqual(
+                interpreter.GLOBAL_MEMORY, tree_interpreter.GLOBAL_MEMORY
+            )
+
+
+class PyCodeInterpreterTestCase(ClosureInterpreterTestCase):
+    """Runs the InterpreterTestCase tests with PyCodeInterpreter."""
+    def makeInterpreter(self, text):
+        from calc16 import Lexer, Parser, SemanticAnalyzer, PyCodeInterpreter
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        tree = parser.parse()
+
+        semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.visit(tree)
+
+        interpreter = PyCodeInterpreter(tree, filename='test.pas')
+        return interpreter
+
+    def test_nested_procedures(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  a, b : INTEGER;
+                  None : INTEGER;
+
+               PROCEDURE Outer(n : INTEGER);
+               VAR
+                  k : INTEGER;
+                  PROCEDURE Inner(a : INTEGER);
+                  BEGIN
+                     k := k + a;
+                     None := a
+                  END;
+               BEGIN
+                  k := n;
+                  Inner(n * 2);
+                  b := k
+               END;
+
+               BEGIN
+                  a := 1;
+                  Outer(5)
+               END.
+            """
+        )
+        interpreter.interpret()
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY, {'a': 1, 'b': 15, 'None': 10}
+        )
+
+    def test_traceback_line_numbers(self):
+        import traceback
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  a : INTEGER;
+               PROCEDURE P(n : INTEGER);
+               BEGIN
+                  a := 10 DIV n
+               END;
+               BEGIN
+                  a := 1;
+                  P(a - 1)
+               END.
+            """
+        )
+        try:
+            interpreter.interpret()
+        except ZeroDivisionError as e:
+            frames = traceback.extract_tb(e.__traceback__)
+        else:
+            self.fail('ZeroDivisionError not raised')
+        self.assertEqual(
+            [(f.filename, f.name, f.lineno) for f in frames[-2:]],
+            [('test.pas', 'Test', 10), ('test.pas', 'P', 6)],
+        )
+
+
+class VMInterpreterTestCase(ClosureInterpreterTestCase):
+    """Runs the InterpreterTestCase tests with VMInterpreter."""
+    def makeInterpreter(self, text):
+        from calc16 import Lexer, Parser, SemanticAnalyzer, VMInterpreter
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        tree = parser.parse()
+
+        semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.visit(tree)
+
+        interpreter = VMInterpreter(tree)
+        return interpreter
+
+    text = """PROGRAM Test;
+              VAR
+                 a : INTEGER;
+                 y : REAL;
+              BEGIN
+                 a := 2;
+                 y := a / 4 + 2 * -a
+              END.
+           """
+
+    def test_constant_pool(self):
+        interpreter = self.makeInterpreter(self.text)
+        bytecode = interpreter.bytecode
+        self.assertEqual(bytecode.consts, [2, 4])
+        self.assertEqual(bytecode.names, ['a', 'y'])
+        self.assertEqual(bytecode.code.typecode, 'i')
+
+    def test_disassemble(self):
+        interpreter = self.makeInterpreter(self.text)
+        listing = interpreter.bytecode.disassemble().splitlines()
+        self.assertEqual(
+            [line.split() for line in listing],
+            [
+                ['0', 'LOAD_CONST', '0', '(2)'],
+                ['2', 'STORE_VAR', '0', '(a)'],
+                ['4', 'LOAD_VAR', '0', '(a)'],
+                ['6', 'LOAD_CONST', '1', '(4)'],
+                ['8', 'FLOAT_DIV'],
+                ['9', 'LOAD_CONST', '0', '(2)'],
+                ['11', 'LOAD_VAR', '0', '(a)'],
+                ['13', 'NEG'],
+                ['14', 'MUL'],
+                ['15', 'ADD'],
+                ['16', 'STORE_VAR', '1', '(y)'],
+            ]
+        )
+
+    def test_disassemble_procedures(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  a : INTEGER;
+               PROCEDURE Outer(n : INTEGER);
+               VAR
+                  k : INTEGER;
+                  PROCEDURE Inner;
+                  BEGIN
+                     k := n * 2
+                  END;
+               BEGIN
+                  Inner();
+                  a := k
+               END;
+               BEGIN
+                  Outer(3)
+               END.
+            """
+        )
+        listing = interpreter.bytecode.disassemble().splitlines()
+        self.assertEqual(
+            [line.split() for line in listing],
+            [
+                ['Inner:'],
+                ['0', 'LOAD_OUTER', '1', '0', '(Outer.n)'],
+                ['3', 'LOAD_CONST', '0', '(2)'],
+                ['5', 'MUL'],
+                ['6', 'STORE_OUTER', '1', '1', '(Outer.k)'],
+                ['9', 'RETURN'],
+                ['Outer:'],
+                ['10', 'CALL', '1', '0', '(Inner)'],
+                ['13', 'LOAD_LOCAL', '1', '(k)'],
+                ['15', 'STORE_VAR', '0', '(a)'],
+                ['17', 'RETURN'],
+                ['Test:'],
+                ['18', 'LOAD_CONST', '1', '(3)'],
+                ['20', 'CALL', '0', '-1', '(Outer)'],
+            ]
+        )
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, {'a': 6})
+
+    def test_bytecode_file_round_trip(self):
+        from calc16 import Bytecode, VirtualMachine
+        interpreter = self.makeInterpreter(self.text)
+        data = interpreter.bytecode.dumps()
+        self.assertTrue(data.startswith(Bytecode.MAGIC))
+
+        vm = VirtualMachine(Bytecode.loads(data))
+        vm.interpret()
+        self.assertEqual(vm.GLOBAL_MEMORY, {'a': 2, 'y': -3.5})
+
+    def test_bytecode_file_bad_magic(self):
+        from calc16 import Bytecode
+        with self.assertRaises(ValueError):
+            Bytecode.loads(b'PROGRAM Test; BEGIN END.')
+
+
+class RegisterInterpreterTestCase(ClosureInterpreterTestCase):
+    """Runs the InterpreterTestCase tests with RegisterInterpreter."""
+    def makeInterpreter(self, text):
+        from calc16 import Lexer, Parser, SemanticAnalyzer, RegisterInterpreter
+        lexer = Lexer(text)
+        parser = Parser(lexer)
+        tree = parser.parse()
+
+        semantic_analyzer = SemanticAnalyzer()
+        semantic_analyzer.visit(tree)
+
+        interpreter = RegisterInterpreter(tree)
+        return interpreter
+
+    def listing(self, interpreter):
+        # the instructions without their numbers, and the labels
+        return [
+            line.split()[1:] if line.startswith(' ') else [line]
+            for line in interpreter.code.disassemble().splitlines()
+        ]
+
+    def test_operation_writes_the_variable(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  x, a, b : INTEGER;
+               BEGIN
+                  a := 1;
+                  b := +a;
+                  x := (a + b) * 2
+               END.
+            """
+        )
+        self.assertEqual(
+            self.listing(interpreter),
+            [
+                ['MOVE', 'a,', '1'],
+                ['MOVE', 'b,', 'a'],
+                ['ADD', 't0,', 'a,', 'b'],
+                ['MUL', 'x,', 't0,', '2'],
+            ]
+        )
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, {'a': 1, 'b': 1, 'x': 4})
+        self.assertEqual(interpreter.instructions_executed, 4)
+
+    def test_temporaries_share_registers(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  a, b : INTEGER;
+                  y    : REAL;
+               BEGIN
+                  a := 3;
+                  b := 4;
+                  y := (a + b) * (a - b) - (a * 2 + b) / (b - -a);
+                  a := (a + 1) * (b + 2)
+               END.
+            """
+        )
+        # (a + b) * (a - b) needs two temporaries at the same time,
+        # (a * 2 + b) / (b - -a) three, counting the one holding the
+        # product, and no statement needs more
+        self.assertEqual(interpreter.code.temporaries, 3)
+        interpreter.interpret()
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY, {'a': 24, 'b': 4, 'y': -7 - 10 / 7}
+        )
+
+    def test_variable_read_before_call(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  a, b : INTEGER;
+               FUNCTION Bump(n : INTEGER) : INTEGER;
+               BEGIN
+                  a := a + n;
+                  Bump := n
+               END;
+               BEGIN
+                  a := 1;
+                  b := a + Bump(10)
+               END.
+            """
+        )
+        # Bump assigns a after the addition's left operand is read
+        self.assertEqual(
+            self.listing(interpreter),
+            [
+                ['Bump:'],
+                ['LOAD_GLOBAL', 't0,', 'a'],
+                ['ADD', 't0,', 't0,', 'n'],
+                ['STORE_GLOBAL', 'a,', 't0'],
+                ['MOVE', 'Bump,', 'n'],
+                ['RETURN_VALUE', 'Bump'],
+                ['Test:'],
+                ['MOVE', 'a,', '1'],
+                ['MOVE', 't0,', 'a'],
+                ['ARG', '10'],
+                ['CALL', 't1,', 'Bump'],
+                ['ADD', 'b,', 't0,', 't1'],
+            ]
+        )
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, {'a': 11, 'b': 11})
+
+    def test_conditions_jump(self):
+        interpreter = self.makeInterpreter(
+            """PROGRAM Test;
+               VAR
+                  a, b : INTEGER;
+               BEGIN
+                  a := 0;
+                  b := 10;
+                  WHILE (a < b) AND NOT (a = 5) DO
+                     IF a > 2 THEN b := b - 1 ELSE a := a + 1
+               END.
+            """
+        )
+        # AND jumps out of the loop as soon as an operand is false
+        self.assertEqual(
+            self.listing(interpreter),
+            [
+                ['MOVE', 'a,', '0'],
+                ['MOVE', 'b,', '10'],
+                ['LESS', 't0,', 'a,', 'b'],
+                ['JUMP_IF_FALSE', 't0,', '12'],
+                ['EQUAL', 't0,', 'a,', '5'],
+                ['JUMP_IF_TRUE', 't0,', '12'],
+                ['GREATER', 't0,', 'a,', '2'],
+                ['JUMP_IF_FALSE', 't0,', '10'],
+                ['SUB', 'b,', 'b,', '1'],
+                ['JUMP', '11'],
+                ['ADD', 'a,', 'a,', '1'],
+                ['JUMP', '2'],
+            ]
+        )
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, {'a': 3, 'b': 3})
+
+    def test_fewer_instructions_than_stack_vm(self):
+        from bench import generate_arithmetic_program
+        from calc16 import VMInterpreter
+        interpreter = self.makeInterpreter(generate_arithmetic_program(100))
+        interpreter.interpret()
+        stack_interpreter = VMInterpreter(interpreter.tree)
+        stack_interpreter.interpret()
+        self.assertLess(
+            interpreter.instructions_executed * 2,
+            stack_interpreter.instructions_executed,
+        )
+
+
+def analyze(text):
+    from calc16 import Lexer, Parser, SemanticAnalyzer
+    tree = Parser(Lexer(text)).parse()
+    SemanticAnalyzer().visit(tree)
+    return tree
+
+
+class OptimizedInterpreterTestCase(InterpreterTestCase):
+    """Runs the InterpreterTestCase tests with Interpreter on optimized
+    trees, and compares the results of generated programs with those of
+    the unoptimized trees."""
+    def makeInterpreter(self, text):
+        from calc16 import Interpreter, optimize
+        interpreter = Interpreter(optimize(analyze(text)))
+        return interpreter
+
+    def assertSameResults(self, text):
+        from calc16 import Interpreter
+        interpreter = self.makeInterpreter(text)
+        interpreter.interpret()
+        unoptimized = Interpreter(analyze(text))
+        unoptimized.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, unoptimized.GLOBAL_MEMORY)
+
+    def test_same_results_as_unoptimized(self):
+        from bench import generate_arithmetic_program
+        for seed in range(5):
+            self.assertSameResults(generate_arithmetic_program(200, seed))
+
+    def test_same_results_with_calls(self):
+        from bench import generate_calls_program, generate_procedures_program
+        self.assertSameResults(ProcedureCallTestCase.program)
+        self.assertSameResults(ProcedureInlinerTestCase.program)
+        self.assertSameResults(generate_calls_program(50))
+        self.assertSameResults(generate_procedures_program(20))
+
+    def test_same_results_constant_expressions(self):
+        self.assertSameResults(
+            """PROGRAM Test;
+               VAR
+                  a, b : INTEGER;
+                  x, y : REAL;
+               BEGIN
+                  a := 10 * 4 DIV 2 - -7 DIV 2;
+                  b := a * (3 - 5) DIV (2 * 2) + (-9) DIV 4;
+                  x := 10 * 4 DIV 2 + 3.14 - 7 / 2;
+                  y := x / (1 / 3) + - (2.5 * 4) + a / 3 / 7
+               END.
+            """
+        )
+
+
+class GlobalMemoryTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Globals;
+VAR
+   a, b, unused : INTEGER;
+   y : REAL;
+
+PROCEDURE Add(n : INTEGER);
+BEGIN
+   a := a + n
+END;
+
+BEGIN
+   Add(b);
+   y := a / 2
+END.
+"""
+
+    def test_slots(self):
+        from calc16 import Interpreter
+        tree = analyze(self.program)
+        interpreter = Interpreter(tree)
+        self.assertEqual(
+            tree.global_slots, {'a': 0, 'b': 1, 'unused': 2, 'y': 3}
+        )
+        interpreter.set_global('a', 5)
+        interpreter.set_global('b', 2)
+        interpreter.interpret()
+        self.assertEqual(interpreter.globals, [7, 2, None, 3.5])
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY, {'a': 7, 'b': 2, 'y': 3.5}
+        )
+        self.assertNotIn('unused', interpreter.GLOBAL_MEMORY)
+        with self.assertRaises(KeyError):
+            interpreter.GLOBAL_MEMORY['unused']
+        with self.assertRaises(KeyError):
+            interpreter.set_global('n', 1)
+
+    def test_read_only(self):
+        from calc16 import Interpreter
+        interpreter = Interpreter(analyze(self.program))
+        with self.assertRaises(TypeError):
+            interpreter.GLOBAL_MEMORY['a'] = 1
+        self.assertFalse(hasattr(interpreter.GLOBAL_MEMORY, 'update'))
+
+    def test_interpreters_are_isolated(self):
+        from calc16 import Interpreter
+        tree = analyze(self.program)
+        first, second = Interpreter(tree), Interpreter(tree)
+        first.set_global('a', 1)
+        first.set_global('b', 1)
+        second.set_global('a', 10)
+        second.set_global('b', 20)
+        first.interpret()
+        second.interpret()
+        self.assertEqual(first.GLOBAL_MEMORY, {'a': 2, 'b': 1, 'y': 1.0})
+        self.assertEqual(second.GLOBAL_MEMORY, {'a': 30, 'b': 20, 'y': 15.0})
+
+    def test_temp_decls_left_out(self):
+        from calc16 import Interpreter, ProcedureInliner
+        tree = analyze(
+            self.program.replace('   Add(b)', '   a := 1; b := 4; Add(b)')
+        )
+        ProcedureInliner().visit(tree)
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(
+            tree.global_slots, {'a': 0, 'b': 1, 'unused': 2, 'y': 3}
+        )
+        self.assertEqual(tree.frame_size, 1)  # n_1 of the inlined Add
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY, {'a': 5, 'b': 4, 'y': 2.5}
+        )
+
+
+class BatchInterpreterTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Batch;
+VAR
+   a, b, c, k : INTEGER;
+   x, y, z : REAL;
+
+PROCEDURE Scale(n : INTEGER; f : REAL);
+VAR
+   t : REAL;
+BEGIN
+   t := f * n;
+   y := y + t / 4
+END;
+
+BEGIN
+   k := 6 * 7;
+   c := (a * 8 - b DIV 3) DIV 4 + -a DIV 2;
+   Scale(c, x);
+   z := a / 3 + -x * 2 - k;
+   x := x / (a + 0.5) + +c
+END.
+"""
+    inputs = {
+        'a': [-7, 0, 5, 1000, -123456789],
+        'b': [3, -2, 0, 77, 5],
+        'x': [2.5, -0.0, 1e300, -7, 1.25],
+        'y': [0.0, 0.5, -1.5, 3, float('inf')],
+    }
+
+    def setUp(self):
+        from calc16 import np
+        if np is None:
+            self.skipTest('NumPy is not installed')
+
+    def scalar_runs(self, tree, inputs):
+        from calc16 import Interpreter
+        memories = []
+        for n in range(len(inputs['a'])):
+            interpreter = Interpreter(tree)
+            for name, values in inputs.items():
+                interpreter.set_global(name, values[n])
+            interpreter.interpret()
+            memories.append(dict(interpreter.GLOBAL_MEMORY))
+        return memories
+
+    def assertSameAsScalarRuns(self, tree, inputs):
+        from calc16 import BatchInterpreter
+        batch = BatchInterpreter(tree, inputs)
+        batch.interpret()
+        for n, memory in enumerate(self.scalar_runs(tree, inputs)):
+            self.assertEqual(set(batch.GLOBAL_MEMORY), set(memory))
+            for name, value in memory.items():
+                element = batch.GLOBAL_MEMORY[name][n].item()
+                self.assertEqual(
+                    (element, type(element)), (value, type(value)),
+                    f'{name} of input set {n}',
+                )
+        return batch
+
+    def test_same_results_as_scalar_runs(self):
+        batch = self.assertSameAsScalarRuns(analyze(self.program), self.inputs)
+        self.assertEqual(batch.GLOBAL_MEMORY['k'].tolist(), [42] * 5)
+        self.assertEqual(batch.GLOBAL_MEMORY['c'].dtype.kind, 'i')
+        self.assertEqual(batch.GLOBAL_MEMORY['z'].dtype.kind, 'f')
+
+    def test_optimized_program(self):
+        from calc16 import optimize
+        tree = analyze(self.program)
+        optimize(tree)
+        self.assertSameAsScalarRuns(tree, self.inputs)
+
+    def test_division_by_zero(self):
+        from calc16 import BatchInterpreter
+        tree = analyze(self.program.replace('b DIV 3', '3 DIV b'))
+        batch = BatchInterpreter(tree, self.inputs)
+        with self.assertRaises(ZeroDivisionError):
+            batch.interpret()
+
+    def test_inputs_of_different_lengths(self):
+        from calc16 import BatchInterpreter
+        with self.assertRaises(ValueError):
+            BatchInterpreter(
+                analyze(self.program), {'a': [1, 2], 'b': [1, 2, 3]}
+            )
+
+
+class ProcedureCallTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Calls;
+VAR
+   a, b, count, total : INTEGER;
+   y                  : REAL;
+
+PROCEDURE Store(a : INTEGER; r : REAL);
+BEGIN
+   b := a * 2;
+   y := r / 2
+END;
+
+PROCEDURE Outer(n : INTEGER);
+VAR
+   k : INTEGER;
+
+   PROCEDURE Add(m : INTEGER);
+   BEGIN
+      k := k + m * n;
+      count := count + 1
+   END;
+
+   PROCEDURE Twice(m : INTEGER);
+   VAR
+      n : INTEGER;
+
+      PROCEDURE Again;
+      BEGIN
+         Add(m + n)
+      END;
+
+   BEGIN
+      n := 100;
+      Add(m);
+      Again()
+   END;
+
+BEGIN
+   k := 1;
+   Twice(2);
+   total := total + k
+END;
+
+BEGIN
+   a := 1;
+   Store(3 + 4, 5);
+   count := 0;
+   total := 0;
+   Outer(3);
+   Outer(4)
+END.
+"""
+
+    def engines(self):
+        from calc16 import (
+            ClosureInterpreter,
+            CompactInterpreter,
+            Interpreter,
+            Lexer,
+            PyCodeInterpreter,
+            RegisterInterpreter,
+            StreamingParser,
+            VMInterpreter,
+            optimize,
+        )
+        yield 'tree', Interpreter(analyze(self.program))
+        yield 'optimized', Interpreter(optimize(analyze(self.program)))
+        yield 'closure', ClosureInterpreter(analyze(self.program))
+        yield 'pycode', PyCodeInterpreter(analyze(self.program))
+        yield 'vm', VMInterpreter(analyze(self.program))
+        yield 'regvm', RegisterInterpreter(analyze(self.program))
+        yield 'streaming', CompactInterpreter(
+            StreamingParser(Lexer(self.program)).parse()
+        )
+
+    def test_calls(self):
+        for name, interpreter in self.engines():
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(interpreter.GLOBAL_MEMORY, {
+                    # Store's parameter a shadows the global a
+                    'a': 1,
+                    'b': 14,
+                    'y': 2.5,
+                    'count': 4,
+                    # Outer(3): 1 + 2 * 3 + 102 * 3,
+                    # Outer(4): 1 + 2 * 4 + 102 * 4
+                    'total': 313 + 417,
+                })
+
+    def test_frame_layout(self):
+        from calc16 import FrameResolver
+        tree = FrameResolver().resolve(analyze(self.program))
+        store, outer = tree.block.declarations[5:]
+        add, twice = outer.block_node.declarations[1:]
+        again = twice.block_node.declarations[1]
+        self.assertEqual(
+            (store.frame_size, outer.frame_size, add.frame_size,
+             twice.frame_size, again.frame_size),
+            (2, 2, 1, 2, 0),
+        )
+        # k := k + m * n in Add
+        assign = add.block_node.compound_statement.children[0]
+        self.assertEqual(assign.left.address, (1, 1))
+        self.assertEqual(assign.right.right.left.address, (0, 0))
+        self.assertEqual(assign.right.right.right.address, (1, 0))
+        # Add(m + n) in Again
+        call = again.block_node.compound_statement.children[0]
+        self.assertIs(call.callee, add)
+        self.assertEqual(call.static_hops, 2)
+        self.assertEqual(call.actual_params[0].left.address, (1, 0))
+        self.assertEqual(call.actual_params[0].right.address, (1, 1))
+        # count := count + 1 and a call from the program block
+        self.assertIsNone(
+            add.block_node.compound_statement.children[1].left.address
+        )
+        self.assertIsNone(
+            tree.block.compound_statement.children[1].static_hops
+        )
+
+    def test_frames_are_reused(self):
+        from calc16 import Interpreter
+        interpreter = Interpreter(analyze(self.program))
+        interpreter.interpret()
+        self.assertEqual(len(interpreter.call_stack), 0)
+        pools = {
+            proc_decl.proc_name: pool
+            for proc_decl, pool in interpreter.frame_pools.items()
+        }
+        self.assertEqual(
+            sorted(pools), ['Add', 'Again', 'Outer', 'Store', 'Twice']
+        )
+        # Add ran four times in a single record, with no static link left
+        (record,) = pools['Add'].free
+        self.assertEqual(record.slots, [102])
+        self.assertIsNone(record.enclosing)
+        for pool in pools.values():
+            self.assertEqual(len(pool.free), 1)
+
+
+class FunctionTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Functions;
+VAR
+   a, b, count, total : INTEGER;
+   x, y               : REAL;
+
+FUNCTION Square(n : INTEGER) : INTEGER;
+VAR
+   t : INTEGER;
+BEGIN
+   t := n * n;
+   Square := t
+END;
+
+FUNCTION Half(r : REAL) : REAL;
+BEGIN
+   Half := r / 2
+END;
+
+FUNCTION Poly(n : INTEGER) : INTEGER;
+VAR
+   k : INTEGER;
+
+   PROCEDURE Step(m : INTEGER);
+   BEGIN
+      k := k + m
+   END;
+
+BEGIN
+   k := n * n;
+   Step(n);
+   Poly := Square(k) + 1
+END;
+
+FUNCTION Counted(n : INTEGER) : INTEGER;
+BEGIN
+   count := count + 1;
+   Counted := Square(n) + total
+END;
+
+BEGIN
+   count := 0;
+   total := 0;
+   a := Square(3) + Square(3) * 2;
+   b := Counted(2) + Counted(2);
+   x := Half(a) + Half(-0.0);
+   y := Half(-0.0) * 0;
+   total := Poly(2) + Poly(3) + Poly(2)
+END.
+"""
+
+    def test_calls(self):
+        from calc16 import (
+            ClosureInterpreter,
+            Interpreter,
+            RegisterInterpreter,
+            VMInterpreter,
+            optimize,
+        )
+        for name, interpreter in (
+            ('tree', Interpreter(analyze(self.program))),
+            ('optimized', Interpreter(optimize(analyze(self.program)))),
+            ('unmemoised', Interpreter(analyze(self.program), memo_size=0)),
+            ('closure', ClosureInterpreter(analyze(self.program))),
+            ('vm', VMInterpreter(analyze(self.program))),
+            ('regvm', RegisterInterpreter(analyze(self.program))),
+        ):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(interpreter.GLOBAL_MEMORY, {
+                    'a': 27,
+                    'b': 8,
+                    'count': 2,
+                    'x': 13.5,
+                    'y': -0.0,
+                    # Poly(2): 6 * 6 + 1, Poly(3): 12 * 12 + 1
+                    'total': 37 + 145 + 37,
+                })
+                y = interpreter.GLOBAL_MEMORY['y']
+                self.assertEqual(str(y), '-0.0')
+
+    def test_pure_functions(self):
+        from calc16 import mark_pure_functions
+        tree = analyze(self.program)
+        pure = mark_pure_functions(tree)
+        # Poly's nested procedure assigns one of Poly's own locals only
+        self.assertEqual(
+            [func_decl.proc_name for func_decl in pure],
+            ['Square', 'Half', 'Poly'],
+        )
+        counted = tree.block.declarations[-1]
+        self.assertFalse(counted.pure)
+
+    def test_callee_reads_shadowed_global(self):
+        # the x G reads is the global x, not F's local x, so F isn't pure
+        from calc16 import Interpreter, mark_pure_functions
+        text = """PROGRAM Test;
+                  VAR
+                     x, y, z : INTEGER;
+                  FUNCTION G(a : INTEGER) : INTEGER;
+                  BEGIN
+                     G := a + x
+                  END;
+                  FUNCTION F(a : INTEGER) : INTEGER;
+                  VAR
+                     x : INTEGER;
+                  BEGIN
+                     F := G(a)
+                  END;
+                  BEGIN
+                     x := 1;
+                     y := F(1);
+                     x := 100;
+                     z := F(1)
+                  END.
+               """
+        tree = analyze(text)
+        self.assertEqual(mark_pure_functions(tree), [])
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY, {'x': 100, 'y': 2, 'z': 101}
+        )
+
+    def test_memo_statistics(self):
+        from calc16 import Interpreter
+        interpreter = Interpreter(analyze(self.program))
+        interpreter.interpret()
+        caches = {
+            func_decl.proc_name: cache
+            for func_decl, cache in interpreter.memo_caches.items()
+        }
+        # Counted isn't pure, so both its calls run Square(2)
+        self.assertEqual(
+            list(caches['Square']), [(3,), (2,), (6,), (12,)]
+        )
+        self.assertEqual(list(caches['Poly']), [(3,), (2,)])
+        # 0.0 would be another key
+        self.assertEqual(list(caches['Half']), [(27,), ('-0.0',)])
+        self.assertEqual(interpreter.memo_misses, 8)
+        # Square(3), Square(2), Half(-0.0) and Poly(2)
+        self.assertEqual(interpreter.memo_hits, 4)
+
+    def test_memo_size(self):
+        from calc16 import Interpreter
+        interpreter = Interpreter(analyze(self.program), memo_size=2)
+        interpreter.interpret()
+        caches = {
+            func_decl.proc_name: cache
+            for func_decl, cache in interpreter.memo_caches.items()
+        }
+        # the least recently used results are dropped
+        self.assertEqual(list(caches['Square']), [(6,), (12,)])
+        self.assertEqual(interpreter.GLOBAL_MEMORY['total'], 219)
+
+        interpreter = Interpreter(analyze(self.program), memo_size=0)
+        interpreter.interpret()
+        self.assertEqual(interpreter.memo_caches, {})
+        self.assertEqual(interpreter.memo_hits, 0)
+
+    def test_frame_layout(self):
+        from calc16 import FrameResolver
+        tree = FrameResolver().resolve(analyze(self.program))
+        square, half, poly = tree.block.declarations[6:9]
+        self.assertEqual((square.result_slot, square.frame_size), (1, 3))
+        self.assertEqual((half.result_slot, half.frame_size), (1, 2))
+        # Poly := Square(k) + 1
+        assign = poly.block_node.compound_statement.children[2]
+        self.assertEqual(assign.left.address, (0, 1))
+        call = assign.right.left
+        self.assertIs(call.callee, square)
+        self.assertIsNone(call.static_hops)
+        self.assertEqual(call.actual_params[0].address, (0, 2))
+
+    def test_unsupported_engines(self):
+        from calc16 import (
+            CompilerError,
+            ErrorCode,
+            Lexer,
+            ParserError,
+            PyCodeInterpreter,
+            StreamingParser,
+        )
+        with self.assertRaises(CompilerError) as cm:
+            PyCodeInterpreter(analyze(self.program))
+        self.assertEqual(cm.exception.error_code, ErrorCode.UNSUPPORTED)
+        with self.assertRaises(ParserError):
+            StreamingParser(Lexer(self.program)).parse()
+
+
+class ForLoopTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Loops;
+VAR
+   i, j, n, total, count, carried, skipped : INTEGER;
+   x                                        : REAL;
+
+PROCEDURE Add(m : INTEGER);
+VAR
+   k : INTEGER;
+BEGIN
+   FOR k := m DOWNTO 1 DO
+      total := total + k * i
+END;
+
+PROCEDURE Carry;
+VAR
+   k, t : INTEGER;
+BEGIN
+   t := 0;
+   FOR k := 1 TO 4 DO
+   BEGIN
+      carried := carried + t;
+      t := k * 10
+   END
+END;
+
+BEGIN
+   total := 0;
+   count := 0;
+   carried := 0;
+   n := 5;
+   x := 0.5;
+   FOR i := 1 TO n DO
+   BEGIN
+      FOR j := i DOWNTO 1 DO
+         count := count + 1;
+      Add(i);
+      x := x * 2
+   END;
+   Carry();
+   skipped := 7;
+   FOR skipped := n TO n - 1 DO
+      count := 1000
+END.
+"""
+    results = {
+        # the control variables end on their last values
+        'i': 5,
+        'j': 1,
+        'n': 5,
+        'count': 15,
+        # the sum of i * (1 + ... + i) for i from 1 to 5
+        'total': 140,
+        'carried': 60,
+        # the loop didn't run
+        'skipped': 7,
+        'x': 16.0,
+    }
+
+    def engines(self, text):
+        from calc16 import (
+            ClosureInterpreter,
+            CompactInterpreter,
+            Interpreter,
+            Lexer,
+            Parser,
+            PyCodeInterpreter,
+            SemanticAnalyzer,
+            StreamingParser,
+            optimize,
+        )
+        yield 'tree', Interpreter(analyze(text))
+        yield 'optimized', Interpreter(optimize(analyze(text)))
+        yield 'single pass', Interpreter(
+            Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+        )
+        yield 'closure', ClosureInterpreter(analyze(text))
+        yield 'pycode', PyCodeInterpreter(analyze(text))
+        yield 'streaming', CompactInterpreter(
+            StreamingParser(Lexer(text)).parse()
+        )
+
+    def test_loops(self):
+        for name, interpreter in self.engines(self.program):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(interpreter.GLOBAL_MEMORY, self.results)
+
+    def test_python_names(self):
+        # the Python code of a loop calls range whatever Pascal names
+        text = """PROGRAM Test;
+                  VAR
+                     range, i, s : INTEGER;
+                  PROCEDURE Sum(n : INTEGER);
+                  VAR
+                     range : INTEGER;
+                  BEGIN
+                     range := n;
+                     FOR i := range DOWNTO 1 DO s := s + i
+                  END;
+                  BEGIN
+                     range := 3;
+                     s := 0;
+                     FOR i := 1 TO range DO s := s + i;
+                     Sum(range)
+                  END.
+               """
+        for name, interpreter in self.engines(text):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(
+                    interpreter.GLOBAL_MEMORY, {'range': 3, 'i': 1, 's': 12}
+                )
+
+    def test_same_results_as_unrolled(self):
+        from bench import generate_loop_program
+        from calc16 import Interpreter
+        unrolled = Interpreter(analyze(generate_loop_program(50, True)))
+        unrolled.interpret()
+        for name, interpreter in self.engines(generate_loop_program(50)):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(
+                    interpreter.GLOBAL_MEMORY, unrolled.GLOBAL_MEMORY
+                )
+
+    def test_parse(self):
+        from calc16 import For, Var
+        tree = analyze(self.program)
+        loop = tree.block.compound_statement.children[5]
+        self.assertIsInstance(loop, For)
+        self.assertFalse(loop.downto)
+        self.assertEqual(loop.var_node.value, 'i')
+        self.assertEqual(loop.start.value, 1)
+        self.assertIsInstance(loop.stop, Var)
+        inner = loop.body.children[0]
+        self.assertTrue(inner.downto)
+        self.assertEqual(inner.var_node.value, 'j')
+
+    def test_semantic_errors(self):
+        from calc16 import ErrorCode, Lexer, Parser, SemanticAnalyzer
+        from calc16 import SemanticError
+        for statement, error_code in (
+            ('FOR x := 1 TO 3 DO a := 1', ErrorCode.TYPE_MISMATCH),
+            ('FOR a := 1 TO b DO a := 1', ErrorCode.FOR_VAR_ASSIGNED),
+            ('FOR a := 1 TO x DO b := 1', ErrorCode.TYPE_MISMATCH),
+            ('FOR a := 0.5 TO 3 DO b := 1', ErrorCode.TYPE_MISMATCH),
+            ('FOR a := 1 TO 3 DO BEGIN b := a; a := b END',
+             ErrorCode.FOR_VAR_ASSIGNED),
+            ('FOR a := 1 TO 3 DO FOR b := a TO 3 DO a := 1',
+             ErrorCode.FOR_VAR_ASSIGNED),
+            ('FOR a := 1 TO 3 DO BEGIN FOR a := 1 TO 2 DO ; b := a END',
+             ErrorCode.FOR_VAR_ASSIGNED),
+            ('FOR a := 1 TO 3 DO FOR b := 1 TO 3 DO FOR a := 1 TO 2 DO ',
+             ErrorCode.FOR_VAR_ASSIGNED),
+        ):
+            text = """PROGRAM Test;
+                      VAR
+                         a, b : INTEGER;
+                         x    : REAL;
+                      BEGIN
+                         %s
+                      END.
+                   """ % statement
+            with self.subTest(statement=statement):
+                with self.assertRaises(SemanticError) as cm:
+                    analyze(text)
+                self.assertEqual(cm.exception.error_code, error_code)
+                with self.assertRaises(SemanticError) as cm:
+                    Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+                self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_unsupported_engines(self):
+        from calc16 import (
+            CompilerError,
+            ErrorCode,
+            RegisterInterpreter,
+            VMInterpreter,
+        )
+        for engine in (VMInterpreter, RegisterInterpreter):
+            with self.subTest(engine=engine.__name__):
+                with self.assertRaises(CompilerError) as cm:
+                    engine(analyze(self.program))
+                self.assertEqual(
+                    cm.exception.error_code, ErrorCode.UNSUPPORTED
+                )
+
+
+class IfWhileTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Branches;
+VAR
+   a, b, n, steps, zero, guarded, sign, evens, odds : INTEGER;
+   x                                                : REAL;
+
+PROCEDURE Gcd(p, q : INTEGER);
+VAR
+   t : INTEGER;
+BEGIN
+   WHILE q <> 0 DO
+   BEGIN
+      t := p - p DIV q * q;
+      p := q;
+      q := t
+   END;
+   a := p
+END;
+
+PROCEDURE Classify(m : INTEGER);
+BEGIN
+   IF m < 0 THEN sign := -1
+   ELSE IF m = 0 THEN sign := 0
+   ELSE sign := 1
+END;
+
+BEGIN
+   Gcd(1071, 462);
+   n := 27;
+   steps := 0;
+   WHILE NOT (n = 1) DO
+   BEGIN
+      IF n - n DIV 2 * 2 = 0 THEN n := n DIV 2 ELSE n := 3 * n + 1;
+      steps := steps + 1
+   END;
+   zero := 0;
+   guarded := 0;
+   { the right operands would divide by zero }
+   IF (zero <> 0) AND (10 DIV zero > 1) THEN guarded := 1;
+   IF (zero = 0) OR (10 DIV zero > 1) THEN guarded := guarded + 2;
+   Classify(-5);
+   evens := 0;
+   odds := 0;
+   b := 0;
+   WHILE b < 10 DO
+   BEGIN
+      b := b + 1;
+      IF NOT (b - b DIV 2 * 2 = 0) THEN odds := odds + b
+      ELSE evens := evens + b
+   END;
+   x := 1.5;
+   WHILE (x >= 1.5) AND NOT (x > 100.0) OR (x = 0.0) DO
+      x := x * x
+END.
+"""
+    results = {
+        'a': 21,
+        'b': 10,
+        'n': 1,
+        'steps': 111,
+        'zero': 0,
+        'guarded': 2,
+        'sign': -1,
+        'evens': 30,
+        'odds': 25,
+        'x': 1.5 ** 16,
+    }
+
+    def engines(self, text):
+        from calc16 import (
+            ClosureInterpreter,
+            CompactInterpreter,
+            Interpreter,
+            Lexer,
+            Parser,
+            PyCodeInterpreter,
+            RegisterInterpreter,
+            SemanticAnalyzer,
+            StreamingParser,
+            VMInterpreter,
+            optimize,
+        )
+        yield 'tree', Interpreter(analyze(text))
+        yield 'optimized', Interpreter(optimize(analyze(text)))
+        yield 'single pass', Interpreter(
+            Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+        )
+        yield 'closure', ClosureInterpreter(analyze(text))
+        yield 'optimized closure', ClosureInterpreter(optimize(analyze(text)))
+        yield 'pycode', PyCodeInterpreter(analyze(text))
+        yield 'streaming', CompactInterpreter(
+            StreamingParser(Lexer(text)).parse()
+        )
+        yield 'vm', VMInterpreter(analyze(text))
+        yield 'optimized vm', VMInterpreter(optimize(analyze(text)))
+        yield 'regvm', RegisterInterpreter(analyze(text))
+        yield 'optimized regvm', RegisterInterpreter(optimize(analyze(text)))
+
+    def test_branches_and_loops(self):
+        for name, interpreter in self.engines(self.program):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(interpreter.GLOBAL_MEMORY, self.results)
+
+    def test_prime_count(self):
+        from bench import generate_branch_program
+        for name, interpreter in self.engines(generate_branch_program(100)):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(interpreter.GLOBAL_MEMORY['primes'], 25)
+
+    def test_parse(self):
+        from calc16 import BinOp, BoolOp, If, TokenType, UnaryOp, While
+        tree = analyze(self.program)
+        statements = tree.block.compound_statement.children
+        loop = statements[3]
+        self.assertIsInstance(loop, While)
+        self.assertIsInstance(loop.condition, UnaryOp)
+        self.assertEqual(loop.condition.op.type, TokenType.NOT)
+        branch = loop.body.children[0]
+        self.assertIsInstance(branch, If)
+        self.assertIsInstance(branch.condition, BinOp)
+        self.assertEqual(branch.condition.op.type, TokenType.EQUAL)
+        # AND binds tighter than OR, relational operators looser than both
+        condition = statements[-1].condition
+        self.assertIsInstance(condition, BoolOp)
+        self.assertTrue(condition.short_circuit)
+        self.assertFalse(condition.left.short_circuit)
+        # ELSE belongs to the innermost IF
+        classify = tree.block.declarations[-1].block_node
+        outer = classify.compound_statement.children[0]
+        self.assertIsInstance(outer.else_branch, If)
+        self.assertIsNotNone(outer.else_branch.else_branch)
+
+    def test_semantic_errors(self):
+        from calc16 import ErrorCode, Lexer, Parser, SemanticAnalyzer
+        from calc16 import SemanticError
+        for statement in (
+            'IF a THEN a := 1',
+            'WHILE a + 1 DO a := 1',
+            'a := b < 1',
+            'x := (a < 1) + 1',
+            'IF NOT a THEN a := 1',
+            'IF -(a < 1) THEN a := 1',
+            'IF (a < 1) AND a THEN a := 1',
+            'IF a OR (a < 1) THEN a := 1',
+            'IF (a < 1) = (b < 1) THEN a := 1',
+        ):
+            text = """PROGRAM Test;
+                      VAR
+                         a, b : INTEGER;
+                         x    : REAL;
+                      BEGIN
+                         %s
+                      END.
+                   """ % statement
+            with self.subTest(statement=statement):
+                with self.assertRaises(SemanticError) as cm:
+                    analyze(text)
+                self.assertEqual(
+                    cm.exception.error_code, ErrorCode.TYPE_MISMATCH
+                )
+                with self.assertRaises(SemanticError) as cm:
+                    Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+                self.assertEqual(
+                    cm.exception.error_code, ErrorCode.TYPE_MISMATCH
+                )
+
+    def test_optimizations(self):
+        from calc16 import Assign, BinOp, Num, TokenType, Var
+        from calc16 import optimize
+        text = """PROGRAM Test;
+                  VAR
+                     a, b, c, d : INTEGER;
+                     x          : REAL;
+                  BEGIN
+                     a := 1;
+                     c := 5;
+                     IF b > 0 THEN BEGIN a := 1; d := 2 END
+                     ELSE c := 6;
+                     b := a + c;
+                     IF NOT (b < d) THEN d := 1;
+                     IF NOT (x < 1.0) THEN x := 0.0;
+                     WHILE (a > 0) AND (d DIV 0 > 0) DO d := d DIV 0;
+                     c := 7
+                  END.
+               """
+        stats = {}
+        tree = optimize(analyze(text), stats)
+        statements = tree.block.compound_statement.children
+        # a is 1 after either branch, c isn't known
+        self.assertEqual(statements[3].right.left.value, 1)
+        self.assertIsInstance(statements[3].right.right, Var)
+        # NOT b < d becomes b >= d for INTEGERs, but NOT x < 1.0 stays,
+        # x may be NaN
+        inverted = statements[4].condition
+        self.assertIsInstance(inverted, BinOp)
+        self.assertEqual(inverted.op.type, TokenType.GREATER_EQUAL)
+        self.assertEqual(statements[5].condition.op.type, TokenType.NOT)
+        # the divisions by zero are left for the run time
+        self.assertIsInstance(statements[6].condition.right.left, BinOp)
+
+        # an IF deciding on constants is replaced by its branch
+        tree = optimize(analyze(text.replace('b > 0', '2 > 1')))
+        statements = tree.block.compound_statement.children
+        self.assertIsInstance(statements[0].children[0], Assign)
+        self.assertIsInstance(statements[1].right, Num)
+        self.assertEqual(statements[1].right.value, 6)
+        # so is NOT b < d, now that b and d are known
+        self.assertEqual(statements[2].right.value, 1)
+
+    def test_loop_that_may_not_run(self):
+        from calc16 import ErrorCode, Interpreter, SemanticError, optimize
+        text = """PROGRAM Test;
+                  VAR
+                     i, n, x : INTEGER;
+                  BEGIN
+                     n := 0;
+                     x := 5;
+                     FOR i := 1 TO n DO x := 1 DIV 0;
+                     FOR i := n DOWNTO 1 DO x := 2 DIV 0
+                  END.
+               """
+        # the bodies never run, so their divisions are left for the run
+        # time, even with n known
+        for tree in (analyze(text), optimize(analyze(text))):
+            interpreter = Interpreter(tree)
+            interpreter.interpret()
+            self.assertEqual(interpreter.GLOBAL_MEMORY, {'n': 0, 'x': 5})
+
+        # a body that runs is folded
+        with self.assertRaises(SemanticError) as cm:
+            optimize(analyze(text.replace('TO n', 'TO 1')))
+        self.assertEqual(cm.exception.error_code, ErrorCode.DIVISION_BY_ZERO)
+
+
+class ArrayTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Arrays;
+VAR
+   squares : ARRAY[1..10] OF INTEGER;
+   sums    : ARRAY[0..10] OF INTEGER;
+   weights : ARRAY[-2..2] OF REAL;
+   i, total, depth : INTEGER;
+   mean            : REAL;
+
+FUNCTION Square(k : INTEGER) : INTEGER;
+BEGIN
+   Square := squares[k]
+END;
+
+PROCEDURE Negate(k : INTEGER);
+BEGIN
+   sums[k] := -sums[k]
+END;
+
+PROCEDURE Fill(level : INTEGER);
+VAR
+   local : ARRAY[1..3] OF INTEGER;
+   j     : INTEGER;
+BEGIN
+   FOR j := 1 TO 3 DO local[j] := level * j;
+   { the recursive call gets an array of its own }
+   IF level < 3 THEN Fill(level + 1);
+   depth := depth + local[3]
+END;
+
+BEGIN
+   FOR i := 1 TO 10 DO squares[i] := i * i;
+   sums[0] := 0;
+   FOR i := 1 TO 10 DO sums[i] := sums[i - 1] + squares[i];
+   FOR i := 2 DOWNTO -2 DO weights[i] := i / 4;
+   mean := 0.0;
+   i := -2;
+   WHILE i <= 2 DO
+   BEGIN
+      mean := mean + weights[i];
+      i := i + 1
+   END;
+   total := 0;
+   FOR i := 10 DOWNTO 1 DO total := total + Square(i);
+   squares[Square(2)] := 0;
+   Negate(10);
+   depth := 0;
+   Fill(1);
+   { Square reads squares, so the earlier Square(4) isn't reused }
+   i := Square(4)
+END.
+"""
+
+    def results(self):
+        from array import array
+        return {
+            'squares': array('q', [1, 4, 9, 0, 25, 36, 49, 64, 81, 100]),
+            'sums': array(
+                'q', [0, 1, 5, 14, 30, 55, 91, 140, 204, 285, -385]
+            ),
+            'weights': array('d', [-0.5, -0.25, 0.0, 0.25, 0.5]),
+            'i': 0,
+            'total': 385,
+            'depth': 18,
+            'mean': 0.0,
+        }
+
+    def engines(self, text):
+        from calc16 import (
+            ClosureInterpreter,
+            Interpreter,
+            Lexer,
+            Parser,
+            SemanticAnalyzer,
+            optimize,
+        )
+        yield 'tree', Interpreter(analyze(text))
+        yield 'optimized', Interpreter(optimize(analyze(text)))
+        yield 'single pass', Interpreter(
+            Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+        )
+        yield 'closure', ClosureInterpreter(analyze(text))
+        yield 'optimized closure', ClosureInterpreter(optimize(analyze(text)))
+
+    def indices(self, tree):
+        """Return the Index nodes of a tree in source order."""
+        from calc16 import AST, Index, Token
+        indices = []
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Index):
+                indices.append(node)
+            for value in reversed(list(vars(node).values())):
+                children = value if isinstance(value, list) else [value]
+                stack.extend(
+                    child for child in reversed(children)
+                    if isinstance(child, AST) and
+                    not isinstance(child, Token)
+                )
+        return sorted(
+            indices, key=lambda node: (node.token.lineno, node.token.column)
+        )
+
+    def test_arrays(self):
+        for name, interpreter in self.engines(self.program):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(
+                    dict(interpreter.GLOBAL_MEMORY), self.results()
+                )
+
+    def test_parse(self):
+        from calc16 import ArrayType, Assign, Index, Num, Var
+        tree = analyze(self.program)
+        declarations = tree.block.declarations
+        array_type = declarations[2].type_node
+        self.assertIsInstance(array_type, ArrayType)
+        self.assertEqual((array_type.low, array_type.high), (-2, 2))
+        self.assertEqual(array_type.element_type_node.value, 'REAL')
+        self.assertEqual(array_type.symbol.name, 'ARRAY[-2..2] OF REAL')
+        self.assertEqual(array_type.symbol.typecode, 'd')
+        statement = tree.block.compound_statement.children[1]
+        self.assertIsInstance(statement, Assign)
+        self.assertIsInstance(statement.left, Index)
+        self.assertIsInstance(statement.left.var_node, Var)
+        self.assertIsInstance(statement.left.index, Num)
+
+    def test_bounds_checks(self):
+        from calc16 import ErrorCode, Lexer, Parser, SemanticAnalyzer
+        from calc16 import SemanticError
+        checked = [
+            index.checked for index in self.indices(analyze(self.program))
+        ]
+        self.assertEqual(checked, [
+            True,  # squares[k], k is a parameter
+            True, True,  # sums[k], likewise
+            False,  # local[j], j in 1..3
+            False,  # local[3]
+            False,  # squares[i], i in 1..10
+            False,  # sums[0]
+            False, False, False,  # sums[i], sums[i - 1], squares[i]
+            False,  # weights[i], i in -2..2
+            True,  # weights[i] in a WHILE
+            True,  # squares[Square(2)]
+        ])
+        tree = Parser(
+            Lexer(self.program), analyzer=SemanticAnalyzer()
+        ).parse()
+        self.assertEqual(
+            [index.checked for index in self.indices(tree)], checked
+        )
+
+        text = """PROGRAM Test;
+                  VAR
+                     a : ARRAY[1..10] OF INTEGER;
+                     i : INTEGER;
+                  PROCEDURE P(n : INTEGER);
+                  BEGIN
+                  END;
+                  BEGIN
+                     FOR i := 1 TO 10 DO BEGIN P(i); a[i] := 1 END;
+                     FOR i := 0 TO 10 DO a[i + 1] := 1;
+                     FOR i := 0 TO 10 DO a[i] := 1;
+                     i := 5;
+                     a[i] := 1
+                  END.
+               """
+        # a call may assign the control variable, and the indices of the
+        # second and third loop aren't in the bounds for every i
+        self.assertEqual(
+            [index.checked for index in self.indices(analyze(text))],
+            [True, True, True, True],
+        )
+
+        # a nested FOR on the control variable would take it out of the
+        # bounds the outer loop's indices are checked against
+        text = """PROGRAM Test;
+                  VAR
+                     a : ARRAY[5..7] OF INTEGER;
+                     i : INTEGER;
+                  BEGIN
+                     FOR i := 5 TO 7 DO
+                     BEGIN
+                        FOR i := 1 TO 2 DO ;
+                        a[i] := 99
+                     END
+                  END.
+               """
+        with self.assertRaises(SemanticError) as cm:
+            analyze(text)
+        self.assertEqual(
+            cm.exception.error_code, ErrorCode.FOR_VAR_ASSIGNED
+        )
+
+    def test_bounds_checks_after_optimization(self):
+        from calc16 import optimize
+        text = """PROGRAM Test;
+                  VAR
+                     a : ARRAY[1..10] OF INTEGER;
+                     i : INTEGER;
+                  BEGIN
+                     i := 5;
+                     a[i] := 1;
+                     a[2 * 5] := a[i - 4]
+                  END.
+               """
+        tree = optimize(analyze(text))
+        self.assertEqual(
+            [index.checked for index in self.indices(tree)],
+            [False, False, False],
+        )
+
+    def test_index_out_of_range(self):
+        text = """PROGRAM Test;
+                  VAR
+                     a : ARRAY[1..10] OF INTEGER;
+                     i : INTEGER;
+                  BEGIN
+                     i := 0;
+                     WHILE i < 11 DO
+                     BEGIN
+                        i := i + 1;
+                        %s
+                     END
+                  END.
+               """
+        for statement in ('a[i] := i', 'a[1] := a[i]'):
+            for name, interpreter in self.engines(text % statement):
+                with self.subTest(statement=statement, engine=name):
+                    with self.assertRaises(IndexError):
+                        interpreter.interpret()
+                    self.assertEqual(interpreter.GLOBAL_MEMORY['i'], 11)
+
+    def test_semantic_errors(self):
+        from calc16 import ErrorCode, Lexer, Parser, SemanticAnalyzer
+        from calc16 import SemanticError
+        for statement, error_code in (
+            ('a := 1', ErrorCode.TYPE_MISMATCH),
+            ('b := a', ErrorCode.TYPE_MISMATCH),
+            ('b := b[1]', ErrorCode.TYPE_MISMATCH),
+            ('a[x] := 1', ErrorCode.TYPE_MISMATCH),
+            ('a[1 < 2] := 1', ErrorCode.TYPE_MISMATCH),
+            ('a[1] := x', ErrorCode.TYPE_MISMATCH),
+            ('FOR a := 1 TO 2 DO b := 1', ErrorCode.TYPE_MISMATCH),
+            ('a[11] := 1', ErrorCode.INDEX_OUT_OF_RANGE),
+            ('b := a[-1]', ErrorCode.INDEX_OUT_OF_RANGE),
+            ('b := c[1]', ErrorCode.EMPTY_ARRAY),
+        ):
+            text = """PROGRAM Test;
+                      VAR
+                         a : ARRAY[0..10] OF INTEGER;
+                         b : INTEGER;
+                         x : REAL;
+                         %s
+                      BEGIN
+                         %s
+                      END.
+                   """ % (
+                'c : ARRAY[2..1] OF INTEGER;'
+                if error_code == ErrorCode.EMPTY_ARRAY else '',
+                statement,
+            )
+            with self.subTest(statement=statement):
+                with self.assertRaises(SemanticError) as cm:
+                    analyze(text)
+                self.assertEqual(cm.exception.error_code, error_code)
+                with self.assertRaises(SemanticError) as cm:
+                    Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+                self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_procedures_with_arrays_are_not_inlined(self):
+        from calc16 import ProcedureInliner
+        inliner = ProcedureInliner()
+        inliner.visit(analyze(self.program))
+        self.assertIn('Negate: 1 of 1 calls inlined', inliner.report)
+        self.assertIn(
+            'Fill: 0 of 1 calls inlined, it declares arrays', inliner.report
+        )
+
+    def test_buffers(self):
+        from calc16 import Interpreter, array_buffers
+        interpreter = Interpreter(analyze(self.program))
+        interpreter.interpret()
+        memory = interpreter.GLOBAL_MEMORY
+        buffers = array_buffers(memory)
+        self.assertEqual(set(buffers), {'squares', 'sums', 'weights'})
+        view = buffers['sums']
+        self.assertEqual(view.format, 'q')
+        self.assertEqual(view.nbytes, 11 * 8)
+        self.assertEqual(buffers['weights'].format, 'd')
+        # the views share the arrays' memory
+        self.assertIs(view.obj, memory['sums'])
+        memory['sums'][1] = 42
+        self.assertEqual(view[1], 42)
+
+    def test_unsupported_engines(self):
+        from calc16 import (
+            CompilerError,
+            ErrorCode,
+            Lexer,
+            ParserError,
+            PyCodeInterpreter,
+            RegisterInterpreter,
+            StreamingParser,
+            VMInterpreter,
+        )
+        text = """PROGRAM Test;
+                  VAR
+                     a : ARRAY[1..10] OF INTEGER;
+                  BEGIN
+                     a[1] := 1
+                  END.
+               """
+        for engine in (PyCodeInterpreter, VMInterpreter, RegisterInterpreter):
+            with self.subTest(engine=engine.__name__):
+                with self.assertRaises(CompilerError) as cm:
+                    engine(analyze(text))
+                self.assertEqual(
+                    cm.exception.error_code, ErrorCode.UNSUPPORTED
+                )
+        with self.assertRaises(ParserError):
+            StreamingParser(Lexer(text)).parse()
+
+
+class BuiltinTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Builtins;
+VAR
+   a, b     : ARRAY[1..5] OF INTEGER;
+   r        : ARRAY[0..4] OF REAL;
+   big      : ARRAY[1..4] OF INTEGER;
+   i, s, d  : INTEGER;
+   x, y     : REAL;
+
+FUNCTION Total(n : INTEGER) : INTEGER;
+VAR
+   local : ARRAY[1..3] OF INTEGER;
+BEGIN
+   FILL(local, n);
+   Total := SUM(local)
+END;
+
+BEGIN
+   FOR i := 1 TO 5 DO a[i] := i;
+   COPY(b, a);
+   SCALE(b, 3);
+   s := SUM(b);
+   d := DOT(a, b);
+   COPY(r, a);
+   SCALE(r, 0.5);
+   x := SUM(r);
+   y := DOT(r, a);
+   i := Total(4) + Total(4);
+   FILL(a, 0);
+   { the sums of these don't fit in 64 bits }
+   FILL(big, 4611686018427387904);
+   s := s + SUM(big) + DOT(big, big)
+END.
+"""
+
+    def results(self):
+        from array import array
+        return {
+            'a': array('q', [0] * 5),
+            'b': array('q', [3, 6, 9, 12, 15]),
+            'r': array('d', [0.5, 1.0, 1.5, 2.0, 2.5]),
+            'big': array('q', [2 ** 62] * 4),
+            'i': 24,
+            's': 45 + 2 ** 64 + 2 ** 126,
+            'd': 165,
+            'x': 7.5,
+            'y': 27.5,
+        }
+
+    def engines(self, text):
+        from calc16 import (
+            ClosureInterpreter,
+            Interpreter,
+            Lexer,
+            Parser,
+            SemanticAnalyzer,
+            optimize,
+        )
+        yield 'tree', Interpreter(analyze(text))
+        yield 'optimized', Interpreter(optimize(analyze(text)))
+        yield 'single pass', Interpreter(
+            Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+        )
+        yield 'closure', ClosureInterpreter(analyze(text))
+        yield 'optimized closure', ClosureInterpreter(optimize(analyze(text)))
+
+    def implementations(self):
+        """Yield the name of each implementation of the builtins as it
+        is in place."""
+        import calc16
+        if calc16.np is not None:
+            yield 'numpy'
+        with mock.patch.object(calc16, 'np', None):
+            yield 'stdlib'
+
+    def test_builtins(self):
+        for implementation in self.implementations():
+            for name, interpreter in self.engines(self.program):
+                with self.subTest(implementation=implementation, engine=name):
+                    interpreter.interpret()
+                    self.assertEqual(
+                        dict(interpreter.GLOBAL_MEMORY), self.results()
+                    )
+
+    def test_pure_functions(self):
+        from calc16 import Interpreter, mark_pure_functions
+        tree = analyze(self.program)
+        # Total's builtins work on its own array only
+        self.assertEqual(
+            [function.proc_name for function in mark_pure_functions(tree)],
+            ['Total'],
+        )
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(interpreter.memo_hits, 1)
+
+    def test_mod_sets(self):
+        from calc16 import compute_mod_sets, compute_ref_sets
+        text = """PROGRAM Test;
+                  VAR
+                     a, b : ARRAY[1..3] OF INTEGER;
+                     n    : INTEGER;
+                  PROCEDURE P;
+                  BEGIN
+                     COPY(a, b);
+                     n := SUM(a)
+                  END;
+                  BEGIN
+                     P()
+                  END.
+               """
+        tree = analyze(text)
+        proc_symbol = tree.block.declarations[-1].proc_symbol
+        self.assertEqual(compute_mod_sets(tree)[proc_symbol], {'a', 'n'})
+        self.assertEqual(compute_ref_sets(tree)[proc_symbol], {'a', 'b'})
+
+    def test_overflow(self):
+        text = """PROGRAM Test;
+                  VAR
+                     a : ARRAY[1..3] OF INTEGER;
+                  BEGIN
+                     FILL(a, 4611686018427387904);
+                     SCALE(a, 2)
+                  END.
+               """
+        for implementation in self.implementations():
+            for name, interpreter in self.engines(text):
+                with self.subTest(implementation=implementation, engine=name):
+                    with self.assertRaises(OverflowError):
+                        interpreter.interpret()
+
+    def test_declarations_hide_builtins(self):
+        text = """PROGRAM Test;
+                  VAR
+                     SUM : INTEGER;
+                  PROCEDURE FILL(n : INTEGER);
+                  BEGIN
+                     SUM := n
+                  END;
+                  BEGIN
+                     FILL(7)
+                  END.
+               """
+        for name, interpreter in self.engines(text):
+            with self.subTest(engine=name):
+                interpreter.interpret()
+                self.assertEqual(interpreter.GLOBAL_MEMORY, {'SUM': 7})
+
+    def test_semantic_errors(self):
+        from calc16 import ErrorCode, Lexer, Parser, SemanticAnalyzer
+        from calc16 import SemanticError
+        for statement, error_code in (
+            ('n := SUM(n)', ErrorCode.TYPE_MISMATCH),
+            ('n := SUM(a[1])', ErrorCode.TYPE_MISMATCH),
+            ('n := DOT(a, c)', ErrorCode.TYPE_MISMATCH),
+            ('n := DOT(a, r)', ErrorCode.TYPE_MISMATCH),
+            ('COPY(a, r)', ErrorCode.TYPE_MISMATCH),
+            ('FILL(a, 1.5)', ErrorCode.TYPE_MISMATCH),
+            ('SCALE(a, n < 1)', ErrorCode.TYPE_MISMATCH),
+            ('n := FILL(a, 1)', ErrorCode.TYPE_MISMATCH),
+            ('SUM(a)', ErrorCode.TYPE_MISMATCH),
+            ('n := SUM(a, a)', ErrorCode.WRONG_PARAMS_NUM),
+            ('FILL(a)', ErrorCode.WRONG_PARAMS_NUM),
+        ):
+            text = """PROGRAM Test;
+                      VAR
+                         a : ARRAY[1..3] OF INTEGER;
+                         c : ARRAY[1..4] OF INTEGER;
+                         r : ARRAY[1..3] OF REAL;
+                         n : INTEGER;
+                      BEGIN
+                         %s
+                      END.
+                   """ % statement
+            with self.subTest(statement=statement):
+                with self.assertRaises(SemanticError) as cm:
+                    analyze(text)
+                self.assertEqual(cm.exception.error_code, error_code)
+                with self.assertRaises(SemanticError) as cm:
+                    Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+                self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_same_results_as_loops(self):
+        from bench import generate_intrinsic_program
+        for builtin in ('SUM', 'DOT', 'FILL', 'COPY', 'SCALE'):
+            for name, interpreter in self.engines(
+                    generate_intrinsic_program(builtin, 100)):
+                with self.subTest(builtin=builtin, engine=name):
+                    interpreter.interpret()
+                    memory = interpreter.GLOBAL_MEMORY
+                    self.assertEqual(memory['a'], memory['b'])
+                    self.assertEqual(memory['s'], memory['t'])
+
+
+class OutputTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Output;
+VAR
+   i : INTEGER;
+   x : REAL;
+
+FUNCTION Square(n : INTEGER) : INTEGER;
+BEGIN
+   WRITELN(n);
+   Square := n * n
+END;
+
+BEGIN
+   x := 0.5;
+   FOR i := 1 TO 3 DO WRITELN(i, x * i, i > 1);
+   WRITE(Square(2));
+   WRITE();
+   WRITELN(Square(2), 7 DIV 2);
+   WRITELN()
+END.
+"""
+    output = '1 0.5 FALSE\n2 1.0 TRUE\n3 1.5 TRUE\n2\n42\n4 3\n\n'
+
+    def engines(self, text, output):
+        from calc16 import (
+            ClosureInterpreter,
+            Interpreter,
+            Lexer,
+            Parser,
+            SemanticAnalyzer,
+            optimize,
+        )
+        yield 'tree', Interpreter(analyze(text), output=output)
+        yield 'optimized', Interpreter(
+            optimize(analyze(text)), output=output
+        )
+        yield 'single pass', Interpreter(
+            Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse(),
+            output=output,
+        )
+        yield 'closure', ClosureInterpreter(analyze(text), output=output)
+        yield 'optimized closure', ClosureInterpreter(
+            optimize(analyze(text)), output=output
+        )
+
+    def test_output(self):
+        import io
+        from calc16 import OutputBuffer
+        sink = io.StringIO()
+        for name, interpreter in self.engines(
+                self.program, OutputBuffer(sink)):
+            with self.subTest(engine=name):
+                sink.seek(0)
+                sink.truncate()
+                interpreter.interpret()
+                self.assertEqual(sink.getvalue(), self.output)
+
+    def test_stdout(self):
+        import contextlib
+        import io
+        from calc16 import Interpreter
+        interpreter = Interpreter(analyze(self.program))
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            interpreter.interpret()
+        self.assertEqual(stdout.getvalue(), self.output)
+
+    def test_writes_are_not_pure(self):
+        from calc16 import Interpreter, mark_pure_functions
+        tree = analyze(self.program)
+        self.assertEqual(mark_pure_functions(tree), [])
+        interpreter = Interpreter(tree)
+        with mock.patch('sys.stdout'):
+            interpreter.interpret()
+        self.assertEqual(interpreter.memo_hits, 0)
+
+    def test_flush_points(self):
+        from calc16 import OutputBuffer
+        sink = mock.Mock()
+        text = """PROGRAM Test;
+                  VAR
+                     i : INTEGER;
+                  BEGIN
+                     FOR i := 1 TO 10 DO WRITELN(i);
+                     FLUSH();
+                     WRITELN(1 DIV (i - 10))
+                  END.
+               """
+        for name, interpreter in self.engines(
+                text, OutputBuffer(sink, capacity=8)):
+            with self.subTest(engine=name):
+                sink.reset_mock()
+                with self.assertRaises(ZeroDivisionError):
+                    interpreter.interpret()
+                # full buffers, then FLUSH and the end of the program
+                self.assertEqual(
+                    [call.args[0] for call in sink.write.call_args_list],
+                    ['1\n2\n3\n4\n', '5\n6\n7\n8\n', '9\n10\n'],
+                )
+                self.assertEqual(sink.flush.call_count, 2)
+
+    def test_semantic_errors(self):
+        from calc16 import ErrorCode, Lexer, Parser, SemanticAnalyzer
+        from calc16 import SemanticError
+        for statement, error_code in (
+            ('WRITELN(a)', ErrorCode.TYPE_MISMATCH),
+            ('WRITE(n, a)', ErrorCode.TYPE_MISMATCH),
+            ('n := WRITELN(n)', ErrorCode.TYPE_MISMATCH),
+            ('FLUSH(n)', ErrorCode.WRONG_PARAMS_NUM),
+        ):
+            text = """PROGRAM Test;
+                      VAR
+                         a : ARRAY[1..3] OF INTEGER;
+                         n : INTEGER;
+                      BEGIN
+                         %s
+                      END.
+                   """ % statement
+            with self.subTest(statement=statement):
+                with self.assertRaises(SemanticError) as cm:
+                    analyze(text)
+                self.assertEqual(cm.exception.error_code, error_code)
+                with self.assertRaises(SemanticError) as cm:
+                    Parser(Lexer(text), analyzer=SemanticAnalyzer()).parse()
+                self.assertEqual(cm.exception.error_code, error_code)
+
+    def test_unsupported_backends(self):
+        from calc16 import (
+            CompilerError,
+            ErrorCode,
+            Lexer,
+            ParserError,
+            PyCodeInterpreter,
+            StreamingParser,
+        )
+        text = """PROGRAM Test;
+                  BEGIN
+                     WRITELN(1)
+                  END.
+               """
+        with self.assertRaises(CompilerError) as cm:
+            PyCodeInterpreter(analyze(text))
+        self.assertEqual(cm.exception.error_code, ErrorCode.UNSUPPORTED)
+        with self.assertRaises(ParserError) as cm:
+            StreamingParser(Lexer(text)).parse()
+        self.assertEqual(cm.exception.error_code, ErrorCode.UNSUPPORTED)
+
+
+class ProcedureInlinerTestCase(unittest.TestCase):
+    program = """\
+PROGRAM Inline;
+VAR
+   a, b : INTEGER;
+   y    : REAL;
+
+PROCEDURE Alpha(a : INTEGER; c : REAL);
+VAR
+   x : INTEGER;
+BEGIN
+   x := a * 2;
+   b := x + a;
+   y := c / 2
+END;
+
+PROCEDURE Beta(n : INTEGER);
+BEGIN
+   Alpha(n + 1, y)
+END;
+
+BEGIN
+   a := 5;
+   Alpha(a + 1, 3);
+   Beta(b)
+END.
+"""
+
+    def inline(self, text, **thresholds):
+        from calc16 import ProcedureInliner
+        tree = analyze(text)
+        inliner = ProcedureInliner(**thresholds)
+        inliner.visit(tree)
+        return tree, inliner
+
+    def test_calls_replaced_by_bodies(self):
+        from calc16 import Assign, ProcedureCall, TempDecl
+        tree, inliner = self.inline(self.program)
+        self.assertEqual(inliner.inlined, 3)
+        self.assertEqual(inliner.report, [
+            'Alpha: 2 of 2 calls inlined',
+            'Beta: 1 of 1 calls inlined',
+        ])
+        statements = tree.block.compound_statement.children
+        self.assertFalse(
+            any(isinstance(s, ProcedureCall) for s in statements)
+        )
+        # a := 5, then a_3 := a + 1; c_4 := 3; x_5 := a_3 * 2; ...
+        # (a_0, c_1 and x_2 are Beta's)
+        self.assertEqual(
+            [(s.left.value, s.right.__class__.__name__)
+             for s in statements[1:6]],
+            [('a_3', 'BinOp'), ('c_4', 'Num'), ('x_5', 'BinOp'),
+             ('b', 'BinOp'), ('y', 'BinOp')],
+        )
+        self.assertTrue(all(isinstance(s, Assign) for s in statements))
+        # the parameter a of Alpha isn't the global a
+        self.assertEqual(statements[4].right.left.value, 'x_5')
+        self.assertEqual(statements[4].right.right.value, 'a_3')
+        temp_decls = [
+            (d.var_node.value, d.type_node.value)
+            for d in tree.block.declarations if isinstance(d, TempDecl)
+        ]
+        # Beta's fresh variables get fresh names again with Beta's body
+        self.assertEqual(temp_decls, [
+            ('a_3', 'INTEGER'), ('c_4', 'REAL'), ('x_5', 'INTEGER'),
+            ('n_6', 'INTEGER'),
+            ('a_7', 'INTEGER'), ('c_8', 'REAL'), ('x_9', 'INTEGER'),
+        ])
+
+    def test_same_results_in_every_engine(self):
+        from bench import ENGINES
+        from calc16 import Interpreter
+        expected = Interpreter(analyze(self.program))
+        expected.interpret()
+        self.assertEqual(
+            expected.GLOBAL_MEMORY, {'a': 5, 'b': 57, 'y': 0.75}
+        )
+        # without calls left, the virtual machines run the program too
+        for name, engine in ENGINES.items():
+            with self.subTest(engine=name):
+                tree, _ = self.inline(self.program)
+                interpreter = engine(tree)
+                interpreter.interpret()
+                self.assertEqual(
+                    interpreter.GLOBAL_MEMORY, expected.GLOBAL_MEMORY
+                )
+
+    def test_size_thresholds(self):
+        from calc16 import ProcedureCall
+        tree, inliner = self.inline(self.program, max_size=10)
+        self.assertEqual(inliner.inlined, 0)
+        self.assertEqual(inliner.report, [
+            'Alpha: 0 of 2 calls inlined, 16 nodes > 10',
+            'Beta: 0 of 1 calls inlined, it makes calls',
+        ])
+        # Alpha is inlined in Beta, after which the program can grow by
+        # 4 nodes only
+        tree, inliner = self.inline(self.program, max_growth=20)
+        self.assertEqual(inliner.inlined, 1)
+        self.assertEqual(inliner.growth, 16)
+        self.assertEqual(inliner.report, [
+            'Alpha: 1 of 2 calls inlined, the program grew too big',
+            'Beta: 0 of 1 calls inlined, the program grew too big',
+        ])
+        statements = tree.block.compound_statement.children
+        self.assertIsInstance(statements[1], ProcedureCall)
+        self.assertIsInstance(statements[2], ProcedureCall)
+
+    def test_names_denoting_other_variables(self):
+        from calc16 import Interpreter
+        text = ProcedureCallTestCase.program
+        tree, inliner = self.inline(text)
+        # Add's n is Outer's parameter, but Twice's local n at the call
+        # in Again
+        self.assertIn(
+            "Add: 0 of 2 calls inlined, 'n' is another variable at the call",
+            inliner.report,
+        )
+        self.assertIn('Store: 1 of 1 calls inlined', inliner.report)
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        expected = Interpreter(analyze(text))
+        expected.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, expected.GLOBAL_MEMORY)
+
+    def test_locals_read_before_assigned(self):
+        from calc16 import Interpreter
+        text = """PROGRAM Test;
+                  VAR
+                     a : INTEGER;
+                  PROCEDURE Maybe(n : INTEGER);
+                  VAR
+                     c : INTEGER;
+                  BEGIN
+                     IF n > 0 THEN c := n;
+                     a := c + 1
+                  END;
+                  PROCEDURE Always(n : INTEGER);
+                  VAR
+                     c, i : INTEGER;
+                  BEGIN
+                     IF n > 0 THEN c := n ELSE c := 0;
+                     FOR i := 1 TO n DO c := c + i;
+                     a := a + c
+                  END;
+                  BEGIN
+                     a := 0;
+                     Always(2);
+                     Maybe(1);
+                     Maybe(0)
+                  END.
+               """
+        tree, inliner = self.inline(text)
+        self.assertEqual(inliner.report, [
+            'Always: 1 of 1 calls inlined',
+            "Maybe: 0 of 2 calls inlined, it may read 'c' before "
+            "assigning it",
+        ])
+        # c is undefined again in the second call of Maybe
+        for tree in (analyze(text), tree):
+            with self.assertRaises(TypeError):
+                Interpreter(tree).interpret()
+
+    def test_recursive_procedure(self):
+        tree, inliner = self.inline(
+            """PROGRAM Test;
+               VAR
+                  a : INTEGER;
+               PROCEDURE R(n : INTEGER);
+               BEGIN
+                  a := n;
+                  R(n - 1)
+               END;
+               BEGIN
+                  R(3)
+               END.
+            """
+        )
+        self.assertEqual(inliner.inlined, 0)
+        self.assertEqual(
+            inliner.report, ['R: 0 of 1 calls inlined, it makes calls']
+        )
+
+    def test_optimize(self):
+        from calc16 import Interpreter, ProcedureInliner, TempDecl, optimize
+        stats = {}
+        tree = optimize(
+            analyze(self.program), stats, inliner=ProcedureInliner()
+        )
+        self.assertEqual(stats['calls inlined'], 3)
+        # the program reduces to constant stores to its own variables
+        self.assertEqual(
+            [(s.left.value, s.right.value)
+             for s in tree.block.compound_statement.children],
+            [('a', 5), ('b', 57), ('y', 0.75)],
+        )
+        self.assertFalse(any(
+            isinstance(d, TempDecl) for d in tree.block.declarations
+        ))
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY, {'a': 5, 'b': 57, 'y': 0.75}
+        )
+
+
+class ConstantFolderTestCase(unittest.TestCase):
+    def fold(self, expr, var_type='REAL'):
+        from calc16 import ConstantFolder
+        tree = analyze(
+            """PROGRAM Test;
+               VAR
+                  a : INTEGER;
+                  x : %s;
+               BEGIN
+                  a := 7;
+                  x := %s
+               END.
+            """ % (var_type, expr)
+        )
+        folder = ConstantFolder()
+        folder.visit(tree)
+        return tree.block.compound_statement.children[1].right, folder.folded
+
+    def test_fold_constant_expression(self):
+        from calc16 import Num, REAL_TYPE
+        node, folded = self.fold('10 * 4 DIV 2 + 3.14')
+        self.assertIsInstance(node, Num)
+        self.assertEqual(node.value, 23.14)
+        self.assertIs(node.type, REAL_TYPE)
+        self.assertEqual(folded, 3)
+
+    def test_fold_follows_pascal_semantics(self):
+        from calc16 import INTEGER_TYPE, REAL_TYPE
+        for expr, var_type, value, value_type in (
+            ('-7 DIV 2', 'INTEGER', -4, INTEGER_TYPE),
+            ('7 DIV -2', 'INTEGER', -4, INTEGER_TYPE),
+            ('4 / 2', 'REAL', 2.0, REAL_TYPE),
+            ('1 + 2.5', 'REAL', 3.5, REAL_TYPE),
+            ('- - 3', 'INTEGER', 3, INTEGER_TYPE),
+            ('-0.0', 'REAL', -0.0, REAL_TYPE),
+        ):
+            with self.subTest(expr=expr):
+                node, _ = self.fold(expr, var_type)
+                self.assertEqual(node.value, value)
+                self.assertIs(type(node.value), type(value))
+                self.assertIs(node.type, value_type)
+
+    def test_fold_keeps_variables(self):
+        from calc16 import BinOp, Num, Var
+        node, folded = self.fold('a * (2 + 3) - 1 / 4')
+        self.assertEqual(folded, 2)
+        self.assertIsInstance(node, BinOp)
+        self.assertIsInstance(node.left.left, Var)
+        self.assertEqual(node.left.right.value, 5)
+        self.assertEqual(node.right.value, 0.25)
+        self.assertIsInstance(node.right, Num)
+
+    def test_division_by_constant_zero(self):
+        from calc16 import SemanticError, ErrorCode
+        for expr, column in (('10 DIV (3 - 3)', 27), ('a / 0.0', 26)):
+            with self.subTest(expr=expr):
+                with self.assertRaises(SemanticError) as cm:
+                    self.fold(expr)
+                the_exception = cm.exception
+                self.assertEqual(
+                    the_exception.error_code, ErrorCode.DIVISION_BY_ZERO
+                )
+                self.assertEqual(the_exception.token.lineno, 7)
+                self.assertEqual(the_exception.token.column, column)
+
+    def test_division_by_variable(self):
+        node, folded = self.fold('1 / (a - a + 0)')
+        self.assertEqual(folded, 0)
+
+
+class ConstantPropagatorTestCase(unittest.TestCase):
+    program = """
+        PROGRAM Test;
+        VAR
+           number, a, b, c : INTEGER;
+           y               : REAL;
+
+        PROCEDURE SetA(n : INTEGER);
+        VAR
+           b : INTEGER;
+           PROCEDURE Inner;
+           BEGIN
+              a := n;
+              b := n
+           END;
+        BEGIN
+           b := 1;
+           Inner();
+           c := b + n
+        END;
+
+        PROCEDURE Nothing;
+        BEGIN
+        END;
+
+        BEGIN
+           number := 2;
+           a := number;
+           b := 10 * a + 10 * number DIV 4;
+           c := b;
+           SetA(a + 1);
+           Nothing();
+           y := 20 / 7 + a + b;
+           b := c
+        END.
+    """
+
+    def propagate(self, text):
+        from calc16 import ConstantPropagator, compute_mod_sets
+        tree = analyze(text)
+        propagator = ConstantPropagator(compute_mod_sets(tree))
+        propagator.visit(tree)
+        return tree, propagator
+
+    def statements(self, block):
+        from calc16 import Num
+        return [
+            (node.left.value, node.right.value)
+            if isinstance(node.right, Num) else (node.left.value, None)
+            for node in block.compound_statement.children
+            if hasattr(node, 'left')
+        ]
+
+    def test_mod_sets(self):
+        from calc16 import compute_mod_sets
+        tree = analyze(self.program)
+        mod_sets = {
+            proc_symbol.name: mod_set
+            for proc_symbol, mod_set in compute_mod_sets(tree).items()
+        }
+        # the b assigned by SetA and Inner is SetA's local variable
+        self.assertEqual(
+            mod_sets,
+            {'SetA': {'a', 'c'}, 'Inner': {'a', 'b'}, 'Nothing': set()},
+        )
+
+    def test_propagate_constants(self):
+        tree, propagator = self.propagate(self.program)
+        self.assertEqual(
+            self.statements(tree.block),
+            [
+                ('number', 2),
+                ('a', 2),
+                ('b', 25),
+                ('c', 25),
+                # SetA assigns a and c but not the global b
+                ('y', None),
+                ('b', None),
+            ]
+        )
+        y = tree.block.compound_statement.children[6].right
+        self.assertEqual(y.right.value, 25)
+        self.assertEqual(propagator.loads_eliminated, 6)
+
+        set_a = tree.block.declarations[5].block_node
+        self.assertEqual(
+            self.statements(set_a), [('b', 1), ('c', None)]
+        )
+
+    def test_straight_line_program(self):
+        from calc16 import Interpreter, Num
+        tree, _ = self.propagate(
+            """PROGRAM Test;
+               VAR
+                  number, a, b, c, x : INTEGER;
+                  y                  : REAL;
+               BEGIN
+                  BEGIN
+                     number := 2;
+                     a := number;
+                     b := 10 * a + 10 * number DIV 4;
+                     c := a - - b
+                  END;
+                  x := 11;
+                  y := 20 / 7 + 3.14 * x;
+                  x := x DIV -2
+               END.
+            """
+        )
+        statements = tree.block.compound_statement.children
+        self.assertTrue(all(
+            isinstance(node.right, Num)
+            for node in statements[0].children + statements[1:]
+        ))
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(
+            interpreter.GLOBAL_MEMORY,
+            {'number': 2, 'a': 2, 'b': 25, 'c': 27, 'x': -6,
+             'y': 20 / 7 + 3.14 * 11},
+        )
+
+    def test_callee_assigns_shadowed_global(self):
+        # the x Q assigns is the global x, not P's local x
+        from calc16 import Interpreter, compute_mod_sets
+        text = """PROGRAM Test;
+                  VAR
+                     x, y : INTEGER;
+                  PROCEDURE Q;
+                  BEGIN
+                     x := 5
+                  END;
+                  PROCEDURE P;
+                  VAR
+                     x : INTEGER;
+                  BEGIN
+                     Q()
+                  END;
+                  BEGIN
+                     x := 1;
+                     P();
+                     y := x
+                  END.
+               """
+        tree = analyze(text)
+        mod_sets = {
+            proc_symbol.name: mod_set
+            for proc_symbol, mod_set in compute_mod_sets(tree).items()
+        }
+        self.assertEqual(mod_sets, {'Q': {'x'}, 'P': {'x'}})
+        tree, _ = self.propagate(text)
+        self.assertEqual(self.statements(tree.block)[-1], ('y', None))
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, {'x': 5, 'y': 5})
+
+    def test_unknown_callee(self):
+        # a call through a symbol without a declaration in the tree, like
+        # the copies made by the workers of the parallel analysis, may
+        # assign any variable
+        from calc16 import ConstantPropagator, compute_mod_sets
+        tree = analyze(self.program)
+        call = tree.block.compound_statement.children[5]
+        self.assertEqual(call.proc_name, 'Nothing')
+        call.proc_symbol = copy.copy(call.proc_symbol)
+        ConstantPropagator(compute_mod_sets(tree)).visit(tree)
+        self.assertEqual(
+            self.statements(tree.block)[-2:], [('y', None), ('b', None)]
+        )
+        y = tree.block.compound_statement.children[6].right
+        self.assertEqual(type(y.right).__name__, 'Var')
+
+    def test_procedure_symbols_of_parallel_analysis(self):
+        from concurrent.futures import ProcessPoolExecutor
+        from calc16 import Lexer, Parser, SemanticAnalyzer
+        tree = Parser(Lexer(self.program)).parse()
+        with ProcessPoolExecutor(2) as executor:
+            SemanticAnalyzer(executor, batch_size=1).visit(tree)
+        calls = tree.block.compound_statement.children[4:6]
+        decls = tree.block.declarations[5:]
+        for call, decl in zip(calls, decls):
+            self.assertIs(call.proc_symbol, decl.proc_symbol)
+
+
+class DeadStoreEliminatorTestCase(unittest.TestCase):
+    program = """
+        PROGRAM Test;
+        VAR
+           a, b, c : INTEGER;
+
+        PROCEDURE ReadA(n : INTEGER);
+        VAR
+           x, unused : INTEGER;
+           y         : REAL;
+           PROCEDURE Inner();
+           BEGIN
+              y := x / 2
+           END;
+        BEGIN
+           x := n;
+           x := a + n;
+           Inner();
+           y := x;
+           c := x
+        END;
+
+        PROCEDURE Other();
+        VAR
+           z : INTEGER;
+        BEGIN
+           z := 1
+        END;
+
+        BEGIN
+           a := 1;
+           b := 2;
+           c := a;
+           Other();
+           b := b + 1;
+           a := 5;
+           ReadA(b);
+           a := 6;
+           c := 10 DIV b;
+           c := 7
+        END.
+    """
+
+    def eliminate(self, text, observable=None):
+        from calc16 import (
+            DeadStoreEliminator, ProcedureEffectsCollector, compute_ref_sets,
+        )
+        tree = analyze(text)
+        collector = ProcedureEffectsCollector()
+        collector.visit(tree)
+        eliminator = DeadStoreEliminator(
+            compute_ref_sets(tree), collector.names, observable
+        )
+        eliminator.visit(tree)
+        return tree, eliminator
+
+    def statements(self, block):
+        return [
+            (node.left.value, node.right)
+            if hasattr(node, 'left') else node.proc_name
+            for node in block.compound_statement.children
+        ]
+
+    def test_eliminate_dead_stores(self):
+        tree, eliminator = self.eliminate(self.program)
+        statements = self.statements(tree.block)
+        self.assertEqual(
+            [s if isinstance(s, str) else s[0] for s in statements],
+            # b := 2 is read by b := b + 1, a := 5 by ReadA and
+            # c := 10 DIV b may fail
+            ['b', 'Other', 'b', 'a', 'ReadA', 'a', 'c', 'c'],
+        )
+        self.assertEqual(statements[3][1].value, 5)
+
+        read_a = tree.block.declarations[3]
+        self.assertEqual(
+            [s if isinstance(s, str) else s[0]
+             for s in self.statements(read_a.block_node)],
+            ['x', 'Inner', 'c'],
+        )
+        other = tree.block.declarations[4]
+        self.assertEqual(
+            [type(node).__name__
+             for node in other.block_node.compound_statement.children],
+            ['NoOp'],
+        )
+        self.assertEqual(eliminator.stores_eliminated, 5)
+
+    def test_callee_reads_shadowed_global(self):
+        # the x Q reads is the global x, so x := 7 is live across P()
+        from calc16 import Interpreter, optimize
+        text = """PROGRAM Test;
+                  VAR
+                     x, y : INTEGER;
+                  PROCEDURE Q;
+                  BEGIN
+                     y := x
+                  END;
+                  PROCEDURE P;
+                  VAR
+                     x : INTEGER;
+                  BEGIN
+                     x := 3;
+                     Q()
+                  END;
+                  BEGIN
+                     x := 7;
+                     P();
+                     x := 0
+                  END.
+               """
+        tree, _ = self.eliminate(text)
+        self.assertEqual(
+            [s if isinstance(s, str) else s[0]
+             for s in self.statements(tree.block)],
+            ['x', 'P', 'x'],
+        )
+        interpreter = Interpreter(optimize(analyze(text)))
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY, {'x': 0, 'y': 7})
+
+    def test_eliminate_unused_declarations(self):
+        tree, eliminator = self.eliminate(self.program)
+        read_a = tree.block.declarations[3].block_node
+        self.assertEqual(
+            [declaration.var_node.value
+             for declaration in read_a.declarations
+             if hasattr(declaration, 'var_node')],
+            # Inner assigns y
+            ['x', 'y'],
+        )
+        other = tree.block.declarations[4].block_node
+        self.assertEqual(other.declarations, [])
+        self.assertEqual(eliminator.declarations_eliminated, 2)
+        # the global variables are all kept
+        self.assertEqual(len(tree.block.declarations), 5)
+
+    def test_observable_variables(self):
+        from calc16 import Interpreter
+        tree, _ = self.eliminate(
+            """PROGRAM Test;
+               VAR
+                  a, b, c : INTEGER;
+               BEGIN
+                  a := 1;
+                  b := a + 1;
+                  c := b * 2;
+                  a := 4
+               END.
+            """,
+            observable=['c'],
+        )
+        self.assertEqual(
+            [name for name, _ in self.statements(tree.block)],
+            ['a', 'b', 'c'],
+        )
+        interpreter = Interpreter(tree)
+        interpreter.interpret()
+        self.assertEqual(interpreter.GLOBAL_MEMORY['c'], 4)
+        self.assertNotEqual(interpreter.GLOBAL_MEMORY['a'], 4)
+
+
+class CommonSubexpressionEliminatorTestCase(unittest.TestCase):
+    program = """
+        PROGRAM Test;
+        VAR
+           a, b, number, c, d : INTEGER;
+
+        PROCEDURE P();
+        BEGIN
+        END;
+
+        BEGIN
+           a := 3;
+           number := 5;
+           b := 2;
+           d := 10 * a + 10 * number DIV (a * b + 1);
+           c := a * b + 1 - -a;
+           d := a * b + 1 + -a;
+           a := a * b;
+           c := c + a * b;
+           P();
+           d := -a + a * b
+        END.
+    """
+
+    def eliminate(self, text, fold=False):
+        from calc16 import CommonSubexpressionEliminator, ConstantFolder
+        tree = analyze(text)
+        if fold:
+            ConstantFolder().visit(tree)
+        eliminator = CommonSubexpressionEliminator()
+        eliminator.visit(tree)
+        return tree, eliminator
+
+    def test_reuse_subexpressions(self):
+        from calc16 import TempLoad, TempStore
+        tree, eliminator = self.eliminate(self.program)
+        statements = tree.block.compound_statement.children
+        # a * b + 1 is computed once for d := ...
+        store = statements[3].right.right.right
+        self.assertIsInstance(store, TempStore)
+        self.assertEqual(store.expr.op.value, '+')
+        # ... and reused by c := and d :=, -a is computed once as well
+        self.assertIsInstance(statements[4].right.left, TempLoad)
+        self.assertEqual(statements[4].right.left.index, store.index)
+        self.assertIsInstance(statements[4].right.right, TempStore)
+        self.assertIsInstance(statements[5].right.left, TempLoad)
+        self.assertIsInstance(statements[5].right.right, TempLoad)
+        # the temporary of a * b (inside a * b + 1) is reused by a :=,
+        # after which a * b has a different value
+        self.assertIsInstance(store.expr.left, TempStore)
+        self.assertIsInstance(statements[6].right, TempLoad)
+        self.assertNotIsInstance(statements[7].right.right, TempLoad)
+        self.assertEqual(eliminator.eliminated, 4)
+        self.assertEqual(eliminator.temporaries, 3)
+
+    def test_procedure_call_ends_basic_block(self):
+        from calc16 import BinOp, UnaryOp
+        tree, _ = self.eliminate(self.program)
+        statements = tree.block.compound_statement.children
+        # a * b of c := c + a * b is the same as d := -a + a * b's but
+        # no temporary lives across P()
+        self.assertIsInstance(statements[9].right.left, UnaryOp)
+        self.assertIsInstance(statements[9].right.right, BinOp)
+
+    def test_signed_zero(self):
+        from calc16 import BinOp, TempLoad
+        tree, _ = self.eliminate(
+            """PROGRAM Test;
+               VAR
+                  x, y, z : REAL;
+               BEGIN
+                  x := -0.0;
+                  y := x - 0.0;
+                  z := x - -0.0;
+                  x := x - 0.0
+               END.
+            """,
+            fold=True,
+        )
+        statements = tree.block.compound_statement.children
+        self.assertIsInstance(statements[2].right, BinOp)
+        self.assertIsInstance(statements[3].right, TempLoad)
+
+    def test_same_results_in_every_engine(self):
+        from bench import ENGINES, generate_arithmetic_program
+        from calc16 import Interpreter
+        for text in [self.program] + [
+            generate_arithmetic_program(200, seed) for seed in range(3)
+        ]:
+            expected = Interpreter(analyze(text))
+            expected.interpret()
+            for name, engine in ENGINES.items():
+                with self.subTest(engine=name):
+                    tree, _ = self.eliminate(text)
+                    interpreter = engine(tree)
+                    interpreter.interpret()
+                    self.assertEqual(
+                        interpreter.GLOBAL_MEMORY, expected.GLOBAL_MEMORY
+                    )
+
+    def test_bytecode_temporaries(self):
+        from calc16 import Bytecode, VMInterpreter, VirtualMachine
+        tree, eliminator = self.eliminate(self.program)
+        interpreter = VMInterpreter(tree)
+        bytecode = interpreter.bytecode
+        self.assertEqual(bytecode.temporaries, eliminator.temporaries)
+        self.assertIn('DUP', bytecode.disassemble())
+        self.assertIn('($t0)', bytecode.disassemble())
+
+        interpreter.interpret()
+        vm = VirtualMachine(Bytecode.loads(bytecode.dumps()))
+        vm.interpret()
+        self.assertEqual(vm.GLOBAL_MEMORY, interpreter.GLOBAL_MEMORY)
+
+
+class AlgebraicSimplifierTestCase(unittest.TestCase):
+    expressions = (
+        'a + 0', '0 + a', 'a - 0', 'a * 1', '1 * a', 'a * 0', '0 * a',
+        'a DIV 1', '- -a', '+a', 'a * 8', '4 * a', 'a DIV 16',
+        '(a + 0) * 2 * 1 + 0 * (a - 1)', 'a DIV a * 0',
+        'y + 0', '0 + y', 'y - 0', 'y * 1', 'y * 0', '0 * y', 'y * 4',
+        '- -y', '+y', 'y * 1.0', 'y - 0.0', 'a * 0.0', 'a / 1',
+    )
+
+    def program(self, expressions):
+        assignments = ';\n'.join(
+            f'x{n} := {expr}' for n, expr in enumerate(expressions)
+        )
+        return """PROGRAM Test;
+                  VAR
+                     a : INTEGER;
+                     y : REAL;
+                     %s : REAL;
+                  BEGIN
+                     %s
+                  END.
+               """ % (
+            ', '.join(f'x{n}' for n in range(len(expressions))),
+            assignments,
+        )
+
+    def simplify(self, expressions):
+        from calc16 import AlgebraicSimplifier
+        tree = analyze(self.program(expressions))
+        simplifier = AlgebraicSimplifier()
+        simplifier.visit(tree)
+        return [
+            assignment.right
+            for assignment in tree.block.compound_statement.children
+        ], simplifier
+
+    def describe(self, node):
+        from calc16 import BinOp, Num, UnaryOp, Var
+        if isinstance(node, Var):
+            return node.value
+        if isinstance(node, Num):
+            return repr(node.value)
+        if isinstance(node, UnaryOp):
+            return '({}{})'.format(node.op.value, self.describe(node.expr))
+        if isinstance(node, BinOp):
+            return '({} {} {})'.format(
+                self.describe(node.left),
+                node.op.value,
+                self.describe(node.right),
+            )
+
+    def test_rewrites(self):
+        nodes, simplifier = self.simplify(self.expressions)
+        self.assertEqual(
+            [self.describe(node) for node in nodes],
+            [
+                'a', 'a', 'a', 'a', 'a', '0', '0',
+                'a', 'a', 'a', '(a SHL 3)', '(a SHL 2)', '(a SHR 4)',
+                '(a SHL 1)', '((a DIV a) * 0)',
+                # REAL
+                '(y + 0)', '(0 + y)', 'y', 'y', '(y * 0)', '(0 * y)',
+                '(y * 4)', 'y', 'y', '(y * 1.0)', '(y - 0.0)', '(a * 0.0)',
+                '(a / 1)',
+            ]
+        )
+        self.assertEqual(simplifier.simplified, 22)
+
+    def assertSameValues(self, expected, actual):
+        # compare NaN and signed zeros too
+        self.assertEqual(
+            {name: (type(value), repr(value))
+             for name, value in actual.items()},
+            {name: (type(value), repr(value))
+             for name, value in expected.items()},
+        )
+
+    def test_real_semantics_unchanged(self):
+        from calc16 import AlgebraicSimplifier, Interpreter
+        expressions = [
+            expr for expr in self.expressions if 'a DIV a' not in expr
+        ]
+        simplified_tree = analyze(self.program(expressions))
+        AlgebraicSimplifier().visit(simplified_tree)
+        tree = analyze(self.program(expressions))
+
+        inf, nan = float('inf'), float('nan')
+        for a in (-7, 0, 5):
+            # a REAL variable can hold an INTEGER value
+            for y in (nan, inf, -inf, -0.0, 0.0, 2.5, -3):
+                with self.subTest(a=a, y=y):
+                    memories = []
+                    for t in (tree, simplified_tree):
+                        interpreter = Interpreter(t)
+                        interpreter.set_global('a', a)
+                        interpreter.set_global('y', y)
+                        interpreter.interpret()
+                        memories.append(interpreter.GLOBAL_MEMORY)
+                    self.assertSameValues(*memories)
+
+    def test_operand_that_may_raise_is_kept(self):
+        from calc16 import AlgebraicSimplifier, Interpreter
+        tree = analyze(self.program(['a DIV a * 0']))
+        AlgebraicSimplifier().visit(tree)
+        interpreter = Interpreter(tree)
+        interpreter.set_global('a', 0)
+        with self.assertRaises(ZeroDivisionError):
+            interpreter.interpret()
+
+    def test_shifts_in_every_engine(self):
+        from bench import ENGINES
+        from calc16 import AlgebraicSimplifier, Interpreter
+        text = self.program(
+            ['a * 8 - a DIV 4', '-a DIV 2', '(a - 100) DIV 32 * 1024']
+        ).replace('BEGIN', 'BEGIN a := -37;')
+        expected = Interpreter(analyze(text))
+        expected.interpret()
+        for name, engine in ENGINES.items():
+            with self.subTest(engine=name):
+                tree = analyze(text)
+                simplifier = AlgebraicSimplifier()
+                simplifier.visit(tree)
+                self.assertEqual(simplifier.simplified, 5)
+                interpreter = engine(tree)
+                interpreter.interpret()
+                self.assertEqual(
+                    interpreter.GLOBAL_MEMORY, expected.GLOBAL_MEMORY
+                )
+
+
 if __name__ == '__main__':
     unittest.main()